@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Benchmark what sprinter costs every new terminal.
+
+Synthetic namespaces (each with a number of features adding env, rc
+and path entries) are installed into a temporary HOME with sprinter's
+own Directory and ActivationBundle, and `bash -ic exit` / `zsh -ic
+exit` are timed for each way of loading them:
+
+* baseline: no sprinter injections at all
+* legacy: one injection per namespace, with the awk/sed based utils
+* namespaces: one injection per namespace, with compiled env scripts
+* bundle: a single injection of the global activation bundle
+
+Everything is generated locally, so the benchmark runs offline.
+
+usage: python scripts/benchmark_shell_startup.py [options]
+
+  --namespaces N   namespaces to install (default 5)
+  --features N     features per namespace (default 5)
+  --runs N         shell starts to time per scenario (default 20)
+  --shells LIST    comma separated shells to time (default bash,zsh)
+  --output PATH    store the results as json
+  --compare PATH   compare against results stored with --output, and
+                   exit with 1 if a scenario regressed
+  --threshold N    relative slowdown counted as a regression (default 0.25)
+"""
+from __future__ import print_function, unicode_literals
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sprinter.core.bundle import ActivationBundle
+from sprinter.core.directory import Directory
+from sprinter.core.templates import shell_utils_template, source_template
+
+SCENARIOS = ["baseline", "legacy", "namespaces", "bundle"]
+SHELL_RC = {"bash": ".bashrc", "zsh": ".zshrc"}
+
+LEGACY_SHELL_UTILS = """
+__sprinter_prepend_path() {
+    local sp_dir="$1"
+    local sp_var="${2:-PATH}"
+    local sp_list=$(eval echo '$'$sp_var)
+    if [ -d "$sp_dir" ]; then
+        sp_list=`echo -n $sp_list | awk -v RS=: -v ORS=: '$0 != "'$sp_dir'"' | sed 's/:$//'`
+        export $sp_var="${sp_dir}${sp_list:+":$sp_list"}"
+    fi
+}
+"""
+
+
+def install_namespaces(home, namespaces, features, legacy=False):
+    """ install synthetic namespaces into home, returning the sprinter global path """
+    root = os.path.join(home, ".sprinter")
+    global_path = os.path.join(root, ".global")
+    os.makedirs(global_path)
+    utils_path = os.path.join(global_path, "utils.sh")
+    with io.open(utils_path, "w") as fh:
+        fh.write(LEGACY_SHELL_UTILS if legacy else shell_utils_template)
+    bundle = ActivationBundle(global_path)
+    for n in range(namespaces):
+        namespace = "namespace%d" % n
+        directory = Directory(os.path.join(root, namespace), shell_util_path=utils_path)
+        directory.initialize()
+        for f in range(features):
+            feature_bin = os.path.join(directory.install_directory("feature%d" % f), "bin")
+            os.makedirs(feature_bin)
+            directory.add_to_env("export %s_FEATURE%d_HOME=%s" % (namespace.upper(), f, feature_bin))
+            directory.add_to_env('__sprinter_prepend_path "%s" PATH' % feature_bin)
+            directory.add_to_rc("alias %s_feature%d='echo %d'" % (namespace, f, f))
+        # the same as Environment._finalize
+        directory.add_to_rc('')
+        directory.add_to_env('__sprinter_prepend_path "%s" PATH' % directory.bin_path())
+        directory.add_to_env('__sprinter_prepend_path "%s" LIBRARY_PATH' % directory.lib_path())
+        directory.add_to_env('__sprinter_prepend_path "%s" C_INCLUDE_PATH' % directory.include_path())
+        if legacy:
+            directory.rc_file.close()
+            directory.env_file.close()
+        else:
+            directory.finalize()
+        bundle.activate(namespace, directory.root_dir)
+    bundle.write()
+    return global_path
+
+
+def write_shell_rc(home, scenario, global_path):
+    """ write the rc files of every shell, injecting sprinter the way the scenario does """
+    content = ""
+    if scenario == "bundle":
+        bundle = ActivationBundle(global_path)
+        content = source_template % (bundle.rc_path, bundle.rc_path)
+    elif scenario in ("legacy", "namespaces"):
+        for namespace, root_dir in ActivationBundle(global_path).namespaces():
+            rc_path = os.path.join(root_dir, ".rc")
+            content += source_template % (rc_path, rc_path)
+    for rc in SHELL_RC.values():
+        with io.open(os.path.join(home, rc), "w") as fh:
+            fh.write(content)
+
+
+def time_shell(shell, home, runs):
+    """ return the timings (in seconds) of runs interactive shells starting and exiting """
+    env = {"HOME": home, "ZDOTDIR": home, "PATH": "/usr/local/bin:/usr/bin:/bin", "TERM": "dumb"}
+    timings = []
+    with open(os.devnull, "w") as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call([shell, "-ic", "exit"], env=env, stdout=devnull, stderr=devnull)
+            timings.append(time.time() - start)
+    return timings
+
+
+def count_forks(shell, home):
+    """
+    return the number of processes a shell start spawns, or None if it
+    can't be measured. This uses the fork counter in /proc/stat, which
+    is system wide, so the minimum of a few runs is used.
+    """
+    if not os.path.exists("/proc/stat"):
+        return None
+    env = {"HOME": home, "ZDOTDIR": home, "PATH": "/usr/local/bin:/usr/bin:/bin", "TERM": "dumb"}
+    counts = []
+    with open(os.devnull, "w") as devnull:
+        for _ in range(3):
+            before = _processes()
+            subprocess.check_call([shell, "-ic", "exit"], env=env, stdout=devnull, stderr=devnull)
+            # the shell itself is one process
+            counts.append(_processes() - before - 1)
+    return min(counts)
+
+
+def _processes():
+    with open("/proc/stat") as fh:
+        for line in fh:
+            if line.startswith("processes "):
+                return int(line.split()[1])
+
+
+def benchmark(shells, namespaces, features, runs):
+    results = {}
+    for scenario in SCENARIOS:
+        home = tempfile.mkdtemp()
+        try:
+            global_path = os.path.join(home, ".sprinter", ".global")
+            if scenario != "baseline":
+                global_path = install_namespaces(home, namespaces, features,
+                                                 legacy=(scenario == "legacy"))
+            write_shell_rc(home, scenario, global_path)
+            for shell in shells:
+                timings = sorted(time_shell(shell, home, runs))
+                results.setdefault(shell, {})[scenario] = {
+                    "mean": sum(timings) / len(timings),
+                    "median": timings[len(timings) // 2],
+                    "forks": count_forks(shell, home),
+                }
+        finally:
+            shutil.rmtree(home)
+    for shell_results in results.values():
+        baseline = shell_results["baseline"]
+        for scenario, result in shell_results.items():
+            result["overhead"] = result["median"] - baseline["median"]
+            result["overhead_per_namespace"] = result["overhead"] / namespaces
+    return results
+
+
+def report(results, namespaces, features, runs):
+    print("%d namespaces x %d features, median of %d runs:" % (namespaces, features, runs))
+    for shell in sorted(results):
+        print("\n%s -ic exit" % shell)
+        print("  %-11s %9s %10s %13s %6s" % ("scenario", "median", "overhead", "per namespace", "forks"))
+        for scenario in SCENARIOS:
+            result = results[shell][scenario]
+            forks = "?" if result["forks"] is None else "%d" % result["forks"]
+            print("  %-11s %7.2fms %+8.2fms %+11.2fms %6s" % (
+                scenario, result["median"] * 1000, result["overhead"] * 1000,
+                result["overhead_per_namespace"] * 1000, forks))
+
+
+def compare(results, previous, threshold):
+    """ print the change from previous results, returning the regressed scenarios """
+    regressions = []
+    print("\ncompared to previous results:")
+    for shell in sorted(results):
+        for scenario in SCENARIOS:
+            if scenario == "baseline" or scenario not in previous.get(shell, {}):
+                continue
+            # overheads are compared, so a slower machine doesn't count as a regression
+            before = max(previous[shell][scenario]["overhead"], 0.005)
+            after = results[shell][scenario]["overhead"]
+            change = (after - before) / before
+            regressed = change > threshold
+            if regressed:
+                regressions.append((shell, scenario))
+            print("  %-5s %-11s %+8.2fms -> %+8.2fms %s" % (
+                shell, scenario, before * 1000, after * 1000, "REGRESSED" if regressed else ""))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark sprinter's shell startup cost")
+    parser.add_argument("--namespaces", type=int, default=5)
+    parser.add_argument("--features", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--shells", default="bash,zsh")
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    options = parser.parse_args(argv[1:])
+
+    shells = [s for s in options.shells.split(",") if _which(s)]
+    if not shells:
+        print("None of %s are installed!" % options.shells)
+        return 1
+    results = benchmark(shells, options.namespaces, options.features, options.runs)
+    report(results, options.namespaces, options.features, options.runs)
+    if options.output:
+        with open(options.output, "w") as fh:
+            fh.write(json.dumps({
+                "namespaces": options.namespaces,
+                "features": options.features,
+                "runs": options.runs,
+                "platform": platform.platform(),
+                "results": results,
+            }, indent=2, sort_keys=True))
+    if options.compare:
+        with open(options.compare) as fh:
+            previous = json.load(fh)["results"]
+        if compare(results, previous, options.threshold):
+            return 1
+    return 0
+
+
+def _which(name):
+    for path in os.environ.get("PATH", "").split(os.pathsep):
+        if os.access(os.path.join(path, name), os.X_OK):
+            return True
+    return False
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
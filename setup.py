@@ -13,6 +13,7 @@ setup(name='sprinter',
       author_email='yusuke@yusuketsutsumi.com',
       url='http://toumorokoshi.github.io/sprinter',
       packages=find_packages(),
+      package_data={'sprinter.formula': ['*.json']},
       install_requires=[
           'clint>=0.3.3',
           'docopt>=0.6.1',
@@ -0,0 +1,93 @@
+"""
+activation.py compiles the env script of a namespace, so activating
+it in a new shell does not fork.
+
+Calls to __sprinter_prepend_path are inlined as shell parameter
+expansion, which behaves the same as the function: the directory is
+moved (or added) to the front of the variable, if it exists.
+"""
+from __future__ import unicode_literals
+import re
+
+PREPEND_REGEX = re.compile(r'^\s*__sprinter_prepend_path\s+"([^"]*)"(?:\s+([A-Za-z_][A-Za-z0-9_]*))?\s*$')
+
+prepend_template = """if [ -d "{dir}" ]; then
+    __sp_list=":${{{var}}}:"
+    while :; do
+        case "$__sp_list" in
+            *":{dir}:"*) __sp_list="${{__sp_list%%":{dir}:"*}}:${{__sp_list#*":{dir}:"}}" ;;
+            *) break ;;
+        esac
+    done
+    __sp_list="${{__sp_list#:}}"
+    __sp_list="${{__sp_list%:}}"
+    export {var}="{dir}${{__sp_list:+:$__sp_list}}"
+fi"""
+
+cleanup_template = "unset __sp_list"
+
+COMPILED_PREPEND_REGEX = re.compile(
+    r'^if \[ -d "((?:[^"\\]|\\.)*)" \]; then\n    __sp_list=":\$\{([A-Za-z_][A-Za-z0-9_]*)\}:"\n.*?^fi$',
+    re.MULTILINE | re.DOTALL)
+
+
+def compile_env(content):
+    """ return the env script content, with path prepends inlined """
+    return compile_items(parse_env(content))
+
+
+def parse_env(content):
+    """
+    parse an env script, compiled or not, into a list of items: either
+    ('prepend', directory, var) for path prepends, or ('line', line).
+    The directory is kept as written in the script, so it may contain
+    shell variables and escapes.
+    """
+    items = []
+    position = 0
+    for match in COMPILED_PREPEND_REGEX.finditer(content):
+        items += _parse_lines(content[position:match.start()])
+        items.append(('prepend', match.group(1), match.group(2)))
+        position = match.end()
+        if content[position:position + 1] == "\n":
+            position += 1
+    items += _parse_lines(content[position:])
+    return items
+
+
+def compile_items(items):
+    """ return a script for the items returned by parse_env """
+    lines = []
+    inlined = False
+    for item in items:
+        if item[0] == 'prepend':
+            lines.append(prepend_template.format(dir=item[1], var=item[2]))
+            inlined = True
+        else:
+            lines.append(item[1])
+    if inlined:
+        lines.append(cleanup_template)
+    return "\n".join(lines) + "\n"
+
+
+def _parse_lines(content):
+    items = []
+    for line in content.splitlines():
+        match = PREPEND_REGEX.match(line)
+        if match:
+            items.append(('prepend', match.group(1), match.group(2) or "PATH"))
+        elif line.strip() != cleanup_template:
+            items.append(('line', line))
+    return items
+
+
+def compile_prepend(directory, var="PATH"):
+    """ return shell code prepending the directory to var, without forking """
+    return prepend_template.format(dir=_escape(directory), var=var)
+
+
+def _escape(value):
+    """ escape a value to be used inside double quotes """
+    for character in ('\\', '"', '$', '`'):
+        value = value.replace(character, '\\' + character)
+    return value
@@ -0,0 +1,143 @@
+"""
+bundle.py combines the shell configuration of every active namespace
+into one env script and one rc script in the global directory, so a
+shell only has to source a single file.
+
+Namespaces are bundled in the order they were activated. utils.sh is
+inlined once, the .gui, .env and .rc sourcing between the files of a
+namespace is replaced by their content, and each path is only
+prepended once (where it was last prepended, so the resulting order
+doesn't change).
+"""
+from __future__ import unicode_literals
+import io
+import json
+import logging
+import os
+import threading
+
+from .activation import compile_items, parse_env
+from .templates import shell_utils_template, source_template
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILENAME = "active_namespaces.json"
+ENV_BUNDLE_FILENAME = "activate_env.sh"
+RC_BUNDLE_FILENAME = "activate_rc.sh"
+
+# several environments may update the bundle at once
+_lock = threading.RLock()
+
+
+class ActivationBundle(object):
+
+    global_path = None  # the global sprinter directory
+
+    def __init__(self, global_path):
+        self.global_path = global_path
+
+    @property
+    def env_path(self):
+        return os.path.join(self.global_path, ENV_BUNDLE_FILENAME)
+
+    @property
+    def rc_path(self):
+        return os.path.join(self.global_path, RC_BUNDLE_FILENAME)
+
+    def namespaces(self):
+        """ return the (namespace, root directory) of each active namespace, in order """
+        registry_path = os.path.join(self.global_path, REGISTRY_FILENAME)
+        if not os.path.exists(registry_path):
+            return []
+        try:
+            with open(registry_path) as fh:
+                return [tuple(entry) for entry in json.load(fh)]
+        except ValueError:
+            return []
+
+    def activate(self, namespace, root_dir):
+        """ add the namespace to the bundle, after any others """
+        with _lock:
+            namespaces = [n for n in self.namespaces() if n[0] != namespace]
+            self._write_registry(namespaces + [(namespace, root_dir)])
+
+    def deactivate(self, namespace):
+        """ remove the namespace from the bundle """
+        with _lock:
+            self._write_registry([n for n in self.namespaces() if n[0] != namespace])
+
+    def write(self):
+        """ regenerate the bundles from the files of the active namespaces """
+        with _lock:
+            self._write_bundles()
+
+    def _write_bundles(self):
+        env_items, rc_items = [], []
+        for namespace, root_dir in self.namespaces():
+            if not os.path.isdir(root_dir):
+                logger.debug("Namespace %s no longer exists, not bundling it..." % namespace)
+                continue
+            namespace_env_items = [('line', '# %s' % namespace)] + self._namespace_items(root_dir, '.env')
+            env_items += namespace_env_items
+            rc_items += namespace_env_items + self._namespace_items(root_dir, '.rc')
+        header = shell_utils_template.strip() + "\n"
+        self._write(self.env_path, header + compile_items(_dedupe_prepends(env_items)))
+        self._write(self.rc_path,
+                    header + compile_items(_dedupe_prepends(rc_items)))
+
+    def _namespace_items(self, root_dir, filename):
+        """ return the items of a namespace file, with the sourcing of the other files removed """
+        inlined = {
+            os.path.join(root_dir, '.gui'): filename == '.env',
+            os.path.join(root_dir, '.env'): False,
+            os.path.join(self.global_path, 'utils.sh'): False,
+        }
+        items = []
+        for item in parse_env(_read(os.path.join(root_dir, filename))):
+            sourced = _sourced_path(item)
+            if sourced in inlined:
+                if inlined[sourced]:
+                    items += parse_env(_read(sourced))
+                continue
+            items.append(item)
+        return items
+
+    def _write_registry(self, namespaces):
+        if not os.path.exists(self.global_path):
+            os.makedirs(self.global_path)
+        with open(os.path.join(self.global_path, REGISTRY_FILENAME), 'w+') as fh:
+            fh.write(json.dumps([list(n) for n in namespaces]))
+
+    def _write(self, path, content):
+        if not os.path.exists(self.global_path):
+            os.makedirs(self.global_path)
+        with io.open(path, 'w+', encoding='utf-8') as fh:
+            fh.write(content)
+
+
+def _dedupe_prepends(items):
+    """ only keep the last prepend of each directory to each variable """
+    last = {}
+    for i, item in enumerate(items):
+        if item[0] == 'prepend':
+            last[item[1:]] = i
+    return [item for i, item in enumerate(items)
+            if item[0] != 'prepend' or last[item[1:]] == i]
+
+
+def _sourced_path(item):
+    """ return the path an item sources, if it is a sprinter source line """
+    if item[0] != 'line':
+        return None
+    line = item[1].strip()
+    prefix, _, path = line.rpartition(" && . ")
+    if path and line + "\n" == source_template % (path, path):
+        return path
+    return None
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return ""
+    with io.open(path, encoding='utf-8') as fh:
+        return fh.read()
@@ -0,0 +1,182 @@
+"""
+contentstore.py stores extracted trees once, keyed by the checksum
+of their archive, and materializes them into feature directories as
+hardlinks.
+
+Every directory materialized from the store holds a marker pointing
+back to its store entry, and each entry keeps one reference file per
+directory using it. The entry is deleted once the last reference is
+released.
+
+Files in materialized directories share their inode with the store,
+so they should be treated as read-only.
+"""
+from __future__ import unicode_literals
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+MARKER_FILENAME = ".sprinter-store"
+
+
+class ContentStoreException(Exception):
+    """ An exception with the content store """
+
+
+class ContentStore(object):
+
+    root_dir = None  # path to the root of the store
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def has(self, key):
+        """ return true if content for the key is in the store """
+        return os.path.isdir(self._tree_path(key))
+
+    def add(self, key, populate, metadata=None):
+        """
+        add content for the key, by calling populate with a directory
+        to fill. Does nothing if the content is already stored.
+        """
+        if self.has(key):
+            return self._tree_path(key)
+        entry_path = self._entry_path(key)
+        if not os.path.exists(entry_path):
+            os.makedirs(os.path.join(entry_path, "refs"))
+        staging_path = tempfile.mkdtemp(prefix=".tree-", dir=entry_path)
+        try:
+            populate(staging_path)
+            with open(os.path.join(entry_path, "metadata.json"), "w+") as fh:
+                fh.write(json.dumps(metadata or {}, sort_keys=True))
+            try:
+                os.rename(staging_path, self._tree_path(key))
+            except OSError:
+                # another process stored the same content first
+                if not self.has(key):
+                    raise
+        finally:
+            if os.path.exists(staging_path):
+                shutil.rmtree(staging_path, ignore_errors=True)
+        return self._tree_path(key)
+
+    def metadata(self, key):
+        """ return the metadata stored alongside the content """
+        metadata_path = os.path.join(self._entry_path(key), "metadata.json")
+        if not os.path.exists(metadata_path):
+            return {}
+        with open(metadata_path) as fh:
+            return json.load(fh)
+
+    def materialize(self, key, target_dir):
+        """
+        hardlink the stored content for the key into target_dir, falling
+        back to copies when hardlinks are not possible (e.g. across
+        filesystems).
+        """
+        if not self.has(key):
+            raise ContentStoreException("No content stored for %s!" % key)
+        tree_path = self._tree_path(key)
+        for root, dirs, files in os.walk(tree_path):
+            relative_root = os.path.relpath(root, tree_path)
+            target_root = os.path.normpath(os.path.join(target_dir, relative_root))
+            if not os.path.isdir(target_root):
+                os.makedirs(target_root)
+            for name in dirs:
+                source_path = os.path.join(root, name)
+                if os.path.islink(source_path):
+                    os.symlink(os.readlink(source_path), os.path.join(target_root, name))
+            for name in files:
+                source_path = os.path.join(root, name)
+                target_path = os.path.join(target_root, name)
+                if os.path.islink(source_path):
+                    os.symlink(os.readlink(source_path), target_path)
+                    continue
+                try:
+                    os.link(source_path, target_path)
+                except OSError:
+                    shutil.copy2(source_path, target_path)
+        with open(os.path.join(target_dir, MARKER_FILENAME), "w+") as fh:
+            fh.write(json.dumps({'root_dir': self.root_dir, 'key': key}, sort_keys=True))
+
+    def add_reference(self, key, path):
+        """ record that the directory at path uses the content for the key """
+        path = os.path.abspath(path)
+        with open(self._reference_path(key, path), "w+") as fh:
+            fh.write(path)
+
+    def remove_reference(self, key, path):
+        """
+        release the reference from the directory at path, and delete
+        the content if nothing else uses it. returns true if the
+        content was deleted.
+        """
+        reference_path = self._reference_path(key, os.path.abspath(path))
+        if os.path.exists(reference_path):
+            os.unlink(reference_path)
+        if self.references(key):
+            return False
+        logger.debug("Removing unreferenced content %s from the store..." % key)
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+        return True
+
+    def references(self, key):
+        """
+        return the paths still referencing the content. References to
+        directories that no longer hold the content are dropped.
+        """
+        refs_path = os.path.join(self._entry_path(key), "refs")
+        if not os.path.exists(refs_path):
+            return []
+        references = []
+        for name in os.listdir(refs_path):
+            with open(os.path.join(refs_path, name)) as fh:
+                path = fh.read()
+            if read_marker(path) == (self.root_dir, key):
+                references.append(path)
+            else:
+                os.unlink(os.path.join(refs_path, name))
+        return references
+
+    def _entry_path(self, key):
+        return os.path.join(self.root_dir, key)
+
+    def _tree_path(self, key):
+        return os.path.join(self._entry_path(key), "tree")
+
+    def _reference_path(self, key, path):
+        name = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return os.path.join(self._entry_path(key), "refs", name)
+
+
+def read_marker(path):
+    """ return the (store root, key) a directory was materialized from, or None """
+    marker_path = os.path.join(path, MARKER_FILENAME)
+    if not os.path.exists(marker_path):
+        return None
+    try:
+        with open(marker_path) as fh:
+            marker = json.load(fh)
+        return (marker['root_dir'], marker['key'])
+    except (ValueError, KeyError):
+        return None
+
+
+def release_directory(path):
+    """
+    release the store reference held by a directory, if it was
+    materialized from a store. returns true if the stored content was
+    deleted.
+    """
+    marker = read_marker(path)
+    if marker is None:
+        return False
+    root_dir, key = marker
+    # the marker is removed first, so the reference is no longer counted
+    os.unlink(os.path.join(path, MARKER_FILENAME))
+    return ContentStore(root_dir).remove_reference(key, path)
@@ -2,15 +2,23 @@
 directory.py stores methodology to install various files and
 packages to different locations.
 
+the feature owning each symlink (and any file a formula records) is
+kept in an ownership database under the root directory, so features
+can be cleared without scanning the bin and lib directories.
 """
 from __future__ import unicode_literals
+import io
 import logging
 import os
+import re
 import shutil
 import stat
 import tempfile
 
-from .templates import source_template
+from .activation import compile_env
+from .contentstore import release_directory
+from .ownership import DATABASE_FILENAME, FILE, SYMLINK, OwnershipDB
+from .templates import lazy_rc_loader_template, lazy_rc_stub_template, source_template
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +36,10 @@ class Directory(object):
                            # preserved, and will not be modifiable
     rc_file = None  # file handler for rc file
     env_file = None  # file handler for env file
+    gui_file = None  # file handler for gui file
     shell_util_path = None  # the path to the shell utils file
+    ownership = None  # the ownership database, opened when first needed
+    config_log = None  # the (kind, content) of each addition to the env, rc and gui scripts
     logger = logger
 
     def __init__(self, root_dir,
@@ -40,6 +51,7 @@ class Directory(object):
         self.manifest_path = os.path.join(self.root_dir, "manifest.cfg")
         self.rewrite_config = rewrite_config
         self.shell_util_path = shell_util_path
+        self.config_log = []
 
     def __del__(self):
         if self.rc_file:
@@ -61,11 +73,20 @@ class Directory(object):
         self.new = False
 
     def finalize(self):
-        """ finalize any open file handles """
+        """
+        finalize any open file handles, and compile the env script so
+        sourcing it does not fork
+        """
         if self.rc_file:
             self.rc_file.close()
+        if self.gui_file:
+            self.gui_file.close()
         if self.env_file:
             self.env_file.close()
+            with io.open(self.env_path, encoding="utf-8") as fh:
+                content = fh.read()
+            with io.open(self.env_path, "w+", encoding="utf-8") as fh:
+                fh.write(compile_env(content))
 
     def remove(self):
         """ Removes the sprinter directory, if it exists """
@@ -73,34 +94,57 @@ class Directory(object):
             self.rc_file.close()
         if self.env_file:
             self.env_file.close()
+        if self.ownership:
+            self.ownership.close()
         shutil.rmtree(self.root_dir)
 
-    def symlink_to_bin(self, name, path):
-        """ Symlink an object at path to name in the bin folder. """
-        self.__symlink_dir("bin", name, path)
+    def symlink_to_bin(self, name, path, owner=None):
+        """
+        Symlink an object at path to name in the bin folder. The owner
+        defaults to the feature whose install directory holds the path.
+        """
+        self.__symlink_dir("bin", name, path, owner)
         os.chmod(os.path.join(self.root_dir, "bin", name), os.stat(path).st_mode | stat.S_IXUSR | stat.S_IRUSR)
 
     def remove_from_bin(self, name):
         """ Remove an object from the bin folder. """
         self.__remove_path(os.path.join(self.root_dir, "bin", name))
+        self._ownership().remove(os.path.join(self.root_dir, "bin", name))
 
     def remove_from_lib(self, name):
         """ Remove an object from the bin folder. """
         self.__remove_path(os.path.join(self.root_dir, "lib", name))
+        self._ownership().remove(os.path.join(self.root_dir, "lib", name))
 
     def remove_feature(self, feature_name):
         """ Remove an feature from the environment root folder. """
         self.clear_feature_symlinks(feature_name)
+        self._ownership().remove_feature(feature_name)
+        if os.path.exists(self.lazy_rc_path(feature_name)):
+            os.unlink(self.lazy_rc_path(feature_name))
         if os.path.exists(self.install_directory(feature_name)):
+            release_directory(self.install_directory(feature_name))
             self.__remove_path(self.install_directory(feature_name))
 
-    def symlink_to_lib(self, name, path):
+    def symlink_to_lib(self, name, path, owner=None):
         """ Symlink an object at path to name in the lib folder. """
-        self.__symlink_dir("lib", name, path)
+        self.__symlink_dir("lib", name, path, owner)
 
-    def symlink_to_include(self, name, path):
+    def symlink_to_include(self, name, path, owner=None):
         """ Symlink an object at path to name in the lib folder. """
-        self.__symlink_dir("include", name, path)
+        self.__symlink_dir("include", name, path, owner)
+
+    def record_file(self, feature_name, path):
+        """ record that a feature created the file at path """
+        self._ownership().add(feature_name, os.path.abspath(path), FILE)
+
+    def owned_paths(self, feature_name):
+        """ return the symlinks and files created by a feature """
+        return self._ownership().paths(feature_name)
+
+    def owner(self, path):
+        """ return the feature that created the symlink or file at path, or None """
+        return self._ownership().owner(os.path.abspath(path))
 
     def bin_path(self):
         """ return the bin directory path """
@@ -117,13 +161,11 @@ class Directory(object):
     def clear_feature_symlinks(self, feature_name):
         """ Clear the symlinks for a feature in the symlinked path """
         logger.debug("Clearing feature symlinks for %s" % feature_name)
-        feature_path = self.install_directory(feature_name)
-        for d in ('bin', 'lib'):
-            if os.path.exists(os.path.join(self.root_dir, d)):
-                for link in os.listdir(os.path.join(self.root_dir, d)):
-                    path = os.path.join(self.root_dir, d, link)
-                    if feature_path in os.path.realpath(path):
-                        getattr(self, 'remove_from_%s' % d)(link)
+        ownership = self._ownership()
+        for path in ownership.paths(feature_name, SYMLINK):
+            if os.path.islink(path):
+                os.unlink(path)
+            ownership.remove(path)
 
     def install_directory(self, feature_name):
         """
@@ -140,6 +182,7 @@ class Directory(object):
         if not self.env_file:
             self.env_path, self.env_file = self.__get_env_handle(self.root_dir)
         self.env_file.write(content + '\n')
+        self.config_log.append(('env', content))
 
     def add_to_rc(self, content):
         """
@@ -150,6 +193,30 @@ class Directory(object):
         if not self.rc_file:
             self.rc_path, self.rc_file = self.__get_rc_handle(self.root_dir)
         self.rc_file.write(content + '\n')
+        self.config_log.append(('rc', content))
+
+    def add_lazy_to_rc(self, feature_name, content, commands):
+        """
+        add content to the rc script, to be run the first time one of
+        the commands is called instead of on every shell start. The
+        content is written to its own file, and each command gets a
+        stub function that sources it and then calls the command.
+        """
+        lazy_rc_path = self.lazy_rc_path(feature_name)
+        if not os.path.exists(os.path.dirname(lazy_rc_path)):
+            os.makedirs(os.path.dirname(lazy_rc_path))
+        with io.open(lazy_rc_path, "w+", encoding="utf-8") as fh:
+            fh.write(content + "\n")
+        loader = "__sprinter_lazy_" + re.sub("[^A-Za-z0-9_]", "_", feature_name)
+        self.add_to_rc(lazy_rc_loader_template % {'loader': loader,
+                                                  'commands': " ".join(commands),
+                                                  'path': lazy_rc_path})
+        for command in commands:
+            self.add_to_rc(lazy_rc_stub_template % {'command': command, 'loader': loader})
+
+    def lazy_rc_path(self, feature_name):
+        """ return the path of the lazy rc content of the feature """
+        return os.path.join(self.root_dir, "lazy", feature_name + ".sh")
 
     def add_to_gui(self, content):
         """
@@ -160,6 +227,12 @@ class Directory(object):
         if not self.gui_file:
             self.gui_path, self.gui_file = self.__get_gui_handle(self.root_dir)
         self.gui_file.write(content + '\n')
+        self.config_log.append(('gui', content))
+
+    def add_config(self, config):
+        """ add a list of (kind, content) from config_log to the env, rc and gui scripts """
+        for kind, content in config:
+            getattr(self, 'add_to_' + kind)(content)
 
     def __remove_path(self, path):
         """ Remove an object """
@@ -210,7 +283,34 @@ class Directory(object):
         fh = open(gui_path, "w+")
         return (gui_path, fh)
 
-    def __symlink_dir(self, dir_name, name, path):
+    def _ownership(self):
+        """ return the ownership database, indexing existing symlinks when it is created """
+        if self.ownership is None:
+            self.ownership = OwnershipDB(os.path.join(self.root_dir, DATABASE_FILENAME))
+            self.ownership.connect()
+            if self.ownership.created:
+                self.__index_symlinks()
+        return self.ownership
+
+    def __index_symlinks(self):
+        """ record the owners of symlinks created before the ownership database existed """
+        for d in ('bin', 'lib', 'include'):
+            if os.path.exists(os.path.join(self.root_dir, d)):
+                for link in os.listdir(os.path.join(self.root_dir, d)):
+                    path = os.path.join(self.root_dir, d, link)
+                    feature_name = self.__feature_for_path(path)
+                    if os.path.islink(path) and feature_name:
+                        self.ownership.add(feature_name, path, SYMLINK)
+
+    def __feature_for_path(self, path):
+        """ return the feature whose install directory holds the path, or None """
+        features_path = os.path.realpath(os.path.join(self.root_dir, "features"))
+        relative_path = os.path.relpath(os.path.realpath(path), features_path)
+        if relative_path == os.curdir or relative_path.startswith(os.pardir):
+            return None
+        return relative_path.split(os.sep)[0]
+
+    def __symlink_dir(self, dir_name, name, path, owner=None):
         """
         Symlink an object at path to name in the dir_name folder. remove it if it already exists.
         """
@@ -219,10 +319,19 @@ class Directory(object):
             os.makedirs(target_dir)
         target_path = os.path.join(self.root_dir, dir_name, name)
         logger.debug("Attempting to symlink %s to %s..." % (path, target_path))
-        if os.path.exists(target_path):
+        owner = owner or self.__feature_for_path(path)
+        if os.path.lexists(target_path):
             if os.path.islink(target_path):
+                previous_owner = self._ownership().owner(target_path)
+                if previous_owner and owner and previous_owner != owner:
+                    logger.warn("%s was linked by feature %s, replacing it with %s's..." %
+                                (target_path, previous_owner, owner))
                 os.remove(target_path)
             else:
                 logger.warn("%s is not a symlink! please remove it manually." % target_path)
                 return
         os.symlink(path, target_path)
+        if owner:
+            self._ownership().add(owner, target_path, SYMLINK)
+        else:
+            self._ownership().remove(target_path)
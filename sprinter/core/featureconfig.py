@@ -17,11 +17,13 @@ class ParamNotFoundException(Exception):
 class FeatureConfig(object):
 
     manifest = None  # the manifest the featureconfig is derived from
+    schema = None  # the schema of the feature's formula, set by the formula
 
     def __init__(self, manifest, feature_name):
         self.feature_name = feature_name
         self.manifest = manifest
         self.raw_dict = dict(manifest.items(feature_name))
+        self._parsed = {}  # parsed values of params without references, which can't change
 
     def get(self, param, default=EMPTY):
         """
@@ -34,6 +36,9 @@ class FeatureConfig(object):
             if default is not EMPTY:
                 return default
             raise ParamNotFoundException("value for %s not found" % param)
+        if '%' not in str(self.raw_dict[param]):
+            # nothing to specialize
+            return str(self.raw_dict[param])
         context_dict = copy.deepcopy(self.manifest.get_context_dict())
         for k, v in self.raw_dict.items():
             context_dict["%s:%s" % (self.feature_name, k)] = v
@@ -59,6 +64,25 @@ class FeatureConfig(object):
             max_depth -= 1
         return cur_value
 
+    def get_parsed(self, param, default=EMPTY):
+        """
+        Returns the param value, parsed according to the type the schema
+        declares for it. If the param doesn't exist, the default is
+        returned, or the default of the schema.
+        """
+        if param in self._parsed:
+            return self._parsed[param]
+        if not self.has(param):
+            if default is EMPTY and self.schema and param in self.schema.defaults:
+                return self.schema.defaults[param]
+            return self.get(param, default=default)
+        value = self.get(param)
+        if self.schema:
+            value = self.schema.parse(param, value)
+        if '%' not in str(self.raw_dict[param]):
+            self._parsed[param] = value
+        return value
+
     def has(self, param):
         """ return true if the param exists """
         return param in self.raw_dict
@@ -66,12 +90,14 @@ class FeatureConfig(object):
     def set(self, param, value):
         """ sets the param to the value provided """
         self.raw_dict[param] = value
+        self._parsed.pop(param, None)
         self.manifest.set(self.feature_name, param, value)
 
     def remove(self, param):
         """ Remove a parameter from the manifest """
         if self.has(param):
             del(self.raw_dict[param])
+            self._parsed.pop(param, None)
             self.manifest.remove_option(self.feature_name, param)
 
     def keys(self):
@@ -4,9 +4,13 @@ from sprinter.exceptions import SprinterException, FormulaException
 from sprinter.external.pippuppet import Pip, PipException
 import sys
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+# feature dicts of several environments may share formulas
+_formula_lock = threading.Lock()
+
 # legacy mappings for renames
 LEGACY_MAPPINGS = {
     'sprinter.formulabase': 'sprinter.formula.base'
@@ -17,14 +21,29 @@ class FeatureDict(dict):
     Dictionary which contains instances of features, formulas with a specific configuration
     """
 
-    def __init__(self, environment, source_manifest, target_manifest, pip_install_path, formula_dict=None):
-        """ generate a feature dict from Manifests <source_manifest> and <target_manifest> """
+    def __init__(self, environment, source_manifest, target_manifest, pip_install_path, formula_dict=None,
+                 install_formulas=True, pip=None):
+        """
+        generate a feature dict from Manifests <source_manifest> and <target_manifest>
+
+        if install_formulas is false, formulas that can't be imported
+        are not downloaded, and their features use FormulaBase instead.
+
+        formula_dict and pip can be shared by several feature dicts, so
+        formulas are only installed once.
+        """
         self._environment = environment
         self._run_order = []  # the order with which these features should run
-        self._formula_dict = formula_dict or {}  # a dictionary to hold formula classes
-        self._pip = Pip(pip_install_path)
-        # TODO: have a better way of detecting exists eggs are installed
-        self._pip.delete_all_eggs()
+        # a dictionary to hold formula classes
+        self._formula_dict = formula_dict if formula_dict is not None else {}
+        self.missing_formulas = set()  # formulas that weren't installed, when not installing formulas
+        self._pip = None
+        if install_formulas:
+            self._pip = pip
+            if self._pip is None:
+                self._pip = Pip(pip_install_path)
+                # TODO: have a better way of detecting exists eggs are installed
+                self._pip.delete_all_eggs()
 
         if target_manifest:
             for feature in target_manifest.sections():
@@ -84,23 +103,29 @@ formula = sprinter.formula.env
         """
         # recursive import otherwise
         from sprinter.formula.base import FormulaBase
+        requested_formula = formula
         if formula in LEGACY_MAPPINGS:
             formula = LEGACY_MAPPINGS[formula]
         formula_class, formula_url = formula, None
         if ':' in formula:
             formula_class, formula_url = formula.split(":", 1)
-        if formula_class not in self._formula_dict:
-            try:
-                self._formula_dict[formula_class] = lib.get_subclass_from_module(formula_class, FormulaBase)
-            except (SprinterException, ImportError):
-                logger.info("Downloading %s..." % formula_class)
+        with _formula_lock:
+            if formula_class not in self._formula_dict:
                 try:
-                    self._pip.install_egg(formula_url or formula_class)
+                    self._formula_dict[formula_class] = lib.get_subclass_from_module(formula_class, FormulaBase)
+                except (SprinterException, ImportError):
+                    if self._pip is None:
+                        logger.debug("Formula %s is not installed, using FormulaBase..." % formula_class)
+                        self.missing_formulas.add(requested_formula)
+                        return FormulaBase
+                    logger.info("Downloading %s..." % formula_class)
                     try:
-                        self._formula_dict[formula_class] = lib.get_subclass_from_module(formula_class, FormulaBase)
-                    except ImportError:
-                        logger.debug("FeatureDict import Error", exc_info=sys.exc_info())
-                        raise SprinterException("Error: Unable to retrieve formula %s!" % formula_class)
-                except PipException:
-                    logger.error("ERROR: Unable to download %s!" % formula_class)
-        return self._formula_dict[formula_class]
+                        self._pip.install_egg(formula_url or formula_class)
+                        try:
+                            self._formula_dict[formula_class] = lib.get_subclass_from_module(formula_class, FormulaBase)
+                        except ImportError:
+                            logger.debug("FeatureDict import Error", exc_info=sys.exc_info())
+                            raise SprinterException("Error: Unable to retrieve formula %s!" % formula_class)
+                    except PipException:
+                        logger.error("ERROR: Unable to download %s!" % formula_class)
+            return self._formula_dict[formula_class]
@@ -81,6 +81,10 @@ def print_global_config(global_config):
         print("\nHave sprinter env source rc: {0}".format(
             global_config.get('global', 'env_source_rc')))
 
+    if global_config.has_option('global', 'activation_bundle'):
+        print("\nSource every namespace from one activation bundle: {0}".format(
+            global_config.get('global', 'activation_bundle')))
+
 
 def create_default_config():
     """ Create a default configuration object, with all parameters filled """
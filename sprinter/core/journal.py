@@ -0,0 +1,107 @@
+"""
+journal.py records the progress of an install in the namespace root,
+so an install that fails part way can be resumed from the failed
+feature instead of starting over.
+
+For each feature, the journal holds its status, the shell
+configuration it added (which has to be written again when the env
+and rc files are regenerated on resume) and the artifacts it created.
+The inputs of the install (except secrets) are kept as well, so a
+resumed install doesn't prompt for them again.
+"""
+from __future__ import unicode_literals
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = ".journal.json"
+
+STARTED = "started"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+class Journal(object):
+
+    path = None  # path to the journal file
+
+    def __init__(self, root_dir):
+        self.path = os.path.join(root_dir, JOURNAL_FILENAME)
+        self._content = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def begin(self, manifest_source, inputs):
+        """ start a new journal for an install of the manifest """
+        self._content = {'source': manifest_source, 'inputs': inputs, 'features': {}}
+        self._write()
+
+    def source(self):
+        """ return the source of the manifest being installed """
+        return self._load().get('source')
+
+    def inputs(self):
+        """ return the inputs the install was started with """
+        return self._load().get('inputs', {})
+
+    def feature(self, feature_name):
+        """ return the entry of a feature, or None if it was not started """
+        return self._load()['features'].get(feature_name)
+
+    def is_complete(self, feature_name):
+        entry = self.feature(feature_name)
+        return entry is not None and entry['status'] == COMPLETE
+
+    def unfinished(self):
+        """ return the features that were started, but not completed """
+        return [feature_name for feature_name, entry in self._load()['features'].items()
+                if entry['status'] != COMPLETE]
+
+    def start(self, feature_name):
+        self._set(feature_name, STARTED)
+
+    def complete(self, feature_name, config, artifacts):
+        """
+        record a feature as complete, with the shell configuration it
+        added as a list of (kind, content), and the paths it created
+        """
+        self._set(feature_name, COMPLETE,
+                  config=[list(entry) for entry in config], artifacts=artifacts)
+
+    def fail(self, feature_name):
+        self._set(feature_name, FAILED)
+
+    def remove(self):
+        """ remove the journal, once the install is complete """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._content = None
+
+    def _set(self, feature_name, status, config=None, artifacts=None):
+        self._load()['features'][feature_name] = {
+            'status': status,
+            'config': config or [],
+            'artifacts': artifacts or [],
+        }
+        self._write()
+
+    def _load(self):
+        if self._content is None:
+            self._content = {'source': None, 'inputs': {}, 'features': {}}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as fh:
+                        self._content = json.load(fh)
+                except ValueError:
+                    logger.warn("Unable to read the install journal at %s, ignoring it..." % self.path)
+        return self._content
+
+    def _write(self):
+        """ write the journal atomically, so an interrupted write doesn't lose it """
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w+') as fh:
+            fh.write(json.dumps(self._content))
+        os.rename(temp_path, self.path)
@@ -20,6 +20,7 @@ from six.moves import configparser
 from six import string_types
 import requests
 import sprinter.lib as lib
+from sprinter.lib import instrumentation
 from sprinter.next.compat import create_configparser
 from sprinter.lib.dependencytree import DependencyTree, DependencyTreeException
 from .featureconfig import FeatureConfig
@@ -51,6 +52,13 @@ def load_manifest(raw_manifest, namespace=None, **kwargs):
 
 def _load_manifest_interpret_source(manifest, source, username=None, password=None, verify_certificate=True, do_inherit=True):
     """ Interpret the <source>, and load the results into <manifest> """
+    name = source if isinstance(source, string_types) else "manifest"
+    with instrumentation.span(name, 'manifest'):
+        _load_manifest_source(manifest, source, username=username, password=password,
+                              verify_certificate=verify_certificate, do_inherit=do_inherit)
+
+
+def _load_manifest_source(manifest, source, username=None, password=None, verify_certificate=True, do_inherit=True):
     try:
         if isinstance(source, string_types):
             if source.startswith("http"):
@@ -131,6 +139,7 @@ class Manifest(object):
 
     def __init__(self, raw_manifest, namespace=None):
         self.manifest = raw_manifest
+        self.additional_context_variables = {}
         if not self.manifest.has_section('config'):
             self.manifest.add_section('config')
         self.inputs = self.__setup_inputs()
@@ -0,0 +1,89 @@
+"""
+ownership.py records which feature owns each symlink and file created
+in a namespace, in a sqlite database under the namespace root.
+
+Lookups by feature or path are indexed, so removing a feature does not
+have to scan the bin and lib directories.
+"""
+from __future__ import unicode_literals
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILENAME = ".ownership.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS owned (
+    path TEXT PRIMARY KEY,
+    feature TEXT NOT NULL,
+    kind TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS owned_feature ON owned (feature, kind);
+"""
+
+SYMLINK = "symlink"
+FILE = "file"
+
+
+class OwnershipDB(object):
+
+    path = None  # path to the database file
+    created = False  # true if the database did not exist before it was opened
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def add(self, feature_name, path, kind=SYMLINK):
+        """ record that the feature owns the path """
+        self._execute("INSERT OR REPLACE INTO owned (path, feature, kind) VALUES (?, ?, ?)",
+                      (path, feature_name, kind))
+
+    def owner(self, path):
+        """ return the feature owning the path, or None """
+        rows = self._execute("SELECT feature FROM owned WHERE path = ?", (path,))
+        return rows[0][0] if rows else None
+
+    def paths(self, feature_name, kind=None):
+        """ return the paths owned by the feature """
+        if kind is None:
+            rows = self._execute("SELECT path FROM owned WHERE feature = ?", (feature_name,))
+        else:
+            rows = self._execute("SELECT path FROM owned WHERE feature = ? AND kind = ?",
+                                 (feature_name, kind))
+        return [row[0] for row in rows]
+
+    def remove(self, path):
+        """ forget the owner of the path """
+        self._execute("DELETE FROM owned WHERE path = ?", (path,))
+
+    def remove_feature(self, feature_name):
+        """ forget every path owned by the feature """
+        self._execute("DELETE FROM owned WHERE feature = ?", (feature_name,))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def connect(self):
+        """ open the database, creating it if it does not exist """
+        if self._connection is None:
+            self.created = not os.path.exists(self.path)
+            parent_directory = os.path.dirname(self.path)
+            if not os.path.exists(parent_directory):
+                os.makedirs(parent_directory)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _execute(self, statement, parameters=()):
+        with self._lock:
+            connection = self.connect()
+            with connection:
+                return connection.execute(statement, parameters).fetchall()
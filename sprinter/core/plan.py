@@ -0,0 +1,96 @@
+"""
+plan.py works out what syncing a source manifest to a target manifest
+would do, feature by feature and option by option, without doing it.
+
+Only the raw manifest values are compared, so inputs are never
+prompted for. Formulas are instantiated (but never run) to ask which
+option changes require work; features whose formula is not installed
+are planned as if every option change did.
+"""
+from __future__ import unicode_literals
+
+from .core import PHASE
+
+UNCHANGED = "unchanged"
+
+ACTION_MARKERS = {
+    PHASE.INSTALL.name: "+",
+    PHASE.UPDATE.name: "~",
+    PHASE.REMOVE.name: "-",
+    UNCHANGED: " ",
+}
+
+
+def plan_features(features):
+    """
+    return the plan for each feature of a FeatureDict, in run order, as
+    a list of dictionaries with the feature, formula, action, whether
+    it requires work, and the options that change.
+    """
+    plan = []
+    for feature in features.run_order:
+        instance = features[feature]
+        phase = instance.sync_phase()
+        formula_installed = feature[1] not in features.missing_formulas
+        options = _option_changes(instance, phase, formula_installed)
+        action = phase.name
+        if phase == PHASE.UPDATE and not options:
+            action = UNCHANGED
+        plan.append({
+            'feature': feature[0],
+            'formula': feature[1],
+            'formula_installed': formula_installed,
+            'action': action,
+            'requires_work': (phase != PHASE.UPDATE or
+                              any(o['requires_work'] for o in options)),
+            'options': options,
+        })
+    return plan
+
+
+def format_plan(namespace, plan):
+    """ return the plan as text, for people to read """
+    lines = ["Plan for %s:" % namespace]
+    counts = dict((action, 0) for action in ACTION_MARKERS)
+    for entry in plan:
+        counts[entry['action']] += 1
+        lines.append("%s %s (%s): %s%s" % (
+            ACTION_MARKERS[entry['action']], entry['feature'], entry['formula'], entry['action'],
+            "" if entry['requires_work'] or entry['action'] == UNCHANGED else ", shell configuration only"))
+        if entry['action'] == PHASE.UPDATE.name:
+            for option in entry['options']:
+                lines.append("      %s: %s -> %s%s" % (
+                    option['option'], _format_value(option['source']), _format_value(option['target']),
+                    "" if option['requires_work'] else " (no work)"))
+    lines.append("%s to install, %s to update, %s to remove, %s unchanged." % (
+        counts[PHASE.INSTALL.name], counts[PHASE.UPDATE.name],
+        counts[PHASE.REMOVE.name], counts[UNCHANGED]))
+    return "\n".join(lines)
+
+
+def _option_changes(instance, phase, formula_installed):
+    """ return the options that differ between the source and target of a feature """
+    source = instance.source.raw_dict if instance.source else {}
+    target = instance.target.raw_dict if instance.target else {}
+    changes = []
+    for option in sorted(set(source) | set(target)):
+        if source.get(option) == target.get(option):
+            continue
+        if (phase == PHASE.UPDATE and option not in target
+                and option not in instance.dont_carry_over_options):
+            # resolve carries the source value over to the target
+            continue
+        changes.append({
+            'option': option,
+            'source': source.get(option),
+            'target': target.get(option),
+            'requires_work': (phase != PHASE.UPDATE or not formula_installed or
+                              instance.option_requires_work(option)),
+        })
+    return changes
+
+
+def _format_value(value):
+    if value is None:
+        return "(unset)"
+    return value.replace("\n", "\\n")
@@ -0,0 +1,121 @@
+"""
+schema.py compiles the options a formula class declares into a
+Schema, once per class, to validate the options of its features and
+parse their values.
+
+Formulas declare the type of options in option_types, and the value
+of typed options that aren't set in option_defaults:
+
+    option_types = dict(FormulaBase.option_types, eggs=schema.LIST, redownload=schema.BOOL)
+    option_defaults = dict(FormulaBase.option_defaults, redownload=False)
+
+FeatureConfig.get_parsed returns values parsed according to their
+type: lists are split on commas and newlines, bools are parsed with
+lib.is_affirmative (empty values are false), and paths have ~
+expanded.
+"""
+from __future__ import unicode_literals
+import os
+import re
+import threading
+
+from six import string_types
+import sprinter.lib as lib
+
+STRING = "string"
+BOOL = "bool"
+LIST = "list"
+PATH = "path"
+INTEGER = "int"
+
+ERROR = "error"
+WARNING = "warning"
+
+# a comma followed by < is part of a version specifier, such as foo>=1,<2
+LIST_REGEX = re.compile(',(?!<)|\n')
+BOOL_VALUES = set(['true', 'false', 'yes', 'no', 't', 'f', 'y', 'n'])
+
+
+def parse_bool(value):
+    value = value.strip()
+    return bool(value) and lib.is_affirmative(value)
+
+
+def parse_list(value):
+    return [item.strip() for item in LIST_REGEX.split(value) if item.strip()]
+
+
+def parse_path(value):
+    return os.path.expanduser(value)
+
+
+PARSERS = {
+    STRING: lambda value: value,
+    BOOL: parse_bool,
+    LIST: parse_list,
+    PATH: parse_path,
+    INTEGER: int,
+}
+
+_schemas = {}
+_schema_lock = threading.Lock()
+
+
+class Schema(object):
+
+    def __init__(self, formula_class):
+        self.types = dict(formula_class.option_types)
+        self.defaults = dict(formula_class.option_defaults)
+        self.required = tuple(formula_class.required_options)
+        self.deprecated = dict(formula_class.deprecated_options)
+        self.valid = frozenset(formula_class.valid_options) | frozenset(self.required) | frozenset(self.types)
+        self.any_option = '*' in self.valid
+        self._parsers = dict((option, PARSERS[option_type]) for option, option_type in self.types.items())
+
+    def unknown_options(self, options):
+        """ return the options that aren't part of the schema """
+        if self.any_option:
+            return []
+        return [o for o in options if o not in self.valid and o not in self.deprecated]
+
+    def deprecated_options(self, options):
+        return [o for o in options if o in self.deprecated]
+
+    def missing_options(self, options):
+        """ return the required options that aren't in options """
+        options = frozenset(options)
+        return [o for o in self.required if o not in options]
+
+    def check(self, option, value):
+        """
+        return a (level, what the value should be) if the value can't be
+        parsed as the type of the option, or None. Unknown bool values
+        are parsed as false, so they are warnings.
+        """
+        option_type = self.types.get(option)
+        if option_type == BOOL and value.strip().lower() not in BOOL_VALUES:
+            return (WARNING, "true or false")
+        if option_type == INTEGER:
+            try:
+                int(value)
+            except ValueError:
+                return (ERROR, "an integer")
+        return None
+
+    def parse(self, option, value):
+        """ return the value parsed according to the type of the option """
+        parser = self._parsers.get(option)
+        if parser is None or not isinstance(value, string_types):
+            return value
+        return parser(value)
+
+
+def get_schema(formula_class):
+    """ return the schema of a formula class, compiling it the first time """
+    schema = _schemas.get(formula_class)
+    if schema is None:
+        with _schema_lock:
+            schema = _schemas.get(formula_class)
+            if schema is None:
+                schema = _schemas[formula_class] = Schema(formula_class)
+    return schema
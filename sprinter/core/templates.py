@@ -8,30 +8,51 @@ shell_utils_template = """
 # don't add paths repeatedly to env vars
 # __sprinter_prepend_path "/foo"         => "/foo:$PATH"
 # __sprinter_prepend_path "/foo" MANPATH => "/foo:$MANPATH"
+# only parameter expansion is used, so neither function forks
 __sprinter_prepend_path() {
     local sp_dir="$1"
     local sp_var="${2:-PATH}"
-    local sp_list=$(eval echo '$'$sp_var)
     if [ -d "$sp_dir" ]; then
-        # strip sp_dir from sp_list
-        sp_list=`echo -n $sp_list | awk -v RS=: -v ORS=: '$0 != "'$sp_dir'"' | sed 's/:$//'`
+        __sprinter_strip_path "$sp_dir" "$sp_var"
         # :+ syntax avoids dangling ":" in exported var
-        export $sp_var="${sp_dir}${sp_list:+":$sp_list"}"
+        export $sp_var="${sp_dir}${__sp_list:+":$__sp_list"}"
+        unset __sp_list
     fi
 }
 
 # remove a path from env var (default PATH)
 __sprinter_remove_path() {
-    local sp_dir="$1"
     local sp_var="${2:-PATH}"
-    local sp_list=$(eval echo '$'$sp_var)
-    # strip sp_dir from sp_list
-    export $sp_var=$(echo -n $sp_list | awk -v RS=: -v ORS=: '$0 != "'$sp_dir'"' | sed -E 's/^:|:$//g')
+    __sprinter_strip_path "$1" "$sp_var"
+    export $sp_var="$__sp_list"
+    unset __sp_list
+}
+
+# set __sp_list to the env var, without any entries of the path
+__sprinter_strip_path() {
+    eval "__sp_list=\":\${$2}:\""
+    while :; do
+        case "$__sp_list" in
+            *":$1:"*) __sp_list="${__sp_list%%":$1:"*}:${__sp_list#*":$1:"}" ;;
+            *) break ;;
+        esac
+    done
+    __sp_list="${__sp_list#:}"
+    __sp_list="${__sp_list%:}"
 }
 """
 
 source_template = """[ -r "%s" ] && . %s\n"""
 
+# a stub for a command, which runs the lazy rc of its feature first
+lazy_rc_stub_template = """%(command)s() { %(loader)s; %(command)s "$@"; }"""
+
+# loads the lazy rc of a feature, after removing the stubs
+lazy_rc_loader_template = """%(loader)s() {
+    unset -f %(commands)s %(loader)s
+    . "%(path)s"
+}"""
+
 warning_template = """
 __          __     _____  _   _ _____ _   _  _____
 \ \        / /\   |  __ \| \ | |_   _| \ | |/ ____|
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import subprocess
+import tempfile
+from nose.tools import eq_, ok_
+from nose.plugins.skip import SkipTest
+from sprinter.core.activation import compile_env
+from sprinter.core.templates import shell_utils_template
+import sprinter.lib as lib
+
+
+class TestActivation(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        for d in ("bin", "lib"):
+            os.makedirs(os.path.join(self.temp_dir, d))
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_compile_inlines_prepends(self):
+        """ path prepends should be inlined, and other lines kept """
+        compiled = compile_env('export A=1\n__sprinter_prepend_path "/foo" MANPATH\n')
+        ok_("__sprinter_prepend_path" not in compiled)
+        ok_(compiled.startswith("export A=1\n"))
+        ok_('export MANPATH="/foo${__sp_list:+:$__sp_list}"' in compiled)
+
+    def test_compile_keeps_variables(self):
+        """ directories written with shell variables should still be expanded """
+        compiled = compile_env('__sprinter_prepend_path "$HOME/bin"\n')
+        ok_('export PATH="$HOME/bin${__sp_list:+:$__sp_list}"' in compiled)
+        eq_(compile_env(compiled), compiled)
+
+    def test_compiled_matches_function(self):
+        """ the inlined prepends should behave like __sprinter_prepend_path """
+        if lib.which("bash") is None:
+            raise SkipTest("bash is not installed")
+        bin_path = os.path.join(self.temp_dir, "bin")
+        lib_path = os.path.join(self.temp_dir, "lib")
+        env = ('__sprinter_prepend_path "%s" PATH\n' % bin_path +
+               '__sprinter_prepend_path "%s" LIBRARY_PATH\n' % lib_path +
+               '__sprinter_prepend_path "/does/not/exist" PATH\n')
+        initial = 'PATH="/a:%s:/b:%s"; LIBRARY_PATH=""\n' % (bin_path, bin_path)
+        show = 'echo "$PATH|$LIBRARY_PATH|${__sp_list-unset}"\n'
+        eq_(self._run(initial + shell_utils_template + env + show),
+            self._run(initial + compile_env(env) + show))
+        eq_(self._run(initial + compile_env(env) + show),
+            "%s:/a:/b|%s|unset" % (bin_path, lib_path))
+
+    def _run(self, script):
+        script_path = os.path.join(self.temp_dir, "script.sh")
+        with open(script_path, "w+") as fh:
+            fh.write(script)
+        return subprocess.check_output(["bash", script_path]).decode("utf-8").strip()
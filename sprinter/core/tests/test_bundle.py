@@ -0,0 +1,78 @@
+from __future__ import unicode_literals
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from nose.tools import eq_, ok_
+from nose.plugins.skip import SkipTest
+from sprinter.core.activation import compile_env
+from sprinter.core.bundle import ActivationBundle
+from sprinter.core.templates import source_template
+import sprinter.lib as lib
+
+
+class TestActivationBundle(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.global_path = os.path.join(self.temp_dir, ".global")
+        self.bundle = ActivationBundle(self.global_path)
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_activation_order(self):
+        """ namespaces should be bundled in the order they were last activated """
+        self.bundle.activate("a", "/a")
+        self.bundle.activate("b", "/b")
+        self.bundle.activate("a", "/a")
+        eq_(self.bundle.namespaces(), [("b", "/b"), ("a", "/a")])
+        self.bundle.deactivate("b")
+        eq_(self.bundle.namespaces(), [("a", "/a")])
+
+    def test_bundle_inlines_namespaces(self):
+        """ the bundle should inline every namespace, sourcing nothing else """
+        first = self._write_namespace("first", "export FIRST=1")
+        self._write_namespace("second", "export SECOND=1")
+        self.bundle.write()
+        content = io.open(self.bundle.rc_path, encoding="utf-8").read()
+        ok_(" && . " not in content)
+        ok_(content.index("export FIRST=1") < content.index("export SECOND=1"))
+        ok_("alias first=true" in content)
+        eq_(content.count('export PATH="%s' % os.path.join(first, "bin")), 1)
+        eq_(content.count('export PATH="/usr/local/bin'), 1)
+        env_content = io.open(self.bundle.env_path, encoding="utf-8").read()
+        ok_("export SECOND=1" in env_content)
+        ok_("alias first=true" not in env_content)
+        ok_("__sprinter_prepend_path()" in env_content)
+
+    def test_bundle_runs(self):
+        """ sourcing the bundle should set up every namespace """
+        if lib.which("bash") is None:
+            raise SkipTest("bash is not installed")
+        first = self._write_namespace("first", "export FIRST=1")
+        second = self._write_namespace("second", "export SECOND=1")
+        self.bundle.write()
+        output = subprocess.check_output(
+            ["bash", "-c", '. %s; echo "$FIRST$SECOND:$PATH"' % self.bundle.rc_path],
+            env={"PATH": "/usr/bin:/bin"}).decode("utf-8").strip()
+        eq_(output, "11:%s:/usr/local/bin:%s:/usr/bin:/bin" % (os.path.join(second, "bin"),
+                                                                os.path.join(first, "bin")))
+
+    def _write_namespace(self, namespace, env):
+        root_dir = os.path.join(self.temp_dir, namespace)
+        os.makedirs(os.path.join(root_dir, "bin"))
+        env_path = os.path.join(root_dir, ".env")
+        gui_path = os.path.join(root_dir, ".gui")
+        utils_path = os.path.join(self.global_path, "utils.sh")
+        with io.open(env_path, "w+", encoding="utf-8") as fh:
+            fh.write(compile_env(source_template % (gui_path, gui_path) +
+                                 source_template % (utils_path, utils_path) +
+                                 env + "\n" +
+                                 '__sprinter_prepend_path "/usr/local/bin" PATH\n' +
+                                 '__sprinter_prepend_path "%s" PATH\n' % os.path.join(root_dir, "bin")))
+        with io.open(os.path.join(root_dir, ".rc"), "w+", encoding="utf-8") as fh:
+            fh.write(source_template % (env_path, env_path) + "alias %s=true\n" % namespace)
+        self.bundle.activate(namespace, root_dir)
+        return root_dir
@@ -0,0 +1,57 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_, ok_
+from sprinter.core.contentstore import ContentStore, release_directory
+
+
+def populate(target_dir):
+    os.makedirs(os.path.join(target_dir, "bin"))
+    with open(os.path.join(target_dir, "bin", "tool"), "w+") as fh:
+        fh.write("tool")
+    os.symlink("tool", os.path.join(target_dir, "bin", "tool-link"))
+
+
+class TestContentStore(object):
+    """ Tests for the content store """
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = ContentStore(os.path.join(self.temp_dir, "store"))
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _materialize(self, name):
+        path = os.path.join(self.temp_dir, name)
+        os.makedirs(path)
+        self.store.materialize("abc", path)
+        self.store.add_reference("abc", path)
+        return path
+
+    def test_add_only_populates_once(self):
+        """ Adding the same key twice should only populate it once """
+        calls = []
+        self.store.add("abc", lambda d: calls.append(populate(d)))
+        self.store.add("abc", lambda d: calls.append(populate(d)))
+        eq_(len(calls), 1)
+        ok_(self.store.has("abc"))
+
+    def test_materialize_hardlinks(self):
+        """ Materialized directories should share inodes with the store """
+        self.store.add("abc", populate)
+        first, second = self._materialize("first"), self._materialize("second")
+        eq_(os.stat(os.path.join(first, "bin", "tool")).st_ino,
+            os.stat(os.path.join(second, "bin", "tool")).st_ino)
+        eq_(os.readlink(os.path.join(first, "bin", "tool-link")), "tool")
+
+    def test_release_frees_on_last_reference(self):
+        """ Content should only be deleted when the last reference is released """
+        self.store.add("abc", populate)
+        first, second = self._materialize("first"), self._materialize("second")
+        ok_(not release_directory(first))
+        ok_(self.store.has("abc"))
+        ok_(release_directory(second))
+        ok_(not self.store.has("abc"))
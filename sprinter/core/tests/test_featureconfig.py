@@ -0,0 +1,67 @@
+from __future__ import unicode_literals
+from io import StringIO
+from nose.tools import eq_, raises
+from sprinter.core import schema
+from sprinter.core.featureconfig import ParamNotFoundException
+from sprinter.core.manifest import load_manifest
+from sprinter.formula.base import FormulaBase
+
+test_manifest = """
+[config]
+namespace = test
+inputs = user
+
+[feature]
+formula = sprinter.formula.base
+systems = osx, debian
+plain = hello
+referenced = %(config:user)s
+fail_on_error = no
+"""
+
+
+class ParsingFormula(FormulaBase):
+
+    option_types = dict(FormulaBase.option_types, fail_on_error=schema.BOOL, redownload=schema.BOOL)
+    option_defaults = dict(FormulaBase.option_defaults, redownload=True)
+
+
+class TestFeatureConfig(object):
+
+    def setup(self):
+        self.manifest = load_manifest(StringIO(test_manifest))
+        self.manifest.set_input('user', 'me')
+        self.config = self.manifest.get_feature_config('feature')
+        self.config.schema = ParsingFormula.schema()
+
+    def test_get(self):
+        """ values should be specialized against the manifest """
+        eq_(self.config.get('plain'), "hello")
+        eq_(self.config.get('referenced'), "me")
+
+    def test_get_parsed(self):
+        """ values should be parsed according to the schema, with its defaults """
+        eq_(self.config.get_parsed('systems'), ["osx", "debian"])
+        eq_(self.config.get_parsed('fail_on_error'), False)
+        eq_(self.config.get_parsed('redownload'), True)
+        eq_(self.config.get_parsed('redownload', False), False)
+        eq_(self.config.get_parsed('plain'), "hello")
+
+    def test_get_parsed_after_set(self):
+        """ setting a value should replace its parsed value """
+        eq_(self.config.get_parsed('fail_on_error'), False)
+        self.config.set('fail_on_error', 'yes')
+        eq_(self.config.get_parsed('fail_on_error'), True)
+        self.config.remove('fail_on_error')
+        eq_(self.config.get_parsed('fail_on_error', True), True)
+
+    def test_references_are_not_cached(self):
+        """ values with references should be specialized on every call """
+        eq_(self.config.get_parsed('referenced'), "me")
+        self.manifest.set_input('user', 'you')
+        eq_(self.config.get_parsed('referenced'), "you")
+
+    @raises(ParamNotFoundException)
+    def test_missing(self):
+        """ a missing param without a default should raise """
+        self.config.get_parsed('missing')
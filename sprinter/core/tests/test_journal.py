@@ -0,0 +1,40 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+from nose.tools import eq_, ok_
+from sprinter.core.journal import Journal
+
+
+class TestJournal(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_journal(self):
+        """ the journal should persist the status of each feature """
+        journal = Journal(self.temp_dir)
+        journal.begin("http://example.com/manifest.cfg", {"username": "user"})
+        journal.start("one")
+        journal.complete("one", [("env", "export ONE=1")], ["/tmp/one"])
+        journal.start("two")
+        journal.fail("two")
+        journal = Journal(self.temp_dir)
+        eq_(journal.source(), "http://example.com/manifest.cfg")
+        eq_(journal.inputs(), {"username": "user"})
+        ok_(journal.is_complete("one"))
+        eq_(journal.feature("one")["config"], [["env", "export ONE=1"]])
+        eq_(journal.unfinished(), ["two"])
+        eq_(journal.feature("three"), None)
+        journal.remove()
+        ok_(not journal.exists())
+
+    def test_unreadable_journal(self):
+        """ an unreadable journal should be treated as empty """
+        with open(os.path.join(self.temp_dir, ".journal.json"), "w+") as fh:
+            fh.write("{")
+        journal = Journal(self.temp_dir)
+        eq_(journal.feature("one"), None)
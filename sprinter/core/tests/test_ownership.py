@@ -0,0 +1,72 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+from nose.tools import eq_, ok_
+from sprinter.core import Directory
+from sprinter.core.ownership import FILE, SYMLINK, OwnershipDB
+
+
+class TestOwnership(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.directory = Directory(os.path.join(self.temp_dir, "namespace"))
+        self.directory.initialize()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_database(self):
+        """ the database should index paths by feature and kind """
+        db = OwnershipDB(os.path.join(self.temp_dir, "test.db"))
+        db.add("a", "/bin/x")
+        db.add("a", "/home/y", FILE)
+        db.add("b", "/bin/z")
+        eq_(db.owner("/bin/x"), "a")
+        eq_(db.paths("a", SYMLINK), ["/bin/x"])
+        eq_(sorted(db.paths("a")), ["/bin/x", "/home/y"])
+        db.remove_feature("a")
+        eq_(db.owner("/bin/x"), None)
+        eq_(db.paths("b"), ["/bin/z"])
+
+    def test_clear_feature_symlinks(self):
+        """ clearing a feature should only remove the symlinks it owns """
+        self._install("feature", "tool")
+        self._install("feature_two", "other")
+        self.directory.clear_feature_symlinks("feature")
+        ok_(not os.path.lexists(os.path.join(self.directory.bin_path(), "tool")))
+        ok_(os.path.lexists(os.path.join(self.directory.bin_path(), "other")))
+        eq_(self.directory.owner(os.path.join(self.directory.bin_path(), "other")), "feature_two")
+
+    def test_clear_broken_symlinks(self):
+        """ symlinks whose target was removed should be cleared as well """
+        path = self._install("feature", "tool")
+        os.unlink(path)
+        self.directory.clear_feature_symlinks("feature")
+        ok_(not os.path.lexists(os.path.join(self.directory.bin_path(), "tool")))
+
+    def test_index_existing_symlinks(self):
+        """ symlinks created before the database existed should be indexed """
+        self._install("feature", "tool")
+        self.directory.ownership.close()
+        os.unlink(self.directory.ownership.path)
+        directory = Directory(self.directory.root_dir)
+        eq_(directory.owner(os.path.join(directory.bin_path(), "tool")), "feature")
+
+    def test_record_file(self):
+        """ files recorded by a feature should be looked up by path """
+        path = os.path.join(self.temp_dir, "config")
+        self.directory.record_file("feature", path)
+        eq_(self.directory.owner(path), "feature")
+        self.directory.remove_feature("feature")
+        eq_(self.directory.owner(path), None)
+
+    def _install(self, feature_name, name):
+        install_directory = self.directory.install_directory(feature_name)
+        os.makedirs(install_directory)
+        path = os.path.join(install_directory, name)
+        with open(path, 'w+') as fh:
+            fh.write("#!/bin/sh\n")
+        self.directory.symlink_to_bin(name, path)
+        return path
@@ -0,0 +1,82 @@
+from __future__ import unicode_literals
+from mock import patch
+from nose.tools import eq_, ok_
+from sprinter.core.plan import format_plan
+from sprinter.testtools import MockEnvironment
+
+source_config = """
+[config]
+namespace = test
+
+[envs]
+formula = sprinter.formula.env
+foo = baz
+
+[tool]
+formula = sprinter.formula.base
+command = make
+rc = alias t=tool2
+keep = source only
+
+[same]
+formula = sprinter.formula.base
+rc = same
+
+[old]
+formula = sprinter.formula.base
+"""
+
+target_config = """
+[config]
+namespace = test
+
+[envs]
+formula = sprinter.formula.env
+foo = bar
+
+[tool]
+formula = sprinter.formula.base
+command = make install
+rc = alias t=tool
+
+[same]
+formula = sprinter.formula.base
+rc = same
+
+[new]
+formula = some.formula.that.isnt.installed
+x = 1
+"""
+
+
+class TestPlan(object):
+
+    def test_plan(self):
+        """ a plan should diff every feature and option, without installing formulas """
+        with MockEnvironment(source_config, target_config) as environment:
+            plan = dict((entry['feature'], entry) for entry in environment.plan())
+            eq_(plan['envs']['action'], 'update')
+            eq_(plan['envs']['requires_work'], False)
+            eq_(plan['tool']['requires_work'], True)
+            eq_([(o['option'], o['requires_work']) for o in plan['tool']['options']],
+                [('command', True), ('rc', False)])
+            eq_(plan['same']['action'], 'unchanged')
+            eq_(plan['old']['action'], 'remove')
+            eq_(plan['new']['action'], 'install')
+            eq_(plan['new']['formula_installed'], False)
+
+    def test_plan_does_not_install_formulas(self):
+        """ a plan should not construct Pip """
+        with patch('sprinter.core.featuredict.Pip') as pip:
+            with MockEnvironment(source_config, target_config) as environment:
+                environment.plan()
+                ok_(not pip.called)
+
+    def test_format_plan(self):
+        """ the formatted plan should list the changes and summarize them """
+        with MockEnvironment(source_config, target_config) as environment:
+            text = format_plan("test", environment.plan())
+            ok_("~ tool (sprinter.formula.base): update" in text)
+            ok_("      rc: alias t=tool2 -> alias t=tool (no work)" in text)
+            ok_("~ envs (sprinter.formula.env): update, shell configuration only" in text)
+            ok_(text.endswith("1 to install, 2 to update, 1 to remove, 1 unchanged."))
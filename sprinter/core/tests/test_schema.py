@@ -0,0 +1,57 @@
+from __future__ import unicode_literals
+import os
+from nose.tools import eq_, ok_
+from sprinter.core import schema
+from sprinter.core.schema import get_schema
+from sprinter.formula.base import FormulaBase
+
+
+class TypedFormula(FormulaBase):
+
+    valid_options = FormulaBase.valid_options + ['name']
+    required_options = FormulaBase.required_options + ['url']
+    deprecated_options = {'old': 'Option {option} in {feature} is deprecated'}
+    option_types = dict(FormulaBase.option_types, eggs=schema.LIST, fail_on_error=schema.BOOL,
+                        root=schema.PATH, port=schema.INTEGER)
+    option_defaults = dict(FormulaBase.option_defaults, fail_on_error=True)
+
+
+class TestSchema(object):
+
+    def test_schema_is_compiled_once(self):
+        """ the schema of a formula class should be compiled once, and not shared with its parent """
+        ok_(get_schema(TypedFormula) is TypedFormula.schema())
+        ok_(get_schema(TypedFormula) is not FormulaBase.schema())
+
+    def test_options(self):
+        """ unknown, deprecated and missing options should be found """
+        typed_schema = get_schema(TypedFormula)
+        options = ['formula', 'name', 'eggs', 'old', 'unknown']
+        eq_(typed_schema.unknown_options(options), ['unknown'])
+        eq_(typed_schema.deprecated_options(options), ['old'])
+        eq_(typed_schema.missing_options(options), ['url'])
+
+    def test_any_option(self):
+        """ no option should be unknown to a formula that accepts any option """
+        from sprinter.formula.env import EnvFormula
+        eq_(get_schema(EnvFormula).unknown_options(['FOO', 'rc']), [])
+
+    def test_parse(self):
+        """ values should be parsed according to the type of their option """
+        typed_schema = get_schema(TypedFormula)
+        eq_(typed_schema.parse('eggs', "foo>=1,<2, bar\nbaz,"), ["foo>=1,<2", "bar", "baz"])
+        eq_(typed_schema.parse('fail_on_error', "No"), False)
+        eq_(typed_schema.parse('fail_on_error', " yes"), True)
+        eq_(typed_schema.parse('fail_on_error', ""), False)
+        eq_(typed_schema.parse('root', "~/code"), os.path.expanduser("~/code"))
+        eq_(typed_schema.parse('port', "22"), 22)
+        eq_(typed_schema.parse('name', "~/as is"), "~/as is")
+
+    def test_check(self):
+        """ values that don't parse as their type should be problems """
+        typed_schema = get_schema(TypedFormula)
+        eq_(typed_schema.check('fail_on_error', "yes"), None)
+        eq_(typed_schema.check('fail_on_error', "maybe"), (schema.WARNING, "true or false"))
+        eq_(typed_schema.check('port', "22"), None)
+        eq_(typed_schema.check('port', "ssh"), (schema.ERROR, "an integer"))
+        eq_(typed_schema.check('name', "anything"), None)
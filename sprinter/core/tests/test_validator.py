@@ -0,0 +1,104 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+from io import StringIO
+from nose.tools import eq_, ok_
+from sprinter.core import validator
+
+valid_manifest = """
+[config]
+namespace = valid
+inputs = user
+
+[git]
+formula = sprinter.formula.git
+url = https://example.com/%(config:user)s.git
+
+[env]
+formula = sprinter.formula.env
+depends = git
+GIT_ROOT = %(git:root_dir)s|%(git:url|escaped)s
+PERCENT = 100%%(not a reference)s
+"""
+
+invalid_manifest = """
+[config]
+namespace = invalid
+
+[git]
+formula = sprinter.formula.git
+brunch = master
+depends = env
+
+[env]
+formula = sprinter.formula.env
+depends = git, missing
+path = %(nope:thing)s
+
+[link]
+formula = sprinter.formula.symlink
+src = a
+
+[noformula]
+rc = x
+
+[thirdparty]
+formula = some.third.party.formula
+
+[command]
+formula = sprinter.formula.command
+install = make
+shell = maybe
+fail_on_error = %(config:namespace)s
+"""
+
+
+class TestValidator(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _messages(self, problems, level):
+        return sorted((p['feature'], p['message']) for p in problems if p['level'] == level)
+
+    def test_valid_manifest(self):
+        """ a valid manifest should have no problems """
+        eq_(validator.validate_manifest(StringIO(valid_manifest)), [])
+
+    def test_invalid_manifest(self):
+        """ every problem of a manifest should be reported, without instantiating formulas """
+        problems = validator.validate_manifest(StringIO(invalid_manifest))
+        ok_(validator.has_errors(problems))
+        eq_(self._messages(problems, validator.ERROR), [
+            (None, "The dependencies of git, env are cyclic, or depend on a cycle!"),
+            ('env', "Depends on missing, which does not exist!"),
+            ('env', "Option path references %(nope:thing)s, which does not exist!"),
+            ('git', "Required option url is not present!"),
+            ('noformula', "No formula is set!"),
+        ])
+        eq_(self._messages(problems, validator.WARNING), [
+            ('command', "Option shell should be true or false, but is maybe!"),
+            ('git', "Unused option brunch!"),
+            ('link', 'Option "src" in link has been deprecated, use "source" instead'),
+            ('thirdparty', "Formula some.third.party.formula is not installed, its options were not checked."),
+        ])
+
+    def test_validate_manifests(self):
+        """ several manifests should be validated at once, in order """
+        paths = []
+        for name, content in [("valid.cfg", valid_manifest), ("invalid.cfg", invalid_manifest)]:
+            paths.append(os.path.join(self.temp_dir, name))
+            with open(paths[-1], 'w') as fh:
+                fh.write(content)
+        paths.append(os.path.join(self.temp_dir, "missing.cfg"))
+        results = validator.validate_manifests(paths, jobs=2)
+        eq_([source for source, _ in results], paths)
+        eq_(results[0][1], [])
+        ok_(validator.has_errors(results[1][1]))
+        ok_("does not exist" in results[2][1][0]['message'])
+        eq_(validator.format_problems(paths[0], results[0][1]), "%s: ok" % paths[0])
+        ok_("  error: [noformula] No formula is set!" in validator.format_problems(paths[1], results[1][1]))
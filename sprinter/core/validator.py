@@ -0,0 +1,191 @@
+"""
+validator.py checks manifests statically: without an environment,
+without instantiating formulas or installing them, and without
+touching the sprinter root. It is meant for validating many manifests
+at once, such as in CI.
+
+Each manifest is checked for:
+
+* features without a formula
+* options against the schema the formula class declares
+  (required_options, valid_options, deprecated_options and the
+  option_types values have to parse as)
+* %(section:option)s references to options that don't exist
+* depends on features that don't exist, or that are cyclic
+
+Formulas are imported to read their schema, but never downloaded:
+the options of features whose formula isn't installed are not
+checked. Checks formulas do in their validate method (such as
+whether packages are installed) need an environment, and are left to
+`sprinter validate`.
+"""
+from __future__ import unicode_literals
+import re
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+import sprinter.lib as lib
+from sprinter.exceptions import SprinterException
+from sprinter.next.compat import create_configparser
+from .featuredict import LEGACY_MAPPINGS
+from .inputs import Inputs
+from .manifest import ManifestException, _load_manifest_interpret_source
+from .schema import ERROR, WARNING, get_schema
+
+# the number of manifests validated at once
+VALIDATE_JOBS = 4
+
+REFERENCE_REGEX = re.compile(r"%\(([^)]*)\)s")
+# context added by the environment when features are specialized
+RUNTIME_CONTEXT = ['config:root_dir', 'config:node']
+RUNTIME_FEATURE_CONTEXT = ['root_dir']
+
+# formula classes by name, or None if they aren't installed
+_formula_classes = {}
+_formula_lock = threading.Lock()
+
+
+def validate_manifest(source):
+    """
+    return the problems of a manifest, as a list of dictionaries with
+    the level (error or warning), the feature (None for the manifest
+    itself) and a message.
+    """
+    manifest = create_configparser()
+    manifest.add_section('config')
+    try:
+        _load_manifest_interpret_source(manifest, source)
+    except ManifestException:
+        return [_problem(ERROR, None, str(sys.exc_info()[1]))]
+    problems = []
+    features = [s for s in manifest.sections() if s != 'config']
+    for feature in features:
+        problems += _validate_options(manifest, feature)
+    problems += _validate_references(manifest, features)
+    problems += _validate_depends(manifest, features)
+    return problems
+
+
+def validate_manifests(sources, jobs=VALIDATE_JOBS):
+    """ validate several manifests at once, returning a list of (source, problems) """
+    pool = ThreadPool(max(min(jobs, len(sources)), 1))
+    try:
+        return list(zip(sources, pool.map(validate_manifest, sources)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def has_errors(problems):
+    return any(p['level'] == ERROR for p in problems)
+
+
+def format_problems(source, problems):
+    """ return the problems of a manifest as text, for people to read """
+    if not problems:
+        return "%s: ok" % source
+    lines = ["%s:" % source]
+    for problem in problems:
+        where = "[%s] " % problem['feature'] if problem['feature'] else ""
+        lines.append("  %s: %s%s" % (problem['level'], where, problem['message']))
+    return "\n".join(lines)
+
+
+def get_formula_class(formula):
+    """ return the class of a formula, or None if it isn't installed """
+    # recursive import otherwise
+    from sprinter.formula.base import FormulaBase
+    formula_class = LEGACY_MAPPINGS.get(formula, formula).split(":", 1)[0]
+    with _formula_lock:
+        if formula_class not in _formula_classes:
+            try:
+                _formula_classes[formula_class] = lib.get_subclass_from_module(formula_class, FormulaBase)
+            except (SprinterException, ImportError):
+                _formula_classes[formula_class] = None
+        return _formula_classes[formula_class]
+
+
+def _validate_options(manifest, feature):
+    if not manifest.has_option(feature, 'formula'):
+        return [_problem(ERROR, feature, "No formula is set!")]
+    formula = manifest.get(feature, 'formula')
+    formula_class = get_formula_class(formula)
+    if formula_class is None:
+        return [_problem(WARNING, feature,
+                         "Formula %s is not installed, its options were not checked." % formula)]
+    option_schema = get_schema(formula_class)
+    options = manifest.options(feature)
+    problems = []
+    for option in option_schema.deprecated_options(options):
+        problems.append(_problem(WARNING, feature, option_schema.deprecated[option].format(
+            option=option, feature=feature)))
+    for option in option_schema.unknown_options(options):
+        problems.append(_problem(WARNING, feature, "Unused option %s!" % option))
+    for option in option_schema.missing_options(options):
+        problems.append(_problem(ERROR, feature, "Required option %s is not present!" % option))
+    for option in options:
+        value = manifest.get(feature, option)
+        # values with references can only be checked once they are specialized
+        if option in option_schema.types and '%(' not in value:
+            problem = option_schema.check(option, value)
+            if problem:
+                problems.append(_problem(problem[0], feature, "Option %s should be %s, but is %s!" % (
+                    option, problem[1], value)))
+    if 'rc_lazy' in options and 'rc_lazy_commands' not in options:
+        problems.append(_problem(ERROR, feature, "rc_lazy requires rc_lazy_commands!"))
+    return problems
+
+
+def _validate_references(manifest, features):
+    """ return a problem for each %(section:option)s reference to an option that doesn't exist """
+    inputs = Inputs()
+    for section in manifest.sections():
+        if manifest.has_option(section, 'inputs'):
+            inputs.add_inputs_from_inputstring(manifest.get(section, 'inputs'))
+    known = set(RUNTIME_CONTEXT)
+    known.update("config:%s" % key for key in inputs.keys())
+    for section in manifest.sections():
+        known.update("%s:%s" % (section, option) for option in manifest.options(section))
+    for feature in features:
+        known.update("%s:%s" % (feature, key) for key in RUNTIME_FEATURE_CONTEXT)
+    problems = []
+    for section in manifest.sections():
+        for option, value in manifest.items(section):
+            for reference in REFERENCE_REGEX.findall(value.replace("%%", "")):
+                if reference.split("|")[0] not in known:
+                    problems.append(_problem(
+                        ERROR, None if section == 'config' else section,
+                        "Option %s references %%(%s)s, which does not exist!" % (option, reference)))
+    return problems
+
+
+def _validate_depends(manifest, features):
+    """ return a problem for each missing dependency, and for the features that are cyclic """
+    depends = {}
+    problems = []
+    for feature in features:
+        depends[feature] = []
+        if manifest.has_option(feature, 'depends'):
+            for dependency in (d.strip() for d in re.split('\n|,', manifest.get(feature, 'depends'))):
+                if dependency in depends[feature] or not dependency:
+                    continue
+                if dependency not in features:
+                    problems.append(_problem(ERROR, feature, "Depends on %s, which does not exist!" % dependency))
+                else:
+                    depends[feature].append(dependency)
+    ordered = set()
+    remaining = list(features)
+    while remaining:
+        ready = [f for f in remaining if all(d in ordered for d in depends[f])]
+        if not ready:
+            problems.append(_problem(ERROR, None, "The dependencies of %s are cyclic, or depend on a cycle!" %
+                                     ", ".join(remaining)))
+            break
+        ordered.update(ready)
+        remaining = [f for f in remaining if f not in ordered]
+    return problems
+
+
+def _problem(level, feature, message):
+    return {'level': level, 'feature': feature, 'message': message}
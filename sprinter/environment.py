@@ -4,17 +4,22 @@ import os
 import sys
 import getpass
 from six import reraise
-from io import StringIO
 from functools import wraps
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 
 import sprinter.lib as lib
 from sprinter.core import PHASE, load_global_config, Directory, Injections, Manifest, load_manifest, FeatureDict
+from sprinter.core.bundle import ActivationBundle
+from sprinter.core.journal import Journal, COMPLETE
+from sprinter.core.plan import plan_features
 from sprinter.core.templates import shell_utils_template, source_template, warning_template
 from sprinter.core.messages import REMOVE_WARNING, INVALID_MANIFEST
-from sprinter.lib import system
+from sprinter.lib import instrumentation, system
+from sprinter.lib.debuglog import DebugLog
 from sprinter.exceptions import SprinterException, FormulaException
 from sprinter.external import brew
+from sprinter.external.pippuppet import Pip
 
 
 def warmup(f):
@@ -66,6 +71,9 @@ for shell, shell_config in SHELL_CONFIG.items():
 
 CONFIG_FILES = RC_FILES + ENV_FILES
 
+# the number of namespaces update_namespaces updates at once
+UPDATE_JOBS = 4
+
 
 class Environment(object):
 
@@ -86,10 +94,17 @@ class Environment(object):
     shell_util_path = None  # the path to the shell utils file
     error_occured = False
     _errors = []  # list to keep all the errors
+    _debug_log = None  # the debug log, when the environment built its logger
     sandboxes = []  # a list of package managers to sandbox (brew)
     # specifies where to get the global sprinter root
     global_config = None  # configuration file, which defaults to loading from SPRINTER_ROOT/.global/config.cfg
     ignore_errors = False  # ignore errors in features
+    clean = False  # remove a failed install, instead of keeping it to resume
+    formula_dict = None  # formula classes, shared with other environments
+    pip = None  # the pip formulas are installed with, shared with other environments
+    # if true, the bin path is prepended to the PATH of commands per thread (with
+    # lib.command.path_prepended) instead of to the PATH of the process
+    isolate_path = False
 
     def __init__(self,
                  logger=None,
@@ -111,11 +126,14 @@ class Environment(object):
         self.root = root or os.path.expanduser(os.path.join("~", ".%s" % self.sprinter_namespace))
 
         self.ignore_errors = ignore_errors
+        self._errors = []
 
         # path to the directory to install global files
         self.global_path = os.path.join(self.root, ".global")
         self.global_config_path = os.path.join(self.global_path, "config.cfg")
         self.global_config = global_config or load_global_config(self.global_config_path)
+        if self._debug_log:
+            self._debug_log.log_dir = os.path.join(self.global_path, "logs")
 
         self.shell_util_path = os.path.join(self.global_path, "utils.sh")
         self.main_manifest = None
@@ -126,30 +144,60 @@ class Environment(object):
 
     @warmup
     def install(self):
-        """ Install the environment """
+        """
+        Install the environment. The progress of the install is kept
+        in a journal, so an install that failed is resumed from the
+        failed feature, unless clean is set.
+        """
         self.phase = PHASE.INSTALL
-        if not self.directory.new:
+        journal = Journal(self.directory.root_dir)
+        resume = not self.directory.new and journal.exists()
+        if resume and (self.clean or journal.source() != self._target_source()):
+            self.logger.info("Removing unfinished installation %s..." % self.namespace)
+            self.directory.remove()
+            self.directory = Directory(self.directory.root_dir,
+                                       shell_util_path=self.shell_util_path)
+            resume = False
+        if not self.directory.new and not resume:
             self.logger.info("Namespace %s directory already exists!" % self.namespace)
             self.source = load_manifest(self.directory.manifest_path)
             return self.update()
         try:
-            self.logger.info("Installing environment %s..." % self.namespace)
+            if resume:
+                self.logger.info("Resuming installation of environment %s..." % self.namespace)
+            else:
+                self.logger.info("Installing environment %s..." % self.namespace)
             self.directory.initialize()
             self.install_sandboxes()
             self.instantiate_features()
+            if resume:
+                for k, v in journal.inputs().items():
+                    self.target.set_input(k, v)
             self.grab_inputs()
+            if not resume:
+                journal.begin(self._target_source(),
+                              self.target.inputs.write_values() if self.target else {})
             self._specialize()
+            self._prepare_sync([f for f in self.features.run_order
+                                if not journal.is_complete(f[0])])
             for feature in self.features.run_order:
-                self.run_action(feature, 'sync')
+                self._sync_journaled(journal, feature)
             self.inject_environment_config()
             self._finalize()
+            journal.remove()
         except Exception:
             self.logger.debug("", exc_info=sys.exc_info())
             self.logger.info("An error occured during installation!")
             if not self.ignore_errors:
-                self.clear_all()
-                self.logger.info("Removing installation %s..." % self.namespace)
-                self.directory.remove()
+                if self.clean or not journal.exists():
+                    self.clear_all()
+                    self.logger.info("Removing installation %s..." % self.namespace)
+                    self.directory.remove()
+                else:
+                    for feature_name in journal.unfinished():
+                        self._rollback_feature(feature_name)
+                    self.logger.info("Run the install again to resume it, " +
+                                     "or with --clean to remove installation %s." % self.namespace)
                 et, ei, tb = sys.exc_info()
                 reraise(et, ei, tb)
 
@@ -158,27 +206,39 @@ class Environment(object):
     def update(self, reconfigure=False):
         """ update the environment """
         try:
-            self.phase = PHASE.UPDATE
-            self.logger.info("Updating environment %s..." % self.namespace)
-            self.install_sandboxes()
-            self.instantiate_features()
-            # We don't grab inputs, only on install
-            # updates inputs are grabbed on demand
-            # self.grab_inputs(reconfigure=reconfigure)
-            if reconfigure:
-                self.grab_inputs(reconfigure=True)
-            else:
-                self._copy_source_to_target()
-            self._specialize(reconfigure=reconfigure)
-            for feature in self.features.run_order:
-                self.run_action(feature, 'sync')
-            self.inject_environment_config()
-            self._finalize()
+            self._prepare_update(reconfigure=reconfigure)
+            self._sync_update()
         except Exception:
             self.logger.debug("", exc_info=sys.exc_info())
             et, ei, tb = sys.exc_info()
             reraise(et, ei, tb)
 
+    def _prepare_update(self, reconfigure=False, grab_inputs=False):
+        """
+        the part of an update that may prompt: instantiating, resolving
+        and prompting the features. If grab_inputs is true, unset inputs
+        are prompted for now instead of when they are used.
+        """
+        self.phase = PHASE.UPDATE
+        self.logger.info("Updating environment %s..." % self.namespace)
+        self.install_sandboxes()
+        self.instantiate_features()
+        # We don't grab inputs, only on install
+        # updates inputs are grabbed on demand
+        if reconfigure or grab_inputs:
+            self.grab_inputs(reconfigure=reconfigure)
+        else:
+            self._copy_source_to_target()
+        self._specialize(reconfigure=reconfigure)
+
+    def _sync_update(self):
+        """ the part of an update that syncs the features, once they are prepared """
+        self._prepare_sync()
+        for feature in self.features.run_order:
+            self.run_action(feature, 'sync')
+        self.inject_environment_config()
+        self._finalize()
+
     @warmup
     @install_required
     def remove(self):
@@ -197,6 +257,9 @@ class Environment(object):
             self.clear_all()
             self.directory.remove()
             self.injections.commit()
+            bundle = ActivationBundle(self.global_path)
+            bundle.deactivate(self.namespace)
+            bundle.write()
             if self.error_occured:
                 self.logger.error(warning_template)
                 self.logger.error(REMOVE_WARNING)
@@ -261,6 +324,17 @@ class Environment(object):
         for feature in self.features.run_order:
             self.run_action(feature, 'validate', run_if_error=True)
 
+    @warmup
+    def plan(self):
+        """
+        Return the plan of what syncing the source to the target would
+        do, per feature and option. Nothing is installed or prompted
+        for, and formulas that aren't installed aren't downloaded.
+        """
+        features = FeatureDict(self, self.source, self.target, self.global_path,
+                               install_formulas=False)
+        return plan_features(features)
+
     @warmup
     def inject_environment_config(self):
         if not self.do_inject_environment_config:
@@ -325,7 +399,9 @@ class Environment(object):
             return
         self.features = FeatureDict(self,
                                     self.source, self.target,
-                                    self.global_path)
+                                    self.global_path,
+                                    formula_dict=self.formula_dict,
+                                    pip=self.pip)
 
     def run_feature(self, feature, action):
         for k in self.features.run_order:
@@ -336,9 +412,11 @@ class Environment(object):
         """ Write the debug log to a file """
         with open(file_path, "wb+") as fh:
             fh.write(system.get_system_info().encode('utf-8'))
-            # writing to debug stream
-            self._debug_stream.seek(0)
-            fh.write(self._debug_stream.read().encode('utf-8'))
+            if self._debug_log:
+                self._debug_log.flush()
+                fh.write((self._debug_log.format_records() + "\n").encode('utf-8'))
+                if self._debug_log.path:
+                    fh.write(("The full log of the run is at %s\n" % self._debug_log.path).encode('utf-8'))
             fh.write("The following errors occured:\n".encode('utf-8'))
             for error in self._errors:
                 fh.write((error + "\n").encode('utf-8'))
@@ -363,6 +441,7 @@ class Environment(object):
         """ return a success message, if one exists """
         return self.main_manifest.get('config', 'message_success', default=None)
 
+    @instrumentation.traced('environment')
     def warmup(self):
         """ initialize variables necessary to perform a sprinter action """
         self.logger.debug("Warming up...")
@@ -404,7 +483,8 @@ class Environment(object):
                                                 override="SPRINTER_OVERRIDES")
         # append the bin, in the case sandboxes are necessary to
         # execute commands further down the sprinter lifecycle
-        os.environ['PATH'] = self.directory.bin_path() + ":" + os.environ['PATH']
+        if not self.isolate_path:
+            os.environ['PATH'] = self.directory.bin_path() + ":" + os.environ['PATH']
         self.warmed_up = True
 
     def _inject_config_source(self, source_filename, files_to_inject):
@@ -414,22 +494,36 @@ class Environment(object):
         """
         # src_path = os.path.join(self.directory.root_dir, source_filename)
         # src_exec = "[ -r %s ] && . %s" % (src_path, src_path)
-        src_exec = "[ -r {0} ] && . {0}".format(os.path.join(self.directory.root_dir, source_filename))
+        source_path = os.path.join(self.directory.root_dir, source_filename)
+        injections = self.injections
+        if source_filename in ('.rc', '.env') and self._use_activation_bundle():
+            # every namespace is sourced through the global bundle instead
+            bundle = ActivationBundle(self.global_path)
+            source_path = bundle.rc_path if source_filename == '.rc' else bundle.env_path
+            injections = self.global_injections
+        src_exec = "[ -r {0} ] && . {0}".format(source_path)
         # The ridiculous construction above is necessary to avoid failing tests(!)
 
         for config_file in files_to_inject:
             config_path = os.path.expanduser(os.path.join("~", config_file))
             if os.path.exists(config_path):
-                self.injections.inject(config_path, src_exec)
+                injections.inject(config_path, src_exec)
                 break
         else:
             config_file = files_to_inject[0]
             config_path = os.path.expanduser(os.path.join("~", config_file))
             self.logger.info("No config files found to source %s, creating ~/%s!" % (source_filename, config_file))
-            self.injections.inject(config_path, src_exec)
+            injections.inject(config_path, src_exec)
+        if injections is not self.injections:
+            self.injections.clear(config_path)
 
         return (config_file, config_path)
 
+    def _use_activation_bundle(self):
+        return (self.global_config.has_option('global', 'activation_bundle') and
+                lib.is_affirmative(self.global_config.get('global', 'activation_bundle')))
+
+    @instrumentation.traced('environment')
     def _finalize(self):
         """ command to run at the end of sprinter's run """
         self.logger.info("Finalizing...")
@@ -457,6 +551,14 @@ class Environment(object):
         with open(self.shell_util_path, 'w+') as fh:
             fh.write(shell_utils_template)
 
+        self.logger.debug("Writing activation bundle...")
+        bundle = ActivationBundle(self.global_path)
+        if self.phase == PHASE.DEACTIVATE:
+            bundle.deactivate(self.namespace)
+        else:
+            bundle.activate(self.namespace, self.directory.root_dir)
+        bundle.write()
+
         if self.error_occured:
             raise SprinterException("Error occured!")
 
@@ -474,17 +576,18 @@ class Environment(object):
 
     def _build_logger(self, level=logging.INFO):
         """ return a logger. if logger is none, generate a logger from stdout """
-        self._debug_stream = StringIO()
         logger = logging.getLogger('sprinter')
+        for handler in [h for h in logger.handlers if isinstance(h, DebugLog)]:
+            # only the debug log of the latest environment is kept
+            logger.removeHandler(handler)
+            handler.close()
         # stdout log
         out_hdlr = logging.StreamHandler(sys.stdout)
         out_hdlr.setLevel(level)
         logger.addHandler(out_hdlr)
         # debug log
-        debug_hdlr = logging.StreamHandler(self._debug_stream)
-        debug_hdlr.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
-        debug_hdlr.setLevel(logging.DEBUG)
-        logger.addHandler(debug_hdlr)
+        self._debug_log = DebugLog()
+        logger.addHandler(self._debug_log)
         logger.setLevel(logging.DEBUG)
         return logger
 
@@ -516,7 +619,8 @@ class Environment(object):
         error = None
         instance = self.features[feature]
         try:
-            getattr(instance, action)()
+            with instrumentation.action(self.namespace, feature[0], action):
+                getattr(instance, action)()
         # catch a generic exception within a feature
         except Exception:
             e = sys.exc_info()[1]
@@ -550,6 +654,7 @@ class Environment(object):
             self.log.error(message)
             raise SprinterException("invalid manifest!")
 
+    @instrumentation.traced('environment')
     def _specialize(self, reconfigure=False):
         """ Add variables and specialize contexts """
         # add in the 'root_dir' directories to the context dictionaries
@@ -570,6 +675,68 @@ class Environment(object):
             if instance.target:
                 self.run_action(feature, 'prompt')
 
+    @instrumentation.traced('environment')
+    def _prepare_sync(self, features=None):
+        """ Let each formula prepare all of its features at once, before they sync """
+        formula_instances = []
+        for feature in (self.features.run_order if features is None else features):
+            instance = self.features[feature]
+            prepare_sync = getattr(type(instance), 'prepare_sync', None)
+            if prepare_sync is None or len(self._error_dict[feature]) > 0:
+                continue
+            for formula_class, instances in formula_instances:
+                if formula_class is type(instance):
+                    instances.append(instance)
+                    break
+            else:
+                formula_instances.append((type(instance), [instance]))
+        for formula_class, instances in formula_instances:
+            try:
+                formula_class.prepare_sync(instances)
+            except Exception:
+                # the features will sync on their own instead
+                self.logger.info("Unable to prepare features for %s!" % formula_class.__name__)
+                self.logger.debug("Exception", exc_info=sys.exc_info())
+
+    def _sync_journaled(self, journal, feature):
+        """
+        sync a feature, recording its progress in the journal. A feature
+        the journal has as complete isn't synced again, only its shell
+        configuration is added back.
+        """
+        feature_name = feature[0]
+        entry = journal.feature(feature_name)
+        if entry and entry['status'] == COMPLETE:
+            self.logger.info("%s was already installed, skipping..." % feature_name)
+            self.directory.add_config(entry['config'])
+            return
+        if entry:
+            # the feature was interrupted by a previous run
+            self._rollback_feature(feature_name)
+        journal.start(feature_name)
+        config_position = len(self.directory.config_log)
+        try:
+            self.run_action(feature, 'sync')
+        except Exception:
+            journal.fail(feature_name)
+            raise
+        artifacts = self.directory.owned_paths(feature_name)
+        if os.path.exists(self.directory.install_directory(feature_name)):
+            artifacts.append(self.directory.install_directory(feature_name))
+        journal.complete(feature_name, self.directory.config_log[config_position:], artifacts)
+
+    def _rollback_feature(self, feature_name):
+        """ remove the partial changes of a feature that didn't finish installing """
+        self.logger.info("Rolling back %s..." % feature_name)
+        try:
+            self.directory.remove_feature(feature_name)
+        except Exception:
+            self.logger.warn("Unable to roll back %s!" % feature_name)
+            self.logger.debug("Exception", exc_info=sys.exc_info())
+
+    def _target_source(self):
+        return self.target.source() if isinstance(self.target, Manifest) else None
+
     def _copy_source_to_target(self):
         """ copy source user configuration to target """
         if self.source and self.target:
@@ -582,3 +749,80 @@ class Environment(object):
         self._copy_source_to_target()
         if self.target:
             self.target.grab_inputs(force=reconfigure)
+
+
+def update_namespaces(namespaces, environment, jobs=UPDATE_JOBS, reconfigure=False,
+                      username=None, password=None, verify_certificate=True):
+    """
+    Update several namespaces, up to jobs at a time. Each namespace is
+    updated by its own Environment, sharing the global configuration,
+    logger and formulas of environment. Returns the (namespace, error)
+    of each namespace in order, where error is None if it was updated.
+
+    Only syncing runs in parallel: the namespaces are resolved and
+    prompted for one at a time first, including for inputs that aren't
+    set yet, so prompts never read stdin at the same time. Packages are
+    installed by one namespace at a time (see packagemanager.install_lock),
+    as package managers lock their database and sudo prompts on the
+    terminal. The bin path of each namespace is only prepended to the
+    commands it calls.
+    """
+    formula_dict = {}
+    pip = Pip(environment.global_path)
+    pip.delete_all_eggs()
+    errors = {}
+
+    def prepare(namespace):
+        env = Environment(logger=environment.logger,
+                          root=environment.root,
+                          sprinter_namespace=environment.sprinter_namespace,
+                          global_config=environment.global_config,
+                          ignore_errors=environment.ignore_errors)
+        env.formula_dict = formula_dict
+        env.pip = pip
+        env.namespace = namespace
+        env.isolate_path = True
+        env.directory = Directory(os.path.join(env.root, namespace),
+                                  shell_util_path=env.shell_util_path)
+        env.source = load_manifest(env.directory.manifest_path,
+                                   namespace=namespace, do_inherit=False)
+        env.target = load_manifest(env.source.source(),
+                                   username=username,
+                                   password=password,
+                                   verify_certificate=verify_certificate)
+        env.warmup()
+        if env.directory.new:
+            raise SprinterException("Namespace %s is not yet installed!" % namespace)
+        with lib.path_prepended(env.directory.bin_path()):
+            env._prepare_update(reconfigure=reconfigure, grab_inputs=True)
+        return env
+
+    def sync(env):
+        try:
+            with lib.path_prepended(env.directory.bin_path()):
+                env._sync_update()
+        except Exception:
+            errors[env.namespace] = _describe_error(environment.logger)
+
+    prepared = []
+    for namespace in namespaces:
+        try:
+            prepared.append(prepare(namespace))
+        except Exception:
+            errors[namespace] = _describe_error(environment.logger)
+
+    if prepared:
+        pool = ThreadPool(max(1, min(jobs, len(prepared))))
+        try:
+            pool.map(sync, prepared)
+        finally:
+            pool.close()
+            pool.join()
+    return [(namespace, errors.get(namespace)) for namespace in namespaces]
+
+
+def _describe_error(logger):
+    """ log the exception being handled, and return it as a message """
+    e = sys.exc_info()[1]
+    logger.debug("", exc_info=sys.exc_info())
+    return str(e) or type(e).__name__
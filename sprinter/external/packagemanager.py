@@ -0,0 +1,220 @@
+"""
+Utility methods for the native package managers (apt-get, yum,
+pacman and brew)
+"""
+from __future__ import unicode_literals
+import json
+import logging
+import os
+import re
+import threading
+
+from sprinter import lib
+from sprinter.lib import system
+
+logger = logging.getLogger(__name__)
+
+# held while installing packages: package managers lock their database,
+# and sudo prompts for a password on the terminal, so environments
+# updated in parallel install one at a time
+install_lock = threading.Lock()
+
+# name: (install arguments, sudo required, installed query command)
+PACKAGE_MANAGERS = {
+    'apt-get': (" -y install", True, "dpkg-query -W -f=${Package}|${Status}\\n"),
+    'yum': (" install", True, "rpm -q --qf %{NAME}\\n"),
+    'pacman': (" --noconfirm -S", True, "pacman -Q"),
+    'brew': (" install", False, "brew list -1"),
+}
+
+# commands listing every installed package, in the same format as the queries
+LIST_ALL_COMMANDS = {
+    'apt-get': "dpkg-query -W -f=${Package}|${Status}\\n",
+    'yum': "rpm -qa --qf %{NAME}\\n",
+    'pacman': "pacman -Q",
+    'brew': "brew list -1",
+}
+
+# the package databases, which change whenever a package is installed or removed
+PACKAGE_DATABASES = {
+    'apt-get': ["/var/lib/dpkg/status"],
+    'yum': ["/var/lib/rpm/rpmdb.sqlite", "/var/lib/rpm/Packages"],
+    'pacman': ["/var/lib/pacman/local"],
+    'brew': ["/usr/local/Cellar", "/opt/homebrew/Cellar"],
+}
+
+
+class PackageManager(object):
+    """ A native package manager, and how to call it """
+
+    def __init__(self, name):
+        self.name = name
+        self.args, self.sudo_required, self.query_command = PACKAGE_MANAGERS[name]
+
+    def install_command(self, packages):
+        """ return the command to install all of the packages in one transaction """
+        command = "%s%s %s" % (self.name, self.args, " ".join(packages))
+        if self.sudo_required:
+            command = "sudo " + command
+        return command
+
+    def install(self, packages):
+        """ install the packages in one transaction, returning the return code """
+        command = self.install_command(packages)
+        logger.debug("Calling command: %s" % command)
+        # it's not possible to retain remember sudo privileges across shells unless they pipe
+        # to STDOUT. Nothing we can do about that for now.
+        with install_lock:
+            return lib.call(command, output_log_level=logging.DEBUG, stdout=None)[0]
+
+    def query_installed(self, packages):
+        """ return the set of packages that are already installed """
+        if not packages:
+            return set()
+        names = dict((package_name(p), p) for p in packages)
+        command = self.query_command
+        if self.name != 'brew':
+            command += " " + " ".join(sorted(names))
+        try:
+            output = lib.call(command, output_log_level=logging.DEBUG)[1] or b""
+        except (OSError, lib.CommandMissingException):
+            logger.debug("Unable to query installed packages with %s" % command)
+            return set()
+        installed = set()
+        for line in output.decode('utf-8', 'replace').splitlines():
+            name = self._parse_installed_line(line)
+            if name in names:
+                installed.add(names[name])
+        return installed
+
+    def list_installed(self):
+        """ return the set of every installed package """
+        try:
+            output = lib.call(LIST_ALL_COMMANDS[self.name], output_log_level=logging.DEBUG)[1] or b""
+        except (OSError, lib.CommandMissingException):
+            logger.debug("Unable to list installed packages with %s" % self.name)
+            return set()
+        installed = set()
+        for line in output.decode('utf-8', 'replace').splitlines():
+            name = self._parse_installed_line(line)
+            if name:
+                installed.add(name)
+        return installed
+
+    def _parse_installed_line(self, line):
+        """ return the package name for a line of query output, if it is installed """
+        if self.name == 'apt-get':
+            name, _, status = line.partition('|')
+            return name if status.strip() == "install ok installed" else None
+        if self.name == 'yum':
+            return line.strip() if line.strip() and " " not in line.strip() else None
+        if self.name == 'pacman':
+            parts = line.split()
+            return parts[0] if len(parts) == 2 and not line.startswith("error") else None
+        return line.strip() or None
+
+
+class InstalledPackageIndex(object):
+    """
+    An index of the packages installed on the system, cached to disk.
+
+    The index is only rebuilt when the package manager's database has
+    been modified since it was cached, so lookups never have to call
+    out to the package manager.
+    """
+
+    def __init__(self, manager, cache_path):
+        self.manager = manager
+        self.cache_path = cache_path
+        self._packages = None
+        self._database_mtime = None
+
+    def is_installed(self, package):
+        """ return true if the package is installed """
+        self.refresh()
+        return package_name(package) in self._packages
+
+    def missing(self, packages):
+        """ return the packages that are not installed, in order """
+        self.refresh()
+        return [p for p in packages if package_name(p) not in self._packages]
+
+    def refresh(self, force=False):
+        """ rebuild the index if the package database has changed """
+        database_mtime = self._get_database_mtime()
+        if not force and self._packages is not None and database_mtime == self._database_mtime:
+            return
+        cache = self._read_cache()
+        entry = cache.get(self.manager.name)
+        if (not force and entry and database_mtime is not None
+                and entry.get('mtime') == database_mtime):
+            self._packages = set(entry['packages'])
+        else:
+            logger.debug("Indexing installed %s packages..." % self.manager.name)
+            self._packages = self.manager.list_installed()
+            cache[self.manager.name] = {'mtime': database_mtime,
+                                        'packages': sorted(self._packages)}
+            self._write_cache(cache)
+        self._database_mtime = database_mtime
+
+    def _get_database_mtime(self):
+        for path in PACKAGE_DATABASES.get(self.manager.name, []):
+            if os.path.exists(path):
+                return os.stat(path).st_mtime
+        return None
+
+    def _read_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as fh:
+                return json.load(fh)
+        except ValueError:
+            return {}
+
+    def _write_cache(self, cache):
+        parent_directory = os.path.dirname(self.cache_path)
+        if not os.path.exists(parent_directory):
+            os.makedirs(parent_directory)
+        with open(self.cache_path, 'w+') as fh:
+            fh.write(json.dumps(cache, sort_keys=True))
+
+
+_indexes = {}
+
+
+def get_installed_index(manager, cache_path):
+    """ return the installed package index for the manager, shared within the process """
+    key = (manager.name, cache_path)
+    if key not in _indexes:
+        _indexes[key] = InstalledPackageIndex(manager, cache_path)
+    return _indexes[key]
+
+
+def get_package_manager():
+    """ return the package manager for the current system, or None if unavailable """
+    name = None
+    if system.is_osx():
+        name = "brew"
+    elif system.is_debian():
+        name = "apt-get"
+    elif system.is_fedora():
+        name = "yum"
+    elif system.is_arch():
+        name = "pacman"
+    if name is None:
+        return None
+    if lib.which(name) is None:
+        logger.warn("Package manager %s not installed! Packages will not be installed." % name)
+        return None
+    return PackageManager(name)
+
+
+def package_name(package):
+    """ strip any version or architecture qualifier from a package """
+    return re.split('[=<>:]', package, 1)[0]
+
+
+def split_packages(packages):
+    """ split a package option into individual packages """
+    return [p for p in re.split('[\s,]+', packages) if p]
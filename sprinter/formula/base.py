@@ -6,22 +6,32 @@ from __future__ import unicode_literals
 import logging
 import os
 
-from sprinter.core import PHASE
+from sprinter.core import PHASE, schema
 from sprinter.exceptions import FormulaException
-from sprinter.lib import system
+from sprinter.lib import instrumentation, system
 import sprinter.lib as lib
 
 
 class FormulaBase(object):
 
-    valid_options = ['rc', 'env', 'gui',
+    valid_options = ['rc', 'rc_lazy', 'rc_lazy_commands', 'env', 'gui',
                      'command', 'systems', 'depends', 'inputs']
     required_options = ['formula']
     deprecated_options = []
+    # the types of options, which values are checked against on validate
+    # and parsed as by FeatureConfig.get_parsed. see sprinter.core.schema
+    option_types = {'systems': schema.LIST}
+    # the values FeatureConfig.get_parsed returns for typed options that aren't set
+    option_defaults = {}
 
     # these values will not carry over from source to target
     dont_carry_over_options = valid_options + required_options
 
+    # changes to these options only change the shell configuration,
+    # which is rewritten on every update, so they require no other work
+    config_only_options = ['rc', 'rc_lazy', 'rc_lazy_commands', 'env', 'gui',
+                           'systems', 'depends', 'inputs']
+
     def __init__(self, environment, feature_name, source=None, target=None):
         """
         In most cases, it is not a good idea to override the formulabase
@@ -38,6 +48,24 @@ class FormulaBase(object):
         if not (source or target):
             raise FormulaException("A formula requires a source and/or a target!")
 
+    @property
+    def source(self):
+        """ the FeatureConfig of the installed feature, if any """
+        return self._source
+
+    @source.setter
+    def source(self, config):
+        self._source = self._with_schema(config)
+
+    @property
+    def target(self):
+        """ the FeatureConfig the feature should be synced to, if any """
+        return self._target
+
+    @target.setter
+    def target(self, config):
+        self._target = self._with_schema(config)
+
     def prompt(self):
         """
         This call should contain as much of the user input as possible. Examples include:
@@ -66,6 +94,9 @@ class FormulaBase(object):
             self.directory.add_to_env(self.target.get('env'))
         if self.target.has('rc'):
             self.directory.add_to_rc(self.target.get('rc'))
+        if self.target.has('rc_lazy'):
+            self.directory.add_lazy_to_rc(self.feature_name, self.target.get('rc_lazy'),
+                                          self.target.get('rc_lazy_commands', '').split())
         if self.target.has('gui'):
             self.directory.add_to_gui(self.target.get('gui'))
         if self.target.has('command'):
@@ -132,17 +163,29 @@ class FormulaBase(object):
         errors should either be reported via self._log_error(), or raise an exception
         """
         if self.target:
-            for k in self.target.keys():
-                if k in self.deprecated_options:
-                    self.logger.warn(
-                        self.deprecated_options[k].format(option=k, feature=self.feature_name))
-                elif (k not in self.valid_options and k not in self.required_options and
-                      '*' not in self.valid_options):
-                    self.logger.warn("Unused option %s in %s!" % (k, self.feature_name))
-            for k in self.required_options:
-                if not self.target.has(k):
-                    self._log_error(
-                        "Required option %s not present in feature %s!" % (k, self.feature_name))
+            option_schema = self.schema()
+            options = list(self.target.keys())
+            for k in option_schema.deprecated_options(options):
+                self.logger.warn(
+                    option_schema.deprecated[k].format(option=k, feature=self.feature_name))
+            for k in option_schema.unknown_options(options):
+                self.logger.warn("Unused option %s in %s!" % (k, self.feature_name))
+            for k in option_schema.missing_options(options):
+                self._log_error(
+                    "Required option %s not present in feature %s!" % (k, self.feature_name))
+            for k in options:
+                if k in option_schema.types:
+                    value = self.target.get(k)
+                    problem = option_schema.check(k, value)
+                    if problem:
+                        message = "Option %s in feature %s should be %s, but is %s!" % (
+                            k, self.feature_name, problem[1], value)
+                        if problem[0] == schema.ERROR:
+                            self._log_error(message)
+                        else:
+                            self.logger.warn(message)
+            if self.target.has('rc_lazy') and not self.target.get('rc_lazy_commands', '').split():
+                self._log_error("rc_lazy requires rc_lazy_commands in feature %s!" % self.feature_name)
 
     # these methods are overwritten less often, and are not recommended to do so.
     def should_run(self):
@@ -151,13 +194,35 @@ class FormulaBase(object):
         config = self.target or self.source
         if config.has('systems'):
             should_run = False
-            valid_systems = [s.lower() for s in config.get('systems').split(",")]
+            valid_systems = [s.lower() for s in config.get_parsed('systems')]
             for system_type, param in [('is_osx', 'osx'),
                                        ('is_debian', 'debian')]:
                 if param in valid_systems and getattr(system, system_type)():
                     should_run = True
         return should_run
 
+    @classmethod
+    def prepare_sync(cls, instances):
+        """
+        prepare_sync is called once per formula, with every instance of
+        the formula in the environment, before any of them are synced.
+
+        Formulas can override it to batch work that is expensive to do
+        once per feature, such as a package manager transaction.
+        """
+
+    @classmethod
+    def schema(cls):
+        """ return the compiled schema of the formula's options """
+        return schema.get_schema(cls)
+
+    def option_requires_work(self, option):
+        """
+        Returns true if a change to the option requires an update to do
+        more than rewrite the shell configuration. Used to plan updates.
+        """
+        return option not in self.config_only_options
+
     def sync_phase(self):
         """ Says whether a sync is an install, update, or delete """
         if not self.source:
@@ -169,6 +234,7 @@ class FormulaBase(object):
     def sync(self):
         """ Updates the state of the feature to what it should be """
         phase = self.sync_phase()
+        instrumentation.annotate(phase=phase.name)
         self.logger.info("%s %s..." % (phase.verb.capitalize(), self.feature_name))
         message = "...finished %s %s." % (phase.verb, self.feature_name)
         result = getattr(self, phase.name)()
@@ -186,6 +252,12 @@ class FormulaBase(object):
                         and not self.target.has(key)):
                     self.target.set(key, self.source.get(key))
 
+    def _with_schema(self, config):
+        """ attach the schema of the formula to a FeatureConfig, so it can parse values """
+        if config:
+            config.schema = self.schema()
+        return config
+
     def _log_error(self, message):
         """ Log an error for the feature """
         key = (self.feature_name, self.target.get('formula'))
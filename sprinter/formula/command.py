@@ -13,6 +13,7 @@ activate=echo 'activating...'
 deactivate=echo 'deactivating...'
 """
 from __future__ import unicode_literals
+from sprinter.core import schema
 from sprinter.formula.base import FormulaBase
 from sprinter.exceptions import FormulaException
 import sprinter.lib as lib
@@ -33,6 +34,10 @@ class CommandFormula(FormulaBase):
                                                  'fail_on_error',
                                                  'shell',
                                                  'redirect_stdout_to_log']
+    option_types = dict(FormulaBase.option_types, fail_on_error=schema.BOOL, shell=schema.BOOL,
+                        redirect_stdout_to_log=schema.BOOL)
+    option_defaults = dict(FormulaBase.option_defaults, fail_on_error=True, shell=False,
+                           redirect_stdout_to_log=True)
 
     def install(self):
         self.__run_command('install', 'target')
@@ -59,9 +64,8 @@ class CommandFormula(FormulaBase):
         if config.has(command_type):
             command = config.get(command_type)
             self.logger.debug("Running %s..." % command)
-            shell = config.has('shell') and config.is_affirmative('shell')
-            stdout = subprocess.PIPE if config.is_affirmative('redirect_stdout_to_log', 'true') else None
-            return_code, output = lib.call(command, shell=shell, stdout=stdout)
-            if config.is_affirmative('fail_on_error', True) and return_code != 0:
+            stdout = subprocess.PIPE if config.get_parsed('redirect_stdout_to_log') else None
+            return_code, output = lib.call(command, shell=config.get_parsed('shell'), stdout=stdout)
+            if config.get_parsed('fail_on_error') and return_code != 0:
                 raise CommandFormulaException("Command returned a return code of {0}!".format(return_code))
             return True
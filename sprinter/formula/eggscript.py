@@ -20,6 +20,7 @@ import re
 import subprocess
 
 import sprinter.lib as lib
+from sprinter.core import schema
 from sprinter.formula.base import FormulaBase
 from sprinter.exceptions import FormulaException
 from virtualenv import file_search_dirs, create_environment as create_virtualenv
@@ -41,6 +42,11 @@ class EggscriptFormula(FormulaBase):
     valid_options = FormulaBase.valid_options + [
         'egg', 'eggs', 'redownload', 'fail_on_error', 'executables'
     ]
+    option_types = dict(FormulaBase.option_types, eggs=schema.LIST, executables=schema.LIST,
+                        redownload=schema.BOOL, fail_on_error=schema.BOOL,
+                        redirect_stdout_to_log=schema.BOOL)
+    option_defaults = dict(FormulaBase.option_defaults, eggs=(), executables=(), redownload=False,
+                           fail_on_error=True, redirect_stdout_to_log=True)
 
     def install(self):
         create_virtualenv(self.directory.install_directory(self.feature_name),
@@ -53,7 +59,7 @@ class EggscriptFormula(FormulaBase):
         acted = False
         if (self.source.get('egg', '') != self.target.get('egg', '') or
             self.source.get('eggs', '') != self.target.get('eggs', '') or
-            (self.target.has('redownload') and self.target.is_affirmative('redownload'))):
+            self.target.get_parsed('redownload')):
                 self.__install_eggs(self.target)
                 acted = True
         self.__add_paths(self.target)
@@ -79,9 +85,8 @@ class EggscriptFormula(FormulaBase):
         if config.has('egg'):
             eggs.append(self.__polish_egg(config.get('egg')))
 
-        if config.has('eggs'):
-            for egg in re.split(',(?!<)|\n', config.get('eggs')):
-                eggs.append(self.__polish_egg(egg))
+        for egg in config.get_parsed('eggs'):
+            eggs.append(self.__polish_egg(egg))
         return eggs
 
     def __load_carton(self, egg_carton, eggs):
@@ -91,7 +96,7 @@ class EggscriptFormula(FormulaBase):
 
     def __prepare_eggs(self, egg_carton, config):
         stdout = None
-        if config.is_affirmative('redirect_stdout_to_log', 'true'):
+        if config.get_parsed('redirect_stdout_to_log'):
             stdout = subprocess.PIPE
 
         egg_recipe = "PYTHONPATH='' bin/pip install -r {filename} --upgrade".format(filename=egg_carton[1])
@@ -102,7 +107,7 @@ class EggscriptFormula(FormulaBase):
                                        stdout=stdout)
 
         if return_code != 0:
-            if config.is_affirmative('fail_on_error', True):
+            if config.get_parsed('fail_on_error'):
                 raise EggscriptFormulaException("""
 Egg script {name} returned a return code of {code}!
 
@@ -138,7 +143,4 @@ end pip install output ==============================================
 
     @staticmethod
     def _get_whitelisted_executables(config):
-        whitelist = config.get("executables", "")
-        if not whitelist:
-            return None
-        return [ex.strip() for ex in re.split(',(?!<)|\n', whitelist)]
+        return config.get_parsed('executables') or None
@@ -15,6 +15,8 @@ from sprinter.formula.base import FormulaBase
 class EnvFormula(FormulaBase):
     """ A sprinter formula for setting environment variables"""
 
+    # every other option is an environment variable
+    valid_options = FormulaBase.valid_options + ['*']
     # the keys that should be ignored during write loop (anything that has meaning elsewhere)
     ignored_keys = FormulaBase.valid_options + FormulaBase.required_options
 
@@ -31,3 +33,7 @@ class EnvFormula(FormulaBase):
     def validate(self):
         # all config values are valid
         pass
+
+    def option_requires_work(self, option):
+        # every other option is an environment variable
+        return option == 'command'
@@ -5,11 +5,25 @@ Installs a package from whatever the native package manager is
 formula = sprinter.formula.package
 apt-get = git
 brew = git
+
+the installed packages are indexed in the global sprinter directory
+(and re-indexed whenever the package database changes), so updates
+reinstall packages that were removed by hand, and validate reports
+any that are missing.
+
+before syncing, the packages of every package feature are gathered,
+the installed ones are queried for once, and the missing ones are
+installed in a single package manager transaction. If it fails, the
+packages still missing are installed again feature by feature (and
+package by package for features that fail again), so only the features
+whose packages can't be installed fail.
 """
 from __future__ import unicode_literals
 import logging
+import os
 from sprinter import lib
-from sprinter.lib import system
+from sprinter.core import PHASE
+from sprinter.external import packagemanager
 from sprinter.formula.base import FormulaBase
 from sprinter.exceptions import FormulaException
 
@@ -22,25 +36,104 @@ class PackageFormula(FormulaBase):
 
     valid_options = FormulaBase.valid_options + ['apt-get', 'brew', 'yum', 'pacman']
 
+    # set by prepare_sync, if the packages were installed in a batch
+    batched = False
+    failed_packages = None
+
+    @classmethod
+    def prepare_sync(cls, instances):
+        """
+        Install the packages of every feature in one transaction.
+        Features are told which of their packages failed, and report
+        it when they sync.
+        """
+        manager = packagemanager.get_package_manager()
+        prepared, wanted = [], {}
+        for instance in instances:
+            instance._set_package_manager(manager)
+            if manager and instance.sync_phase() in (PHASE.INSTALL, PHASE.UPDATE):
+                prepared.append(instance)
+                if instance._requires_install():
+                    wanted[instance] = packagemanager.split_packages(
+                        instance.target.get(manager.name, ""))
+        all_packages = sorted(set(p for packages in wanted.values() for p in packages))
+        missing = []
+        if all_packages:
+            missing = prepared[0]._installed_index().missing(all_packages)
+        if missing:
+            logging.getLogger("sprinter.formula." + cls.__name__).info(
+                "Installing %s..." % " ".join(missing))
+            if manager.install(missing) != 0:
+                # the transaction is rolled back as a whole, so whatever is
+                # still missing is installed again by the features that want it
+                installed = manager.query_installed(missing)
+                for instance in sorted(wanted, key=lambda i: i.feature_name):
+                    still_missing = [p for p in wanted[instance]
+                                     if p in missing and p not in installed]
+                    if still_missing and manager.install(still_missing) != 0:
+                        # and then package by package, to report the ones that failed
+                        for package in still_missing:
+                            manager.install([package])
+                    installed.update(manager.query_installed(still_missing))
+                    instance.failed_packages = [p for p in still_missing if p not in installed]
+        # only once the transaction is done do the features skip installing on their own
+        for instance in prepared:
+            instance.batched = True
+
     def install(self):
         self.__get_package_manager()
-        self.__install_package(self.target)
+        if self.batched:
+            self.__check_batch()
+        else:
+            self.__install_package(self.target)
         FormulaBase.install(self)
         return True
 
     def update(self):
         self.__get_package_manager()
-        install_package = False
-        if self.package_manager and self.target.has(self.package_manager):
-            if not self.source.has(self.package_manager):
-                install_package = True
-            if self.source.get(self.package_manager) != self.target.get(self.package_manager):
-                install_package = True
+        install_package = self._requires_install()
         if install_package:
-            self.__install_package(self.target)
+            if self.batched:
+                self.__check_batch()
+            else:
+                self.__install_package(self.target)
         FormulaBase.update(self)
         return install_package
 
+    def validate(self):
+        FormulaBase.validate(self)
+        if self.environment.phase == PHASE.VALIDATE and self.target:
+            self.__get_package_manager()
+            if self.package_manager and self.target.has(self.package_manager):
+                missing = self._installed_index().missing(
+                    packagemanager.split_packages(self.target.get(self.package_manager)))
+                if missing:
+                    self._log_error("Package(s) %s are not installed!" % ", ".join(missing))
+
+    def _requires_install(self):
+        """ return true if the packages for the target need to be installed """
+        if self.sync_phase() == PHASE.INSTALL:
+            return True
+        if self.package_manager and self.target.has(self.package_manager):
+            if not self.source.has(self.package_manager):
+                return True
+            if self.source.get(self.package_manager) != self.target.get(self.package_manager):
+                return True
+            # packages removed outside of sprinter are reinstalled
+            packages = packagemanager.split_packages(self.target.get(self.package_manager))
+            if self._installed_index().missing(packages):
+                return True
+        return False
+
+    def _installed_index(self):
+        return packagemanager.get_installed_index(
+            self._manager, os.path.join(self.environment.global_path, "package_index.json"))
+
+    def __check_batch(self):
+        if self.failed_packages:
+            raise PackageFormulaException(
+                "Unable to install package(s) %s!" % ", ".join(self.failed_packages))
+
     def __install_package(self, config):
         if self.package_manager and config.has(self.package_manager):
             package = config.get(self.package_manager)
@@ -51,32 +144,18 @@ class PackageFormula(FormulaBase):
             self.logger.debug("Calling command: %s" % call_command)
             # it's not possible to retain remember sudo privileges across shells unless they pipe
             # to STDOUT. Nothing we can do about that for now.
-            lib.call(call_command, output_log_level=logging.DEBUG, stdout=None)
+            with packagemanager.install_lock:
+                lib.call(call_command, output_log_level=logging.DEBUG, stdout=None)
 
     def __get_package_manager(self):
         """
         Installs and verifies package manager
         """
-        package_manager = ""
-        args = ""
-        sudo_required = True
-        if system.is_osx():
-            package_manager = "brew"
-            sudo_required = False
-            args = " install"
-        elif system.is_debian():
-            package_manager = "apt-get"
-            args = " -y install"
-        elif system.is_fedora():
-            package_manager = "yum"
-            args = " install"
-        elif system.is_arch():
-            package_manager = "pacman"
-            args = " --noconfirm -S"
-        if lib.which(package_manager) is None:
-            self.logger.warn("Package manager %s not installed! Packages will not be installed."
-                             % package_manager)
-            self.package_manager = None
-        self.package_manager = package_manager
-        self.sudo_required = sudo_required
-        self.args = args
+        if not hasattr(self, 'package_manager'):
+            self._set_package_manager(packagemanager.get_package_manager())
+
+    def _set_package_manager(self, manager):
+        self._manager = manager
+        self.package_manager = manager.name if manager else None
+        self.sudo_required = manager.sudo_required if manager else False
+        self.args = manager.args if manager else ""
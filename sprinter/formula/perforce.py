@@ -15,11 +15,25 @@ client = %(config:node)s
 write_password_p4settings = true
 overwrite_p4settings = false
 overwrite_client = false
+versions_file = ~/perforce_versions.json
+
+the urls of p4 and p4v for each version are read from
+perforce_versions.json, next to this formula. versions_file can point
+to another file in the same format, which is merged over it to add
+versions. Each entry is either a path relative to url_prefix, or an
+object with a path and a checksum (sha256:<hex>) to validate against.
+
+p4 and p4v are fetched concurrently through the download cache in the
+global sprinter directory, and are not fetched at all when the
+installed copy already matches the checksum. Cached downloads of
+entries without a checksum are revalidated with their ETag.
 """
 from __future__ import unicode_literals
+import json
 import os
 import re
 import shutil
+from multiprocessing.pool import ThreadPool
 import sprinter.lib as lib
 from sprinter.lib import system
 from sprinter.core import PHASE
@@ -27,25 +41,8 @@ from sprinter.exceptions import FormulaException
 from sprinter.formula.base import FormulaBase
 
 P4V_APPLICATIONS = ['p4v.app', 'p4admin.app', 'p4merge.app']
-url_prefix = "http://filehost.perforce.com/perforce/"
-package_dict = {
-    "r10.1": {
-        "osx": {
-            "p4": "r10.1/bin.macosx104u/p4",
-            "p4v": "r10.1/bin.macosx104u/P4V.dmg"},
-        "linux": {
-            "p4": "r10.1/bin.linux26x86_64/p4",
-            "p4v": "r10.1/bin.linux26x86_64/p4v.tgz"}
-    },
-    "r13.2": {
-        "osx": {
-            "p4": "r13.2/bin.macosx105x86_64/p4",
-            "p4v": "r13.2/bin.macosx106x86_64/P4V.dmg"},
-        "linux": {
-            "p4": "r13.2/bin.linux26x86_64/p4",
-            "p4v": "r13.2/bin.linux26x86_64/p4v.tgz"}
-    }
-}
+VERSIONS_PATH = os.path.join(os.path.dirname(__file__), "perforce_versions.json")
+P4V_MARKER = ".sprinter-p4v"
 
 WRITE_P4PASSWD_MESSAGE = """
 Insert the perforce password to your p4settings?
@@ -64,7 +61,8 @@ class PerforceFormula(FormulaBase):
                                                  'overwrite_p4settings',
                                                  'overwrite_client',
                                                  'client_default',
-                                                 'client']
+                                                 'client',
+                                                 'versions_file']
 
     required_options = FormulaBase.required_options + ['version', 'root_path',
                                                        'username', 'password',
@@ -120,7 +118,6 @@ class PerforceFormula(FormulaBase):
     def update(self):
         acted = False
         if self.source.get('version', 'r13.2') != self.target.get('version', 'r13.2'):
-            os.unlink(os.path.join(self.directory.install_directory(self.feature_name), 'p4'))
             self.__install_perforce(self.target)
             acted = True
         self.__add_p4_env(self.target)
@@ -137,9 +134,10 @@ class PerforceFormula(FormulaBase):
         FormulaBase.validate(self)
         config = self.target or self.source
         version = config.get('version', 'r13.2')
-        if version not in package_dict:
+        versions = load_versions(config.get('versions_file', None))['versions']
+        if version not in versions:
             raise PerforceFormulaException("Version %s in not supported by perforce formula!\n" % version +
-                                           "Supported versions are: %s" % ", ".join(package_dict.keys()))
+                                           "Supported versions are: %s" % ", ".join(sorted(versions.keys())))
 
     def __install_perforce(self, config):
         """ install perforce binary """
@@ -148,27 +146,68 @@ class PerforceFormula(FormulaBase):
             return False
         version = config.get('version', 'r13.2')
         key = 'osx' if system.is_osx() else 'linux'
-        perforce_packages = package_dict[version][key]
+        versions = load_versions(config.get('versions_file', None))
+        url_prefix = versions['url_prefix']
+        p4_path, p4_checksum = _package_entry(versions['versions'][version][key]['p4'])
+        p4v_path, p4v_checksum = _package_entry(versions['versions'][version][key]['p4v'])
         d = self.directory.install_directory(self.feature_name)
         if not os.path.exists(d):
             os.makedirs(d)
-        self.logger.info("Downloading p4 executable...")
-        with open(os.path.join(d, "p4"), 'wb+') as fh:
-            fh.write(lib.cleaned_request('get', url_prefix + perforce_packages['p4']).content)
-        self.directory.symlink_to_bin("p4", os.path.join(d, "p4"))
         self.p4_command = os.path.join(d, "p4")
+        fetches = []
+        if not _matches(self.p4_command, p4_checksum):
+            fetches.append((url_prefix + p4_path, p4_checksum))
+        if system.is_osx():
+            if not _p4v_osx_installed():
+                fetches.append((url_prefix + p4v_path, p4v_checksum))
+        elif not _matches_marker(d, p4v_checksum):
+            fetches.append((url_prefix + p4v_path, p4v_checksum))
+        self.logger.info("Fetching perforce executables...")
+        pool = ThreadPool(max(len(fetches), 1))
+        try:
+            fetched = dict(zip([url for url, _ in fetches], pool.map(self.__fetch, fetches)))
+        finally:
+            pool.close()
+        if url_prefix + p4_path in fetched:
+            self.__install_p4(fetched[url_prefix + p4_path])
+        self.directory.symlink_to_bin("p4", self.p4_command)
         self.logger.info("Installing p4v...")
+        p4v_archive = fetched.get(url_prefix + p4v_path)
         if system.is_osx():
-            return self._install_p4v_osx(url_prefix + perforce_packages['p4v'])
+            if p4v_archive is None:
+                self.logger.warn("P4V exists already! Not overwriting...")
+                return True
+            with open(p4v_archive, 'rb') as fh:
+                return self._install_p4v_osx(fh)
+        if p4v_archive and not _matches_marker(d, lib.file_checksum(p4v_archive)):
+            with open(p4v_archive, 'rb') as fh:
+                self._install_p4v_linux(fh)
+            with open(os.path.join(d, P4V_MARKER), 'w+') as fh:
+                fh.write(lib.file_checksum(p4v_archive))
         else:
-            return self._install_p4v_linux(url_prefix + perforce_packages['p4v'])
+            self.logger.info("p4v is already up to date.")
+            self.__link_p4v_bin()
+        return True
+
+    def __fetch(self, fetch):
+        url, checksum = fetch
+        return lib.download_to_cache(url, os.path.join(self.environment.global_path, "downloads"),
+                                     checksum=checksum)
+
+    def __install_p4(self, path):
+        """ replace the p4 executable, unless it is identical already """
+        if _matches(self.p4_command, lib.file_checksum(path)):
+            self.logger.info("p4 is already up to date.")
+            return
+        temp_path = self.p4_command + ".tmp"
+        shutil.copyfile(path, temp_path)
+        os.chmod(temp_path, 0o755)
+        os.rename(temp_path, self.p4_command)
 
     def _install_p4v_osx(self, url, overwrite=False):
         """ Install perforce applications and binaries for mac """
-        package_exists = False
         root_dir = os.path.expanduser(os.path.join("~", "Applications"))
-        package_exists = len([x for x in P4V_APPLICATIONS if os.path.exists(os.path.join(root_dir, x))])
-        if not package_exists or overwrite:
+        if not _p4v_osx_installed() or overwrite:
             lib.extract_dmg(url, root_dir)
         else:
             self.logger.warn("P4V exists already in %s! Not overwriting..." % root_dir)
@@ -179,11 +218,14 @@ class PerforceFormula(FormulaBase):
         lib.extract_targz(url,
                           self.directory.install_directory(self.feature_name),
                           remove_common_prefix=True)
+        self.__link_p4v_bin()
+        return True
+
+    def __link_p4v_bin(self):
         bin_path = os.path.join(self.directory.install_directory(self.feature_name), 'bin')
         if os.path.exists(bin_path):
             for f in os.listdir(bin_path):
                 self.directory.symlink_to_bin(f, os.path.join(bin_path, f))
-        return True
 
     def __write_p4settings(self, config):
         """ write perforce settings """
@@ -211,7 +253,6 @@ class PerforceFormula(FormulaBase):
         self.logger.info("Configuring p4 client...")
         client_dict = config.to_dict()
         client_dict['root_path'] = os.path.expanduser(config.get('root_path'))
-        os.chdir(client_dict['root_path'])
         client_dict['hostname'] = system.NODE
         client_dict['p4view'] = config['p4view'] % self.environment.target.get_context_dict()
         client = re.sub('//depot', '    //depot', p4client_template % client_dict)
@@ -220,6 +261,49 @@ class PerforceFormula(FormulaBase):
                                   env=self.p4environ,
                                   cwd=client_dict['root_path']))
 
+def load_versions(versions_file=None):
+    """
+    load the version matrix, merging the versions in versions_file
+    (if passed) over the ones shipped with sprinter
+    """
+    with open(VERSIONS_PATH) as fh:
+        versions = json.load(fh)
+    if versions_file:
+        with open(os.path.expanduser(versions_file)) as fh:
+            extra_versions = json.load(fh)
+        versions['url_prefix'] = extra_versions.get('url_prefix', versions['url_prefix'])
+        for version, platforms in extra_versions.get('versions', {}).items():
+            versions['versions'].setdefault(version, {}).update(platforms)
+    return versions
+
+
+def _package_entry(entry):
+    """ return the (path, checksum) of an entry in the version matrix """
+    if isinstance(entry, dict):
+        return entry['path'], entry.get('checksum')
+    return entry, None
+
+
+def _matches(path, checksum):
+    """ return true if the file at path exists and has the checksum """
+    return checksum is not None and os.path.exists(path) and lib.file_checksum(path) == checksum
+
+
+def _p4v_osx_installed():
+    """ return true if any of the p4v applications are installed """
+    root_dir = os.path.expanduser(os.path.join("~", "Applications"))
+    return any(os.path.exists(os.path.join(root_dir, x)) for x in P4V_APPLICATIONS)
+
+
+def _matches_marker(directory, checksum):
+    """ return true if the p4v installed in directory came from an archive with the checksum """
+    marker_path = os.path.join(directory, P4V_MARKER)
+    if checksum is None or not os.path.exists(marker_path):
+        return False
+    with open(marker_path) as fh:
+        return fh.read().strip() == checksum
+
+
 p4settings_template = """
 P4USER=%(username)s
 P4CLIENT=%(client)s
@@ -4,63 +4,132 @@ replace the existing eggscript formula, which has had issues with it's virtualen
 
 https://github.com/pantsbuild/pex
 
+resolved distributions are cached in the global sprinter directory,
+and shared across every pex feature and namespace. Eggs without an
+exact version are resolved from the cache for cache_ttl seconds
+(an hour by default) before the index is checked again. A lockfile of
+the resolved versions is written next to the built executable, and the
+pex is only rebuilt when the eggs, their resolved versions, the entry
+point or the interpreter change.
+
 [sprinter]
 eggs = sprinter
 entry_point = sprinter.install:main
 executable_name = sprinter
+cache_ttl = 3600
 """
 from __future__ import unicode_literals
 
+import hashlib
+import json
 import os
 from sprinter.formula.base import FormulaBase
+from sprinter.core import schema
 from pex.interpreter import PythonInterpreter
 from pex.pex_builder import PEXBuilder
 from pex.resolvable import Resolvable
-from pex.resolver import Resolver
+from pex.resolver import CachingResolver
 from pex.resolver_options import ResolverOptionsBuilder
 from pex.bin.pex import interpreter_from_options, configure_clp
 
+LOCKFILE_SUFFIX = ".lock"
+# seconds cached distributions satisfy inexact requirements for
+CACHE_TTL = 60 * 60
+
 
 class PexFormula(FormulaBase):
 
     required_options = FormulaBase.required_options + [
         "eggs", "entry_point", "executable_name"
     ]
+    valid_options = FormulaBase.valid_options + ["cache_ttl"]
+    option_types = dict(FormulaBase.option_types, cache_ttl=schema.INTEGER)
+    option_defaults = dict(FormulaBase.option_defaults, cache_ttl=CACHE_TTL)
 
     def install(self):
         self._build()
+        return True
 
     def update(self):
-        self._build()
+        return self._build()
 
     @property
     def install_directory(self):
         return self.directory.install_directory(self.feature_name)
 
+    @property
+    def cache_directory(self):
+        """ the resolver cache, shared across features and namespaces """
+        return os.path.join(self.environment.global_path, "pex_cache")
+
     def _build(self):
+        """
+        build the pex, unless one built with the same key already
+        exists. returns true if a build occurred.
+        """
         target_path = os.path.join(self.install_directory,
                                    self.target.get("executable_name"))
         parser, resolver_options_builder = configure_clp()
-        pex_builder = PEXBuilder(
-            interpreter=self._get_interpreter(parser)
-        )
-        pex_builder.set_entry_point(self.target.get("entry_point"))
-        for dist in self._get_distributions(resolver_options_builder):
-            pex_builder.add_distribution(dist)
-            pex_builder.add_requirement(dist.as_requirement())
-        pex_builder.build(target_path)
+        interpreter = self._get_interpreter(parser)
+        distributions = self._get_distributions(resolver_options_builder, interpreter)
+        resolved = [str(dist.as_requirement()) for dist in distributions]
+        build_key = self._get_build_key(interpreter, resolved)
+        lockfile = self._read_lockfile(target_path)
+        if (os.path.exists(target_path) and lockfile is not None
+                and lockfile.get("key") == build_key):
+            self.logger.debug("pex for %s is up to date, skipping build." % self.feature_name)
+            built = False
+        else:
+            pex_builder = PEXBuilder(interpreter=interpreter)
+            pex_builder.set_entry_point(self.target.get("entry_point"))
+            for dist in distributions:
+                pex_builder.add_distribution(dist)
+                pex_builder.add_requirement(dist.as_requirement())
+            pex_builder.build(target_path)
+            self._write_lockfile(target_path, build_key, resolved)
+            built = True
         self.directory.symlink_to_bin(self.target.get("executable_name"),
                                       target_path)
+        return built
 
-    def _get_distributions(self, resolver_options_builder):
-        eggs = self.target.get("eggs").splitlines()
-        resolvables = [Resolvable.get(e, resolver_options_builder) for e in eggs]
-        resolver = Resolver()
+    def _get_distributions(self, resolver_options_builder, interpreter=None):
+        resolvables = [Resolvable.get(e, resolver_options_builder) for e in self._get_eggs()]
+        resolver = CachingResolver(self.cache_directory, self.target.get_parsed("cache_ttl"),
+                                   interpreter=interpreter)
         return resolver.resolve(resolvables)
 
+    def _get_eggs(self):
+        return [e.strip() for e in self.target.get("eggs").splitlines() if e.strip()]
+
+    def _get_build_key(self, interpreter, resolved):
+        """ a hash of everything that determines the contents of the pex """
+        key_parts = sorted(self._get_eggs()) + sorted(resolved) + [
+            self.target.get("entry_point"),
+            str(interpreter.identity) if interpreter else ""
+        ]
+        return hashlib.sha1("\n".join(key_parts).encode("utf-8")).hexdigest()
+
     def _get_interpreter(self, parser):
         options, reqs = parser.parse_args(args=[
             "-e", self.target.get("executable_name"),
             "--wheel",
         ])
         return interpreter_from_options(options)
+
+    @staticmethod
+    def _read_lockfile(target_path):
+        """ return the lockfile contents for the pex at target_path, or None """
+        lockfile_path = target_path + LOCKFILE_SUFFIX
+        if not os.path.exists(lockfile_path):
+            return None
+        try:
+            with open(lockfile_path) as fh:
+                return json.load(fh)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _write_lockfile(target_path, build_key, resolved):
+        with open(target_path + LOCKFILE_SUFFIX, "w+") as fh:
+            fh.write(json.dumps({"key": build_key, "resolved": sorted(resolved)},
+                                indent=2, sort_keys=True))
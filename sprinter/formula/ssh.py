@@ -10,13 +10,19 @@ hostname = github.com
 user = toumorokoshi
 create = false
 install_command = echo 'hello'
+
+each feature writes the ssh config as soon as it is injected, so the
+features after it see the host, but leaves the other pending
+injections to the end of the run. Keys for every ssh feature are
+generated concurrently before syncing.
 """
 from __future__ import unicode_literals
 import os
 import logging
+from multiprocessing.pool import ThreadPool
 
 from sprinter.formula.base import FormulaBase
-from sprinter.core import PHASE
+from sprinter.core import PHASE, schema
 import sprinter.lib as lib
 
 ssh_config_template = """
@@ -28,16 +34,40 @@ Host %(host)s
 
 user_ssh_path = os.path.expanduser("~/.ssh")
 ssh_config_path = os.path.join(user_ssh_path, "config")
+KEYGEN_WORKERS = 4
 
 
 class SSHFormula(FormulaBase):
 
     required_options = FormulaBase.required_options + ['keyname', 'hostname',
                                                        'user', 'host']
-    valid_options = FormulaBase.valid_options + ['override', 'install_command',
+    valid_options = FormulaBase.valid_options + ['install_command',
                                                  'create', 'nopassphrase',
                                                  'type', 'ssh_path',
                                                  'use_global_ssh', 'port']
+    deprecated_options = {
+        'override': 'Option "override" in {feature} has no effect, the ssh config is always injected'
+    }
+    option_types = dict(FormulaBase.option_types, create=schema.BOOL,
+                        use_global_ssh=schema.BOOL, port=schema.INTEGER)
+    option_defaults = dict(FormulaBase.option_defaults, create=True, use_global_ssh=False)
+
+    @classmethod
+    def prepare_sync(cls, instances):
+        """ generate the keys of every feature concurrently """
+        commands = []
+        for instance in instances:
+            if instance.sync_phase() in (PHASE.INSTALL, PHASE.UPDATE):
+                command = instance._keygen_command(instance.target)
+                if command:
+                    commands.append(command)
+        if not commands:
+            return
+        pool = ThreadPool(min(len(commands), KEYGEN_WORKERS))
+        try:
+            pool.map(_call_keygen, commands)
+        finally:
+            pool.close()
 
     def prompt(self):
         if self.environment.phase in (PHASE.INSTALL, PHASE.UPDATE):
@@ -49,7 +79,7 @@ class SSHFormula(FormulaBase):
     def install(self):
         self.__generate_key(self.target)
         self.__install_ssh_config(self.target)
-        if self.target.has('install_command') and not self.target.is_affirmative('use_global_ssh', default="no"):
+        if self.target.has('install_command') and not self.target.get_parsed('use_global_ssh'):
             self.__call_command(self.target.get('install_command'), self.target.get('ssh_key_path'))
 
     def update(self):
@@ -70,35 +100,32 @@ class SSHFormula(FormulaBase):
         Generate the ssh key, and return the ssh config location
         """
         cwd = config.get('ssh_path', self._install_directory())
-        if config.is_affirmative('create', default="yes"):
-            if not os.path.exists(cwd):
-                os.makedirs(cwd)
-            if not os.path.exists(os.path.join(cwd, config.get('keyname'))):
-                command = "ssh-keygen -t %(type)s -f %(keyname)s -N  " % config.to_dict()
-                lib.call(command, cwd=cwd, output_log_level=logging.DEBUG)
+        command = self._keygen_command(config)
+        if command:
+            _call_keygen(command)
         if not config.has('ssh_path'):
             config.set('ssh_path', cwd)
         config.set('ssh_key_path', os.path.join(config.get('ssh_path'), config.get('keyname')))
 
+    def _keygen_command(self, config):
+        """
+        return the (command, cwd) generating the key, or None if it
+        should not be generated
+        """
+        cwd = config.get('ssh_path', self._install_directory())
+        if not config.get_parsed('create'):
+            return None
+        if os.path.exists(os.path.join(cwd, config.get('keyname'))):
+            return None
+        return ("ssh-keygen -t %(type)s -f %(keyname)s -N  " % config.to_dict(), cwd)
+
     def __install_ssh_config(self, config):
         """
         Install the ssh configuration
         """
-        if not config.is_affirmative('use_global_ssh', default="no"):
-            ssh_config_injection = self._build_ssh_config(config)
-
-            if not os.path.exists(ssh_config_path):
-
-                if self.injections.in_noninjected_file(ssh_config_path, "Host %s" % config.get('host')):
-                    if config.is_affirmative('override'):
-                        self.injections.inject(ssh_config_path, ssh_config_injection)
-                else:
-                    self.injections.inject(ssh_config_path, ssh_config_injection)
-
-            else:
-                self.injections.inject(ssh_config_path, ssh_config_injection)
-
-            self.injections.commit()
+        if not config.get_parsed('use_global_ssh'):
+            self.injections.inject(ssh_config_path, self._build_ssh_config(config))
+            self.injections.commit_file(ssh_config_path)
 
     def __call_command(self, command, ssh_path):
         ssh_path += ".pub"  # make this the public key
@@ -120,3 +147,10 @@ class SSHFormula(FormulaBase):
         if config.has('port'):
             ssh_config_injection += "  Port {0}\n".format(config.get('port'))
         return ssh_config_injection
+
+
+def _call_keygen(command):
+    command, cwd = command
+    if not os.path.exists(cwd):
+        os.makedirs(cwd)
+    lib.call(command, cwd=cwd, output_log_level=logging.DEBUG)
@@ -14,22 +14,38 @@ replacement_keys = my_tmpl_var,other_tmpl_var
 my_tmpl_var = %(config:my_tmpl_var)s
 other_tmpl_var = %(config:other_tmpl_var)s
 on_update = false
+placeholder_syntax = braces
+
+placeholder_syntax chooses how replacement keys are written in the
+source: braces (the default) uses python's format syntax, {my_tmpl_var},
+where literal braces must be doubled. dollar uses ${my_tmpl_var}, and
+leaves every other brace alone, which suits json or xml sources.
+
+remote sources are cached in the global sprinter directory, and
+revalidated with their ETag (or Last-Modified date) on each sync. The
+hash of the last rendered output is kept with the feature, and the
+target is only rewritten (atomically) when the rendered content changes.
 """
 from __future__ import unicode_literals
+import hashlib
+import io
+import json
 import os
-import string
-
-from collections import defaultdict
+import tempfile
 
 from sprinter.formula.base import FormulaBase
 import sprinter.lib as lib
+from sprinter.lib import instrumentation
+from sprinter.lib.templating import SYNTAXES, compile_template
 from sprinter.core import PHASE
 
+RENDER_MARKER = ".sprinter-template"
+
 
 class TemplateFormula(FormulaBase):
 
     required_options = FormulaBase.required_options + ['source', 'target']
-    valid_options = ['fail_on_error']
+    valid_options = ['fail_on_error', 'placeholder_syntax']
 
     def prompt(self):
         if self.environment.phase == PHASE.REMOVE:
@@ -44,14 +60,13 @@ class TemplateFormula(FormulaBase):
     def update(self):
         acted = False
         if self.target.has('on_update') and self.target.is_affirmative('on_update'):
-            self.__install_file(self.target)
-            acted = True
+            acted = self.__install_file(self.target)
         FormulaBase.update(self)
         return acted
 
     def remove(self):
         if self.source.is_affirmative('remove_file_on_delete', False):
-            os.path.unlink(
+            os.unlink(
                 os.path.expanduser(self.source.get('target')))
         FormulaBase.remove(self)
 
@@ -61,19 +76,24 @@ class TemplateFormula(FormulaBase):
                self.target.has('password') and not self.target.has('username')):
                 self.logger.warn("Username and password are " +
                                  "both required to authenticate to a source!")
+            if self.target.get('placeholder_syntax', 'braces') not in SYNTAXES:
+                self._log_error("placeholder_syntax must be one of %s!" % ", ".join(SYNTAXES))
         FormulaBase.validate(self)
 
     def __install_file(self, config):
+        """ render the template to the target, returning true if the target was written """
         source = config.get('source')
         if source.startswith("http"):
+            cache_dir = os.path.join(self.environment.global_path, "template_cache")
             if config.has('username') and config.has('password'):
-                source_content = self.lib.authenticated_get(config.get('username'),
-                                                            config.get('password'),
-                                                            source).decode("utf-8")
+                source_content = lib.cached_get(source, cache_dir,
+                                                username=config.get('username'),
+                                                password=config.get('password')).decode("utf-8")
             else:
-                source_content = lib.cleaned_request('get', source).text
+                source_content = lib.cached_get(source, cache_dir).decode("utf-8")
         else:
-            source_content = open(os.path.expanduser(source)).read()
+            with io.open(os.path.expanduser(source), encoding="utf-8") as fh:
+                source_content = fh.read()
 
         # replace {key} type markers in the template source
         if config.has('replacement_keys'):
@@ -83,10 +103,10 @@ class TemplateFormula(FormulaBase):
                 if config.has(key):
                     replacements[key] = config.get(key)
             try:
-                source_content = string.Formatter().vformat(
-                    source_content, (), defaultdict(str, **replacements))
+                source_content = compile_template(
+                    source_content, config.get('placeholder_syntax', 'braces')).render(replacements)
             except Exception as e:
-                error_message = "Failed trying to format template! error: {err}".format(err=e.message)
+                error_message = "Failed trying to format template! error: {err}".format(err=e)
                 if config.is_affirmative('fail_on_error', False):
                     raise e
                 else:
@@ -97,17 +117,97 @@ class TemplateFormula(FormulaBase):
         if not os.path.exists(parent_directory):
             os.makedirs(parent_directory)
 
+        owner = self.directory.owner(target_file)
+        if owner and owner != self.feature_name:
+            self.logger.warn("%s was written by feature %s, and will be overwritten!" %
+                             (target_file, owner))
+
+        rendered = source_content.encode("utf-8")
+        rendered_hash = hashlib.sha256(rendered).hexdigest()
+        if self.__is_rendered(target_file, rendered, rendered_hash):
+            self.logger.debug("%s is up to date." % target_file)
+            return False
+
         # backup the template, if it is configured for it and if it has changed
         if os.path.isfile(target_file) and config.has('backup'):
-            target_content = open(target_file).read()
-            if target_content != source_content:
-                backup_target_base = "{path}.{ext}".format(path=target_file, ext=config.get('backup'))
-                backup_target = backup_target_base
-                i = 1
-                while os.path.isfile(backup_target):
-                    backup_target = "{path}-{i}".format(path=backup_target_base, i=i)
-                    i += 1
-                self.logger.info("Backing up template target to %s..." % backup_target)
-                os.rename(target_file, backup_target)
-        with open(target_file, 'w+') as fh:
-            fh.write(source_content)
+            backup_target_base = "{path}.{ext}".format(path=target_file, ext=config.get('backup'))
+            backup_target = backup_target_base
+            i = 1
+            while os.path.isfile(backup_target):
+                backup_target = "{path}-{i}".format(path=backup_target_base, i=i)
+                i += 1
+            self.logger.info("Backing up template target to %s..." % backup_target)
+            os.rename(target_file, backup_target)
+        _write_atomic(target_file, rendered)
+        instrumentation.count('files_written')
+        self.directory.record_file(self.feature_name, target_file)
+        self.__write_marker(target_file, rendered_hash)
+        return True
+
+    def __is_rendered(self, target_file, rendered, rendered_hash):
+        """
+        return true if the target already holds the rendered content. The
+        target is only read if it changed since the last render.
+        """
+        if not os.path.isfile(target_file):
+            return False
+        marker = self.__read_marker()
+        target_stat = os.stat(target_file)
+        if (marker.get('target') == target_file and marker.get('sha256') == rendered_hash and
+                marker.get('size') == target_stat.st_size and marker.get('mtime') == target_stat.st_mtime):
+            return True
+        with open(target_file, 'rb') as fh:
+            if fh.read() != rendered:
+                return False
+        self.__write_marker(target_file, rendered_hash)
+        return True
+
+    def __marker_path(self):
+        return os.path.join(self.directory.install_directory(self.feature_name), RENDER_MARKER)
+
+    def __read_marker(self):
+        if not os.path.exists(self.__marker_path()):
+            return {}
+        try:
+            with open(self.__marker_path()) as fh:
+                return json.load(fh)
+        except ValueError:
+            return {}
+
+    def __write_marker(self, target_file, rendered_hash):
+        target_stat = os.stat(target_file)
+        install_directory = self.directory.install_directory(self.feature_name)
+        if not os.path.exists(install_directory):
+            os.makedirs(install_directory)
+        with open(self.__marker_path(), 'w+') as fh:
+            fh.write(json.dumps({'target': target_file,
+                                 'sha256': rendered_hash,
+                                 'size': target_stat.st_size,
+                                 'mtime': target_stat.st_mtime}))
+
+
+def _write_atomic(path, content):
+    """
+    write content to path through a temporary file, so readers never see
+    a partial file. If path is a symlink, the file it points to is replaced.
+    """
+    path = os.path.realpath(path)
+    fd, temp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + "-",
+                                     dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        else:
+            os.chmod(temp_path, 0o666 & ~_umask())
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
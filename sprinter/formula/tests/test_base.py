@@ -1,7 +1,11 @@
 from __future__ import unicode_literals
+import os
+import subprocess
 import sprinter.lib as lib
 from mock import Mock, patch
+from nose.tools import eq_, ok_
 from sprinter.testtools import FormulaTest
+from sprinter.core import schema
 from sprinter.formula.base import FormulaBase
 
 source_config = """
@@ -20,6 +24,11 @@ target_config = """
 formula = sprinter.formula.base
 rc = teststring
 
+[install_with_rc_lazy]
+formula = sprinter.formula.base
+rc_lazy = mytool() { echo "loaded $*"; }
+rc_lazy_commands = mytool
+
 [install_with_command]
 formula = sprinter.formula.base
 command = echo 'helloworld'
@@ -45,9 +54,19 @@ formula = sprinter.formula.base
 
 [resolve]
 formula = sprinter.formula.base
+
+[typed_options]
+formula = sprinter.formula.base
+port = ssh
+systems = osx
 """
 
 
+class PortFormula(FormulaBase):
+    valid_options = FormulaBase.valid_options + ['port']
+    option_types = dict(FormulaBase.option_types, port=schema.INTEGER)
+
+
 class TestFormulaBase(FormulaTest):
     """ Tests for the formula base """
 
@@ -61,6 +80,17 @@ class TestFormulaBase(FormulaTest):
         self.environment.run_feature("install_with_rc", 'sync')
         self.directory.add_to_rc.assert_called_once_with('teststring')
 
+    def test_install_with_rc_lazy(self):
+        """ rc_lazy should only be sourced the first time a command is called """
+        self.environment.run_feature("install_with_rc_lazy", 'sync')
+        self.directory.finalize()
+        rc_path = os.path.join(self.directory.root_dir, ".rc")
+        with open(rc_path) as fh:
+            ok_("loaded" not in fh.read())
+        if lib.which("bash"):
+            output = subprocess.check_output(["bash", "-c", ". %s; mytool a; mytool b" % rc_path])
+            eq_(output.decode("utf-8"), "loaded a\nloaded b\n")
+
     @patch.object(lib, 'call')
     def test_install_with_command(self, call):
         """ Test install with command """
@@ -122,3 +152,12 @@ class TestFormulaBase(FormulaTest):
         fb.resolve()
         assert not fb.target.has('systems')
         assert not fb.target.has('depends')
+
+    def test_validate_option_types(self):
+        """ validate should report values that don't parse as the type of their option """
+        fb = PortFormula(self.environment, 'typed_options',
+                         target=self.environment.target.get_feature_config('typed_options'))
+        fb._log_error = Mock()
+        fb.validate()
+        fb._log_error.assert_called_once_with(
+            "Option port in feature typed_options should be an integer, but is ssh!")
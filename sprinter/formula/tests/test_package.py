@@ -1,8 +1,13 @@
 from __future__ import unicode_literals
 import logging
+import threading
+import time
 from mock import Mock, patch
+from nose.tools import eq_, ok_
+from sprinter.core import PHASE
 from sprinter.testtools import FormulaTest, set_os_types
 import sprinter.lib as lib
+from sprinter.external import packagemanager
 
 
 source_config = """
@@ -67,8 +72,27 @@ class TestPackageFormula(FormulaTest):
     @patch.object(lib, 'call')
     def test_no_update(self, call):
         """ An unchanged formula should not be updated """
-        self.environment.run_feature('no_update', 'sync')
-        assert not call.called, "Update was called!"
+        call.return_value = (0, b"gitA|install ok installed\n")
+        with set_os_types(debian=True):
+            self.environment.run_feature('no_update', 'sync')
+        ok_(not [c for c in call.call_args_list if "install gitA" in c[0][0]], "Update was called!")
+
+    @patch.object(lib, 'call')
+    def test_update_removed_package(self, call):
+        """ An unchanged formula should reinstall a package removed outside of sprinter """
+        call.return_value = (0, b"gitB|install ok installed\n")
+        with set_os_types(debian=True):
+            self.environment.run_feature('no_update', 'sync')
+            call.assert_called_with("sudo apt-get -y install gitA", output_log_level=logging.DEBUG, stdout=None)
+
+    @patch.object(lib, 'call')
+    def test_validate_missing_package(self, call):
+        """ validate should report packages that are not installed """
+        call.return_value = (0, b"gitB|install ok installed\n")
+        with set_os_types(debian=True):
+            self.environment.phase = PHASE.VALIDATE
+            self.environment.run_feature('no_update', 'validate')
+            ok_(self.environment.error_occured)
 
     @patch.object(lib, 'call')
     def test_update_different_package(self, call):
@@ -76,3 +100,76 @@ class TestPackageFormula(FormulaTest):
         with set_os_types(debian=True):
             self.environment.run_feature('update_new_package', 'sync')
             call.assert_called_with("sudo apt-get -y install gitB", output_log_level=logging.DEBUG, stdout=None)
+
+    def test_prepare_sync_single_transaction(self):
+        """ Missing packages of every feature should be installed in one call """
+        instances = list(self.environment.features.values())
+        with set_os_types(debian=True):
+            with patch.object(lib, 'call') as call:
+                call.side_effect = [(0, b"gitA|install ok installed\ngit-core|install ok installed\n"),
+                                    (0, None)]
+                type(instances[0]).prepare_sync(instances)
+                call.assert_called_with("sudo apt-get -y install gitB",
+                                        output_log_level=logging.DEBUG, stdout=None)
+                eq_(call.call_count, 2)
+                for instance in instances:
+                    call.reset_mock()
+                    instance.sync()
+                    ok_(not call.called)
+
+    def test_prepare_sync_failure_attribution(self):
+        """ A failed transaction should only fail the features whose packages can't be installed """
+        instances = dict((k[0], v) for k, v in self.environment.features.items())
+        instances['simple_example'].target.set('apt-get', 'git-core badpackage')
+        with set_os_types(debian=True):
+            with patch.object(lib, 'call', side_effect=FakeApt(installed=[], invalid=['badpackage'])):
+                type(instances['no_update']).prepare_sync(list(instances.values()))
+                eq_(instances['simple_example'].failed_packages, ['badpackage'])
+                eq_(instances['update_new_package'].failed_packages, [])
+                eq_(instances['no_update'].failed_packages, [])
+                self.environment.run_feature('update_new_package', 'sync')
+                ok_(not self.environment.error_occured)
+                try:
+                    self.environment.run_feature('simple_example', 'sync')
+                except Exception:
+                    pass
+                ok_(self.environment.error_occured)
+
+    def test_installs_serialized(self):
+        """ Packages installed from several threads should be installed one at a time """
+        running, overlapped = [], []
+
+        def install(command, **kwargs):
+            running.append(command)
+            if len(running) > 1:
+                overlapped.append(command)
+            time.sleep(0.05)
+            running.remove(command)
+            return (0, None)
+        manager = packagemanager.PackageManager('apt-get')
+        with patch.object(lib, 'call', side_effect=install):
+            threads = [threading.Thread(target=manager.install, args=(["package%d" % i],)) for i in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        eq_(overlapped, [])
+
+
+class FakeApt(object):
+    """ lib.call for apt-get and dpkg-query, which rolls back transactions with invalid packages """
+
+    def __init__(self, installed, invalid):
+        self.installed = set(installed)
+        self.invalid = set(invalid)
+
+    def __call__(self, command, **kwargs):
+        if command.startswith("sudo apt-get -y install "):
+            packages = command.split()[4:]
+            if self.invalid.intersection(packages):
+                return (100, None)
+            self.installed.update(packages)
+            return (0, None)
+        queried = command.split()[2:] or sorted(self.installed)
+        return (0, "".join("%s|install ok installed\n" % p
+                           for p in queried if p in self.installed).encode('utf-8'))
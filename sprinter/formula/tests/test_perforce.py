@@ -1,8 +1,11 @@
 from __future__ import unicode_literals
+import hashlib
+import json
+import os
 import tempfile
 import shutil
 from mock import Mock, patch
-from nose.tools import ok_
+from nose.tools import eq_, ok_
 from nose.plugins.attrib import attr
 from sprinter.testtools import FormulaTest, set_os_types
 import sprinter.lib as lib
@@ -23,8 +26,23 @@ write_p4settings = true
 write_password_p4settings = true
 overwrite_p4settings = false
 overwrite_client = false
+
+[cached]
+formula = sprinter.formula.perforce
+version = r99.1
+versions_file = {tmpdir}/versions.json
+root_path = {tmpdir}
+username = username
+password = password
+port = perforce.local:1666
+client = test_client
+write_p4settings = false
+overwrite_client = false
 """
 
+P4_CONTENT = b"#!/bin/sh\necho p4\n"
+P4_CHECKSUM = "sha256:" + hashlib.sha256(P4_CONTENT).hexdigest()
+
 
 class TestPerforceFormula(FormulaTest):
     """
@@ -51,3 +69,51 @@ class TestPerforceFormula(FormulaTest):
                     self.environment.run_feature("install", 'sync')
                     ok_(extract_targz.called)
                     # ok_(call.called)
+
+    def test_versions_file(self):
+        """ versions in a versions file should be merged over the shipped ones """
+        self._write_versions()
+        from sprinter.formula.perforce import load_versions
+        versions = load_versions(os.path.join(self.temp_dir, "versions.json"))
+        ok_('r13.2' in versions['versions'])
+        eq_(versions['versions']['r99.1']['linux']['p4']['checksum'], P4_CHECKSUM)
+
+    def test_install_from_cache(self):
+        """ p4 and p4v should be fetched through the download cache, and installed """
+        self._write_versions()
+        with set_os_types(debian=True):
+            with patch.object(lib, 'download_to_cache', side_effect=self._download) as download:
+                with patch.object(lib, 'extract_targz') as extract_targz:
+                    self.environment.run_feature("cached", 'sync')
+        eq_(download.call_count, 2)
+        ok_(extract_targz.called)
+        install_directory = self.directory.install_directory("cached")
+        with open(os.path.join(install_directory, "p4"), 'rb') as fh:
+            eq_(fh.read(), P4_CONTENT)
+
+    def test_install_matching_checksum(self):
+        """ p4 should not be fetched again if the installed one matches the checksum """
+        self._write_versions()
+        install_directory = self.directory.install_directory("cached")
+        os.makedirs(install_directory)
+        with open(os.path.join(install_directory, "p4"), 'wb') as fh:
+            fh.write(P4_CONTENT)
+        with set_os_types(debian=True):
+            with patch.object(lib, 'download_to_cache', side_effect=self._download) as download:
+                with patch.object(lib, 'extract_targz'):
+                    self.environment.run_feature("cached", 'sync')
+        eq_([c[0][0] for c in download.call_args_list], ["http://example.com/p4v.tgz"])
+
+    def _write_versions(self):
+        with open(os.path.join(self.temp_dir, "versions.json"), 'w') as fh:
+            fh.write(json.dumps({
+                "url_prefix": "http://example.com/",
+                "versions": {"r99.1": {"linux": {
+                    "p4": {"path": "p4", "checksum": P4_CHECKSUM},
+                    "p4v": "p4v.tgz"}}}}))
+
+    def _download(self, url, cache_dir, checksum=None):
+        path = os.path.join(self.temp_dir, os.path.basename(url) + ".download")
+        with open(path, 'wb') as fh:
+            fh.write(P4_CONTENT if url.endswith("p4") else b"p4v")
+        return path
@@ -0,0 +1,78 @@
+from __future__ import unicode_literals
+import os
+import sys
+from mock import Mock, patch
+from nose.tools import eq_, ok_
+from sprinter.testtools import FormulaTest
+
+source_config = """
+[cached]
+formula = sprinter.formula.pex_package
+eggs = sprinter
+entry_point = sprinter.install:main
+executable_name = sprinter
+"""
+
+target_config = """
+[cached]
+formula = sprinter.formula.pex_package
+eggs = sprinter
+entry_point = sprinter.install:main
+executable_name = sprinter
+"""
+
+
+class TestPexFormula(FormulaTest):
+    """ Tests for the pex formula """
+
+    def setup(self):
+        super(TestPexFormula, self).setup(source_config=source_config,
+                                          target_config=target_config)
+        self.instance = self.environment.features[('cached', 'sprinter.formula.pex_package')]
+        self.instance._get_interpreter = Mock(return_value=Mock(identity="CPython-2.7.18"))
+        self.instance._get_distributions = Mock(return_value=[])
+        self.target_path = os.path.join(self.instance.install_directory, "sprinter")
+        os.makedirs(self.instance.install_directory)
+        # formulas are imported by module name, so patch the loaded module directly
+        self.pex_builder_patch = patch.object(sys.modules[type(self.instance).__module__], 'PEXBuilder')
+        self.pex_builder = self.pex_builder_patch.start()
+        self.pex_builder.return_value.build.side_effect = lambda path: open(path, 'w+').close()
+
+    def teardown(self):
+        self.pex_builder_patch.stop()
+
+    def test_build_writes_lockfile(self):
+        """ A build should record its key in a lockfile next to the pex """
+        ok_(self.instance._build())
+        ok_(os.path.exists(self.target_path + ".lock"))
+
+    def test_update_skips_matching_build(self):
+        """ An update with an unchanged key should not rebuild the pex """
+        self.instance._build()
+        self.pex_builder.reset_mock()
+        eq_(self.instance.update(), False)
+        ok_(not self.pex_builder.return_value.build.called)
+
+    def test_update_rebuilds_changed_eggs(self):
+        """ An update with different eggs should rebuild the pex """
+        self.instance._build()
+        self.instance.target.set('eggs', 'sprinter\nrequests')
+        ok_(self.instance.update())
+
+    def test_update_rebuilds_changed_versions(self):
+        """ An update resolving different versions of the same eggs should rebuild the pex """
+        self.instance._build()
+        self.instance._get_distributions.return_value = [
+            Mock(as_requirement=Mock(return_value="sprinter==1.4.3"))]
+        ok_(self.instance.update())
+
+    def test_cache_ttl(self):
+        """ The resolver cache should expire after cache_ttl seconds, an hour by default """
+        module = sys.modules[type(self.instance).__module__]
+        with patch.object(module, 'Resolvable'):
+            with patch.object(module, 'CachingResolver') as resolver:
+                type(self.instance)._get_distributions(self.instance, Mock())
+                eq_(resolver.call_args[0][1], 3600)
+                self.instance.target.set('cache_ttl', '60')
+                type(self.instance)._get_distributions(self.instance, Mock())
+                eq_(resolver.call_args[0][1], 60)
@@ -2,10 +2,12 @@ from __future__ import unicode_literals
 import httpretty
 import os
 import shutil
+import sys
 import tempfile
 from mock import Mock, patch
-from nose.tools import ok_
+from nose.tools import eq_, ok_
 from sprinter.testtools import FormulaTest
+from sprinter.next.environment.injections import Injections
 import sprinter.lib as lib
 
 source_config = """
@@ -34,6 +36,25 @@ user = toumorokoshi
 create = false
 port = 4444
 use_global_ssh = no
+
+[keygen]
+formula = sprinter.formula.ssh
+host = example.com
+keyname = example
+type = rsa
+hostname = example.com
+user = toumorokoshi
+use_global_ssh = no
+
+[keygen_override]
+formula = sprinter.formula.ssh
+host = example.org
+keyname = example_org
+type = rsa
+hostname = example.org
+user = toumorokoshi
+use_global_ssh = no
+override = true
 """
 
 
@@ -55,3 +76,39 @@ class TestSSHFormula(FormulaTest):
         self.environment.injections.inject = Mock()
         self.environment.run_feature("port", "sync")
         ok_("Port 4444" in self.environment.injections.inject.call_args[0][1])
+
+    def test_injection_committed_once(self):
+        """ The ssh config should be written once when injected, without the other pending injections """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config_path = os.path.join(temp_dir, "config")
+            other_path = os.path.join(temp_dir, ".bashrc")
+            instance = self.environment.features[('port', 'sprinter.formula.ssh')]
+            instance.injections = injections = Injections(wrapper="SPRINTER_TEST")
+            injections.inject(other_path, "export TEST=1")
+            with patch.object(sys.modules[type(instance).__module__], 'ssh_config_path', config_path):
+                with patch.object(injections, 'destructive_inject',
+                                  wraps=injections.destructive_inject) as write:
+                    self.environment.run_feature("port", "sync")
+                    eq_([c[0][0] for c in write.call_args_list], [config_path])
+                    # the commit at the end of the run only writes what is still pending
+                    injections.commit()
+                    eq_(sorted(c[0][0] for c in write.call_args_list), sorted([config_path, other_path]))
+            ok_("Port 4444" in open(config_path).read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_override_deprecated(self):
+        """ override has no effect, and should be reported as deprecated """
+        instance = self.environment.features[('keygen_override', 'sprinter.formula.ssh')]
+        with patch.object(instance.logger, 'warn') as warn:
+            instance.validate()
+        ok_(any('"override"' in c[0][0] for c in warn.call_args_list))
+
+    def test_prepare_sync_generates_keys(self):
+        """ prepare_sync should generate the missing keys of every feature """
+        instances = list(self.environment.features.values())
+        with patch.object(lib, 'call') as call:
+            type(instances[0]).prepare_sync(instances)
+        eq_(sorted(c[0][0] for c in call.call_args_list),
+            ["ssh-keygen -t rsa -f example -N  ", "ssh-keygen -t rsa -f example_org -N  "])
@@ -2,7 +2,9 @@ from __future__ import unicode_literals
 import httpretty
 import os
 import shutil
+import stat
 import tempfile
+from nose.tools import eq_, ok_
 from sprinter.testtools import FormulaTest
 
 source_config = """
@@ -28,6 +30,21 @@ formula = sprinter.formula.template
 source = %(temp_dir)s/in.txt
 target = %(temp_dir)s/out.txt
 on_update = true
+
+[dollar_example]
+formula = sprinter.formula.template
+source = %(temp_dir)s/in.txt
+target = %(temp_dir)s/out.txt
+placeholder_syntax = dollar
+replacement_keys = name
+name = sprinter
+
+[authenticated_example]
+formula = sprinter.formula.template
+source = http://testme.com/test.txt
+target = %(temp_dir)s/out.txt
+username = username
+password = password
 """
 
 
@@ -72,6 +89,66 @@ class TestUnpackFormula(FormulaTest):
         assert os.path.exists(out_file)
         assert open(out_file).read() == UPDATE_TEMPLATE
         
+    def test_unchanged_not_rewritten(self):
+        """ The target should not be rewritten if the rendered content is unchanged """
+        with open(os.path.join(self.temp_dir, 'in.txt'), 'w+') as fh:
+            fh.write(UPDATE_TEMPLATE)
+        self.environment.run_feature("update_example", 'sync')
+        out_file = os.path.join(self.temp_dir, 'out.txt')
+        os.utime(out_file, (1, 1))
+        self.environment.run_feature("update_example", 'sync')
+        eq_(os.stat(out_file).st_mtime, 1)
+        with open(os.path.join(self.temp_dir, 'in.txt'), 'w+') as fh:
+            fh.write(SIMPLE_TEMPLATE)
+        self.environment.run_feature("update_example", 'sync')
+        eq_(open(out_file).read(), SIMPLE_TEMPLATE)
+
+    def test_dollar_example(self):
+        """ The dollar placeholder syntax should only replace ${key} placeholders """
+        with open(os.path.join(self.temp_dir, 'in.txt'), 'w+') as fh:
+            fh.write('{"name": "${name}"}')
+        self.environment.run_feature("dollar_example", 'sync')
+        eq_(open(os.path.join(self.temp_dir, 'out.txt')).read(), '{"name": "sprinter"}')
+
+    @httpretty.activate
+    def test_http_revalidated_with_etag(self):
+        """ A cached remote template should be revalidated with its etag """
+        TEST_URI = "http://testme.com/test.txt"
+        httpretty.register_uri(httpretty.GET, TEST_URI,
+                               responses=[httpretty.Response(body=SIMPLE_TEMPLATE, etag='"v1"'),
+                                          httpretty.Response(body="", status=304)])
+        self.environment.run_feature("http_example", 'sync')
+        self.environment.run_feature("http_example", 'sync')
+        eq_(httpretty.last_request().headers.get("If-None-Match"), '"v1"')
+        eq_(open(os.path.join(self.temp_dir, 'out.txt')).read(), SIMPLE_TEMPLATE)
+
+    @httpretty.activate
+    def test_authenticated_example(self):
+        """ The template formula should authenticate to a remote source, and cache it privately """
+        TEST_URI = "http://testme.com/test.txt"
+        httpretty.register_uri(httpretty.GET, TEST_URI,
+                               body=SIMPLE_TEMPLATE)
+        self.environment.run_feature("authenticated_example", 'sync')
+        ok_("Authorization" in httpretty.last_request().headers)
+        eq_(open(os.path.join(self.temp_dir, 'out.txt')).read(), SIMPLE_TEMPLATE)
+        # content fetched with credentials should only be readable by the user
+        cache_dir = os.path.join(self.environment.global_path, "template_cache")
+        ok_(os.listdir(cache_dir))
+        for name in os.listdir(cache_dir):
+            eq_(stat.S_IMODE(os.stat(os.path.join(cache_dir, name)).st_mode), 0o600)
+
+    def test_symlinked_target_preserved(self):
+        """ A symlinked target should stay a symlink, with the file it points to rewritten """
+        with open(os.path.join(self.temp_dir, 'in.txt'), 'w+') as fh:
+            fh.write(SIMPLE_TEMPLATE)
+        real_file = os.path.join(self.temp_dir, 'real.txt')
+        open(real_file, 'w+').close()
+        out_file = os.path.join(self.temp_dir, 'out.txt')
+        os.symlink(real_file, out_file)
+        self.environment.run_feature("simple_example", 'sync')
+        ok_(os.path.islink(out_file))
+        eq_(open(real_file).read(), SIMPLE_TEMPLATE)
+
 
 SIMPLE_TEMPLATE = """
 This is a simple template.
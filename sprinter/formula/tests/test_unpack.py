@@ -1,13 +1,24 @@
 from __future__ import unicode_literals
-from mock import Mock, patch
+import io
+import os
+import shutil
+import tempfile
+from mock import ANY, Mock, patch
+from nose.tools import eq_, ok_
 from sprinter.testtools import FormulaTest, set_os_types
 import sprinter.lib as lib
 
 TEST_TARGZ = "http://github.com/toumorokoshi/sprinter/tarball/master"
 TEST_ZIP = "http://iterm2.com/downloads/stable/iTerm2_v1_0_0.zip"
 TEST_DMG = "https://dl.google.com/chrome/mac/stable/GGRM/googlechrome.dmg"
+# a dmg ends with a 512 byte trailer, starting with koly
+TEST_DMG_CONTENT = b"\0" * 512 + b"koly" + b"\0" * 508
 
 source_config = """
+[unchanged]
+formula = sprinter.formula.unpack
+url = %(targz)s
+type = tar.gz
 """
 
 target_config = """
@@ -15,44 +26,154 @@ target_config = """
 formula = sprinter.formula.unpack
 url = %(targz)s
 type = tar.gz
-target = /testpath
+target = %(temp_dir)s/testpath
 
 [dmg_with_target]
 formula = sprinter.formula.unpack
 url = %(dmg)s
 type = dmg
-target = /testpath
+target = %(temp_dir)s/testpath
 
 [zip_with_target]
 formula = sprinter.formula.unpack
 url = %(zip)s
 type = zip
-target = /testpath
-""" % {'targz': TEST_TARGZ, 'dmg': TEST_DMG, 'zip': TEST_ZIP}
+target = %(temp_dir)s/testpath
+
+[bad_checksum]
+formula = sprinter.formula.unpack
+url = %(targz)s
+type = tar.gz
+checksum = sha256:0000
+
+[unchanged]
+formula = sprinter.formula.unpack
+url = %(targz)s
+type = tar.gz
+
+[shared_one]
+formula = sprinter.formula.unpack
+url = %(targz)s
+type = tar.gz
+use_content_store = true
+
+[shared_two]
+formula = sprinter.formula.unpack
+url = %(targz)s
+type = tar.gz
+use_content_store = true
+"""
 
 
 class TestUnpackFormula(FormulaTest):
     """ Tests for the unpack formula """
 
     def setup(self):
-        super(TestUnpackFormula, self).setup(source_config=source_config,
-                                             target_config=target_config)
+        self.temp_dir = tempfile.mkdtemp()
+        config_dict = {'targz': TEST_TARGZ, 'dmg': TEST_DMG, 'zip': TEST_ZIP,
+                       'temp_dir': self.temp_dir}
+        super(TestUnpackFormula, self).setup(source_config=source_config % config_dict,
+                                             target_config=target_config % config_dict)
+        self.archive = io.BytesIO(open("./test_data/test_tar.tar.gz", 'rb').read())
+        self.download_patch = patch.object(lib, 'download_to_bytesio', return_value=self.archive)
+        self.download = self.download_patch.start()
 
-    @patch.object(lib, 'extract_zip')
-    def test_zip_with_target(self, extract_zip):
+    def teardown(self):
+        self.download_patch.stop()
+        shutil.rmtree(self.temp_dir)
+
+    @patch.object(lib, 'extract_archive')
+    def test_zip_with_target(self, extract):
         """ Test the zip extracting to a specific target """
         self.environment.run_feature("zip_with_target", 'sync')
-        extract_zip.assert_called_with(TEST_ZIP, '/testpath', remove_common_prefix=False)
+        extract.assert_called_with(self.archive, ANY, filename='iTerm2_v1_0_0.zip', hint='zip',
+                                   remove_common_prefix=False)
+        ok_(os.path.isdir(os.path.join(self.temp_dir, 'testpath')))
 
-    @patch.object(lib, 'extract_dmg')
-    def test_dmg_with_target(self, extract_dmg):
+    @patch.object(lib, 'extract_archive')
+    def test_dmg_with_target(self, extract):
         """ Test the dmg extracting to a specific target """
+        self.download.return_value = dmg = io.BytesIO(TEST_DMG_CONTENT)
         with set_os_types(osx=True):
             self.environment.run_feature("dmg_with_target", 'sync')
-            extract_dmg.assert_called_with(TEST_DMG, '/testpath', remove_common_prefix=False)
+            extract.assert_called_with(dmg, ANY, filename='googlechrome.dmg', hint='dmg',
+                                       remove_common_prefix=False)
+
+    @patch.object(lib, 'extract_archive')
+    def test_dmg_on_linux(self, extract):
+        """ A dmg should not be installed on non-OSX systems """
+        self.download.return_value = io.BytesIO(TEST_DMG_CONTENT)
+        with set_os_types(debian=True):
+            self.environment.run_feature("dmg_with_target", 'sync')
+            ok_(not extract.called)
+
+    @patch.object(lib, 'extract_archive')
+    def test_dmg_detected_from_contents(self, extract):
+        """ A dmg should be detected from its contents, whatever its url or type """
+        self.download.return_value = io.BytesIO(TEST_DMG_CONTENT)
+        with set_os_types(debian=True):
+            self.environment.run_feature("targz_with_target", 'sync')
+            ok_(not extract.called)
+
+    @patch.object(lib, 'extract_archive')
+    def test_dmg_type_with_other_contents(self, extract):
+        """ An archive typed as a dmg should be extracted if its contents are not one """
+        with set_os_types(debian=True):
+            self.environment.run_feature("dmg_with_target", 'sync')
+            ok_(extract.called)
 
-    @patch.object(lib, 'extract_targz')
-    def test_targz_with_target(self, extract_targz):
+    @patch.object(lib, 'extract_archive')
+    def test_targz_with_target(self, extract):
         """ Test the targz extracting to a specific target """
         self.environment.run_feature("targz_with_target", 'sync')
-        extract_targz.assert_called_with(TEST_TARGZ, '/testpath', remove_common_prefix=False)
+        extract.assert_called_with(self.archive, ANY, filename='master', hint='tar.gz',
+                                   remove_common_prefix=False)
+
+    def test_targz_staged_install(self):
+        """ An extracted archive should be swapped in, leaving no staging directories behind """
+        self.environment.run_feature("targz_with_target", 'sync')
+        eq_(os.listdir(self.temp_dir), ['testpath'])
+        ok_(os.path.exists(os.path.join(self.temp_dir, 'testpath', 'test_zip')))
+
+    def test_bad_checksum(self):
+        """ An archive not matching the checksum should not be extracted """
+        with patch.object(lib, 'extract_archive') as extract:
+            try:
+                self.environment.run_feature("bad_checksum", 'sync')
+            except Exception:
+                pass
+            ok_(not extract.called)
+
+    def test_update_skipped_with_matching_marker(self):
+        """ An update with an unchanged archive should not download it again """
+        instance = self.environment.features[('unchanged', 'sprinter.formula.unpack')]
+        instance.install()
+        self.download.reset_mock()
+        eq_(instance.update(), False)
+        ok_(not self.download.called)
+
+    def test_update_reinstalls_changed_url(self):
+        """ An update to a new url should swap in the new archive """
+        instance = self.environment.features[('unchanged', 'sprinter.formula.unpack')]
+        instance.install()
+        instance.target.set('url', TEST_TARGZ + "?v=2")
+        eq_(instance.update(), True)
+        ok_(self.download.called)
+        ok_(os.path.exists(os.path.join(instance._install_directory(), 'test_zip')))
+
+    def test_content_store_shares_extraction(self):
+        """ Features unpacking the same archive through the store should share files """
+        one = self.environment.features[('shared_one', 'sprinter.formula.unpack')]
+        two = self.environment.features[('shared_two', 'sprinter.formula.unpack')]
+        with patch.object(lib, 'extract_archive', wraps=lib.extract_archive) as extract:
+            one.install()
+            two.install()
+            eq_(extract.call_count, 1)
+        readme = os.path.join('test_zip', 'sprinter', 'README.md')
+        eq_(os.stat(os.path.join(one._install_directory(), readme)).st_ino,
+            os.stat(os.path.join(two._install_directory(), readme)).st_ino)
+        store_path = os.path.join(self.environment.global_path, "store")
+        self.directory.remove_feature('shared_one')
+        eq_(len(os.listdir(store_path)), 1)
+        self.directory.remove_feature('shared_two')
+        eq_(os.listdir(store_path), [])
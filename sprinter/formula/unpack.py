@@ -7,19 +7,46 @@ executable = bin/go
 symlink = go
 remove_common_prefix = true
 url = https://go.googlecode.com/files/go1.1.linux-amd64.tar.gz
+type = tar.gz
+checksum = sha256:5c0a8d3e9f...
+use_content_store = true
 target = /tmp/
+
+the archive format is detected from its contents: tar (uncompressed,
+gz, bz2, xz or zst), zip, dmg, or a single (optionally compressed)
+file. type is only needed when the contents are ambiguous.
+
+archives are extracted into a staging directory next to the
+destination, and swapped in with a rename once extraction succeeds. A
+marker recording the url, checksum and size of the archive is written
+into the feature directory, and updates are skipped while it still matches.
+
+with use_content_store, each unique archive is extracted once into a
+store in the global sprinter directory, and feature directories are
+hardlinked from it. Files in those directories are shared, so they
+should not be modified in place.
 """
 
 from __future__ import unicode_literals
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import threading
 
 from sprinter.formula.base import FormulaBase
 from sprinter.lib import ExtractException, system
 from sprinter.exceptions import FormulaException
+from sprinter.core import contentstore
+from sprinter.core.contentstore import ContentStore
 from sprinter.core.directory import DirectoryException
 import sprinter.lib as lib
 
 
+MARKER_FILENAME = ".sprinter-unpack"
+
+
 class UnpackFormulaException(FormulaException):
     """ Covers execptions with the unpack formula """
 
@@ -28,7 +55,8 @@ class UnpackFormula(FormulaBase):
     """ A sprinter formula for unpacking a compressed package and extracting it"""
 
     valid_options = FormulaBase.valid_options + ['executable', 'symlink', 'target',
-                                                 'remove_common_prefix', 'type']
+                                                 'remove_common_prefix', 'type', 'checksum',
+                                                 'use_content_store']
     required_options = FormulaBase.required_options + ['url']
 
     def install(self):
@@ -46,14 +74,8 @@ class UnpackFormula(FormulaBase):
             self.install()
             return True
 
-        if self.source.get('url') != self.target.get('url'):
+        if self.__requires_install(self.source, self.target):
             acted = True
-            if os.path.exists(self.directory.install_directory(self.feature_name)):
-                try:
-                    self.directory.remove_feature(self.feature_name)
-                except DirectoryException:
-                    self.logger.exception()
-                    self.logger.error("Unable to remove old directory!")
             self.__install(self.target)
         if self.source.has('executable'):
             symlink = self.source.get('symlink', self.source.get('executable'))
@@ -82,29 +104,127 @@ class UnpackFormula(FormulaBase):
                         self.source('symlink', self.source.get('executable')))
                 except DirectoryException:
                     pass
+        # the feature directory is released by remove_feature, a custom target is not
+        destination = self.source.get('target', None)
+        if destination and os.path.exists(destination):
+            contentstore.release_directory(destination.rstrip(os.sep))
         FormulaBase.remove(self)
 
     def __install(self, config):
-        remove_common_prefix = (config.has('remove_common_prefix') and
-                                config.is_affirmative('remove_common_prefix'))
-        url_type = config.get('type', config.get('url'))
-        try:
-            if url_type.endswith("tar.gz") or url_type.endswith("tar.bz2") or url_type.endswith("tar"):
-                lib.extract_targz(config.get('url'), self._get_destination(),
-                                  remove_common_prefix=remove_common_prefix)
-
-            elif config.get('type', config.get('url')).endswith("zip"):
-                lib.extract_zip(config.get('url'), self._get_destination(),
-                                remove_common_prefix=remove_common_prefix)
-
-            elif config.get('type', config.get('url')).endswith("dmg"):
+        store = None
+        if config.is_affirmative('use_content_store', False):
+            store = ContentStore(os.path.join(self.environment.global_path, "store"))
+        if store and config.has('checksum') and store.has(_store_key(config.get('checksum'))):
+            # the archive has already been extracted by another feature
+            archive = None
+            marker = {'url': config.get('url'),
+                      'checksum': config.get('checksum'),
+                      'size': store.metadata(_store_key(config.get('checksum'))).get('size')}
+        else:
+            archive = lib.download_to_bytesio(config.get('url'))
+            if lib.detect_format(archive.getvalue(), hint=config.get('type', config.get('url')))[1] == 'dmg':
                 if not system.is_osx():
                     self.logger.warn("Non OSX based distributions can not install a dmg!")
-                else:
-                    lib.extract_dmg(config.get('url'), self._get_destination(),
-                                    remove_common_prefix=remove_common_prefix)
+                    return
+                # dmgs are installed from a mounted image, and aren't stored
+                store = None
+            marker = self.__build_marker(config, archive)
+        destination = self._get_destination().rstrip(os.sep)
+        # only directories sprinter owns are swapped, others are merged into
+        merge = os.path.exists(destination) and destination != self._install_directory()
+        staging_parent = destination if merge else os.path.dirname(destination)
+        if not os.path.exists(staging_parent):
+            os.makedirs(staging_parent)
+        staging_directory = tempfile.mkdtemp(
+            prefix=".%s-staging-" % os.path.basename(destination), dir=staging_parent)
+        try:
+            if store:
+                key = _store_key(marker['checksum'])
+                store.add(key, lambda d: self.__extract(config, archive, d),
+                          metadata={'url': marker['url'], 'size': marker['size']})
+                store.materialize(key, staging_directory)
+            else:
+                self.__extract(config, archive, staging_directory)
+            previous = None if merge else contentstore.read_marker(destination)
+            if merge:
+                self.__merge_in(staging_directory, destination)
+            else:
+                self.__swap_in(staging_directory, destination)
+            if store:
+                store.add_reference(key, destination)
+            if previous and previous != (store and (store.root_dir, key)):
+                ContentStore(previous[0]).remove_reference(previous[1], destination)
+            self.__write_marker(marker)
         except ExtractException:
             self.logger.warn("Unable to extract file for feature %s" % self.feature_name)
+        finally:
+            if os.path.exists(staging_directory):
+                shutil.rmtree(staging_directory, ignore_errors=True)
+
+    def __extract(self, config, archive, target_dir):
+        remove_common_prefix = (config.has('remove_common_prefix') and
+                                config.is_affirmative('remove_common_prefix'))
+        # the format is detected from the archive's contents, the type is only a hint
+        lib.extract_archive(archive, target_dir,
+                    filename=os.path.basename(config.get('url').split('?')[0]),
+                    hint=config.get('type', config.get('url')),
+                    remove_common_prefix=remove_common_prefix)
+
+    def __build_marker(self, config, archive):
+        """ checksum the downloaded archive, and validate it against the config """
+        checksum = "sha256:" + hashlib.sha256(archive.getvalue()).hexdigest()
+        if config.has('checksum') and config.get('checksum') != checksum:
+            raise UnpackFormulaException(
+                "Checksum mismatch for %s! expected %s, got %s" %
+                (config.get('url'), config.get('checksum'), checksum))
+        return {'url': config.get('url'),
+                'checksum': checksum,
+                'size': len(archive.getvalue())}
+
+    def __swap_in(self, staging_directory, destination):
+        """ replace the destination with the staging directory """
+        old_directory = None
+        if os.path.exists(destination):
+            old_directory = "%s-old-%s" % (staging_directory, os.getpid())
+            os.rename(destination, old_directory)
+        os.rename(staging_directory, destination)
+        if old_directory:
+            _remove_async(old_directory)
+
+    def __merge_in(self, staging_directory, destination):
+        """ move the staged files into the destination, without overwriting """
+        for name in os.listdir(staging_directory):
+            target_path = os.path.join(destination, name)
+            if not os.path.exists(target_path):
+                os.rename(os.path.join(staging_directory, name), target_path)
+
+    def __marker_path(self):
+        return os.path.join(self._install_directory(), MARKER_FILENAME)
+
+    def __read_marker(self):
+        """ return the marker of the last installed archive, if one exists """
+        if not os.path.exists(self.__marker_path()):
+            return None
+        try:
+            with open(self.__marker_path()) as fh:
+                return json.load(fh)
+        except ValueError:
+            return None
+
+    def __write_marker(self, marker):
+        if not os.path.exists(self._install_directory()):
+            os.makedirs(self._install_directory())
+        with open(self.__marker_path(), 'w+') as fh:
+            fh.write(json.dumps(marker, sort_keys=True))
+
+    def __requires_install(self, source, target):
+        """ return true if the archive at the destination differs from the target's """
+        marker = self.__read_marker()
+        if marker is None:
+            return source.get('url') != target.get('url')
+        if marker.get('url') != target.get('url'):
+            return True
+        return target.has('checksum') and marker.get('checksum') != target.get('checksum')
 
     def __symlink_executable(self, source, target):
         source_path = os.path.join(self.directory.install_directory(self.feature_name),
@@ -120,3 +240,15 @@ class UnpackFormula(FormulaBase):
         return self.target.get(
             'target', self.directory.install_directory(self.feature_name)
         )
+
+
+def _store_key(checksum):
+    """ return the content store key for an archive checksum """
+    return checksum.replace(':', '-')
+
+
+def _remove_async(path):
+    """ remove a directory tree in the background """
+    thread = threading.Thread(target=shutil.rmtree, args=(path, True))
+    thread.start()
+    return thread
@@ -1,9 +1,11 @@
 """Sprinter, an environment installation and management tool.
 Usage:
-  sprinter install <environment_source> [-avi -n <namespace> -u <username> -p <password> -l <local_path> --allow-bad-certificate]
-  sprinter update <environment_name> [-ravi -u <username> -p <password> --allow-bad-certificate]
+  sprinter install <environment_source> [-avi -n <namespace> -u <username> -p <password> -l <local_path> --allow-bad-certificate --clean --report <report_path> --trace <trace_path> --profile --profile-memory --profile-dir <profile_dir>]
+  sprinter update (<environment_name>... | --all) [-ravi -j <jobs> -u <username> -p <password> --allow-bad-certificate --report <report_path> --trace <trace_path> --profile --profile-memory --profile-dir <profile_dir>]
   sprinter (remove | deactivate | activate) <environment_name> [-v]
   sprinter validate <environment_source> [-avi -u <username> -p <password> --allow-bad-certificate]
+  sprinter validate --static <manifest_path>... [-v -j <jobs> --json]
+  sprinter plan <environment_source> [-av -n <namespace> -u <username> -p <password> --allow-bad-certificate --json]
   sprinter (list)
   sprinter globals [-r]
   sprinter (-h | --help)
@@ -20,9 +22,20 @@ Options:
   -l, --local <local_path>                  Intall the environment as a local. This installs objects relative to the local directory, and doesn't inject.
   -i, --ignore-errors                       Ignore errors in a formula
   --allow-bad-certificate                   Do not verify ssl certificates when pulling environment configurations
+  --clean                                   On install, remove a failed or unfinished install instead of resuming it
+  --json                                    On plan and validate --static, print the results as json
+  --static                                  On validate, check manifests without installing formulas or loading the global configuration
+  --report <report_path>                    Write a json report of where the run spent its time, and print a summary
+  --trace <trace_path>                      Write a trace of the run, to view in Perfetto or chrome://tracing
+  --profile                                 Profile each feature action with cProfile, and print the slowest functions
+  --profile-memory                          Compare memory snapshots before and after each feature action (python 3.4+)
+  --profile-dir <profile_dir>               The directory profiles are written to [default: sprinter-profile]
+  --all                                     On update, update every installed environment
+  -j <jobs>, --jobs <jobs>                  When updating or validating several environments, the number to process at once [default: 4]
   -V, --version                             Show version.
 """
 from __future__ import unicode_literals
+import json
 import logging
 import os
 import signal
@@ -31,11 +44,15 @@ import pkg_resources
 from docopt import docopt
 
 import sprinter.lib as lib
+from sprinter.lib import instrumentation, system
+from sprinter.lib.profiling import Profiler
 from sprinter.core import PHASE, Manifest, ManifestException, Directory, manifest
-from sprinter.environment import Environment
+from sprinter.environment import Environment, update_namespaces
 from sprinter.exceptions import SprinterException
 from sprinter.lib.request import BadCredentialsException
-from sprinter.core.globals import print_global_config, configure_config, write_config
+from sprinter.core.globals import print_global_config, configure_config, write_config, create_default_config
+from sprinter.core.plan import format_plan
+from sprinter.core import validator
 
 def signal_handler(signal, frame):
     print("\nShutting down sprinter...")
@@ -64,17 +81,31 @@ def error(message):
 def parse_args(argv, Environment=Environment):
     options = docopt(__doc__, argv=argv, version= pkg_resources.get_distribution('sprinter').version)
     logging_level = logging.DEBUG if options['--verbose'] else logging.INFO
+    instrumentation.reset()
+    if options['--trace']:
+        instrumentation.start_tracing()
+    profiler = None
+    if options['--profile'] or options['--profile-memory']:
+        profiler = Profiler(os.path.abspath(options['--profile-dir']),
+                            cpu=options['--profile'], memory=options['--profile-memory'])
+        profiler.start()
     # start processing commands
-    env = Environment(logging_level=logging_level, ignore_errors=options['--ignore-errors'])
+    if options['plan'] or options['--static']:
+        # a plan or a static validation doesn't use the global configuration, which prompts if it doesn't exist
+        env = Environment(logging_level=logging_level, global_config=create_default_config())
+    else:
+        env = Environment(logging_level=logging_level, ignore_errors=options['--ignore-errors'])
     try:
         if options['install']:
             target = options['<environment_source>']
 
             def handle_install_shutdown(signal, frame):
-                if env.phase == PHASE.INSTALL:
+                if env.phase == PHASE.INSTALL and env.clean:
                     print("Removing install...")
                     env.directory.remove()
                     env.clear_all()
+                elif env.phase == PHASE.INSTALL:
+                    print("Run the install again to resume it.")
                 signal_handler(signal, frame)
             signal.signal(signal.SIGINT, handle_install_shutdown)
             if options['--username'] or options['--auth']:
@@ -91,6 +122,7 @@ def parse_args(argv, Environment=Environment):
                     verify_certificate=(not options['--allow-bad-certificate'])
                 )
             env.target = target
+            env.clean = options['--clean']
             if options['--namespace']:
                 env.namespace = options['--namespace']
             if options['--local']:
@@ -98,8 +130,30 @@ def parse_args(argv, Environment=Environment):
                 env.custom_directory_root = os.path.abspath(os.path.expanduser(options['--local']))
             env.install()
 
+        elif options['update'] and (options['--all'] or len(options['<environment_name>']) > 1):
+            namespaces = options['<environment_name>']
+            if options['--all']:
+                namespaces = installed_namespaces(env.root)
+            use_auth = options['--username'] or options['--auth']
+            if use_auth:
+                options = get_credentials(options, ", ".join(namespaces))
+            results = update_namespaces(
+                namespaces, env,
+                jobs=int(options['--jobs']),
+                reconfigure=options['--reconfigure'],
+                username=options['<username>'] if use_auth else None,
+                password=options['<password>'] if use_auth else None,
+                verify_certificate=(not options['--allow-bad-certificate'])
+            )
+            print("Updated %s environments:" % len(results))
+            for namespace, update_error in results:
+                print("  %s: %s" % (namespace, "failed! %s" % update_error if update_error else "ok"))
+            failed = [namespace for namespace, update_error in results if update_error]
+            if failed:
+                raise SprinterException("Unable to update %s!" % ", ".join(failed))
+
         elif options['update']:
-            target = options['<environment_name>']
+            target = options['<environment_name>'][0]
             env.directory = Directory(os.path.join(env.root, target),
                                       shell_util_path=env.shell_util_path)
             env.source = manifest.load_manifest(
@@ -117,31 +171,31 @@ def parse_args(argv, Environment=Environment):
             env.update(reconfigure=options['--reconfigure'])
 
         elif options["remove"]:
-            env.directory = Directory(os.path.join(env.root, options['<environment_name>']),
+            env.directory = Directory(os.path.join(env.root, options['<environment_name>'][0]),
                                       shell_util_path=env.shell_util_path)
             env.source = manifest.load_manifest(
                 env.directory.manifest_path,
-                namespace=options['<environment_name>'],
+                namespace=options['<environment_name>'][0],
                 do_inherit=False
             )
             env.remove()
 
         elif options['deactivate']:
-            env.directory = Directory(os.path.join(env.root, options['<environment_name>']),
+            env.directory = Directory(os.path.join(env.root, options['<environment_name>'][0]),
                                       shell_util_path=env.shell_util_path)
             env.source = manifest.load_manifest(
                 env.directory.manifest_path,
-                namespace=options['<environment_name>'],
+                namespace=options['<environment_name>'][0],
                 do_inherit=False
             )
             env.deactivate()
 
         elif options['activate']:
-            env.directory = Directory(os.path.join(env.root, options['<environment_name>']),
+            env.directory = Directory(os.path.join(env.root, options['<environment_name>'][0]),
                                       shell_util_path=env.shell_util_path)
             env.source = manifest.load_manifest(
                 env.directory.manifest_path,
-                namespace=options['<environment_name>'],
+                namespace=options['<environment_name>'][0],
                 do_inherit=False
             )
             env.activate()
@@ -151,6 +205,20 @@ def parse_args(argv, Environment=Environment):
                 if _env != ".global":
                     print(_env)
 
+        elif options['validate'] and options['--static']:
+            results = validator.validate_manifests(options['<manifest_path>'], jobs=int(options['--jobs']))
+            if options['--json']:
+                print(json.dumps(dict(results), indent=2, sort_keys=True))
+            else:
+                for source, problems in results:
+                    print(validator.format_problems(source, problems))
+            invalid = [source for source, problems in results if validator.has_errors(problems)]
+            if invalid:
+                # invalid manifests aren't a failure of sprinter, so no debug log is written
+                if not options['--json']:
+                    print("%s of %s manifests are invalid!" % (len(invalid), len(results)))
+                sys.exit(1)
+
         elif options['validate']:
             if options['--username'] or options['--auth']:
                 options = get_credentials(options, parse_domain(target))
@@ -166,6 +234,32 @@ def parse_args(argv, Environment=Environment):
                 print("No errors! Manifest is valid!")
             else:
                 "Manifest is invalid! Please see errors above."
+        elif options['plan']:
+            target = options['<environment_source>']
+            use_auth = options['--username'] or options['--auth']
+            if use_auth:
+                options = get_credentials(options, parse_domain(target))
+            env.target = manifest.load_manifest(
+                target,
+                username=options['<username>'] if use_auth else None,
+                password=options['<password>'] if use_auth else None,
+                verify_certificate=(not options['--allow-bad-certificate'])
+            )
+            env.namespace = options['--namespace'] or env.target.namespace
+            directory = Directory(os.path.join(env.root, env.namespace),
+                                  shell_util_path=env.shell_util_path)
+            if not directory.new:
+                env.directory = directory
+                env.source = manifest.load_manifest(
+                    directory.manifest_path, do_inherit=False
+                )
+            plan = env.plan()
+            if options['--json']:
+                print(json.dumps({'namespace': env.namespace, 'features': plan},
+                                 indent=2, sort_keys=True))
+            else:
+                print(format_plan(env.namespace, plan))
+
         elif options['globals']:
             if options['--reconfigure']:
                 configure_config(env.global_config, reconfigure=True)
@@ -195,6 +289,36 @@ the sprinter action failed! Writing debug output to /tmp/sprinter.log
 =====================================================================
         """.strip())
         raise
+    finally:
+        if options['--report']:
+            write_report(env, options)
+        if options['--trace']:
+            instrumentation.write_trace(options['--trace'])
+            env.logger.info("Wrote trace to %s" % options['--trace'])
+        if profiler:
+            profiler.stop()
+            env.logger.info(profiler.summary())
+
+
+def write_report(env, options):
+    """ write the instrumentation report of the run, and print its summary """
+    command = [c for c in ('install', 'update') if options[c]][0]
+    instrumentation.write_report(options['--report'],
+                                 command=command,
+                                 namespace=env.namespace,
+                                 host=system.NODE,
+                                 error=env.error_occured)
+    env.logger.info(instrumentation.summary())
+    env.logger.info("Wrote report to %s" % options['--report'])
+
+
+def installed_namespaces(root):
+    """ return the namespaces installed in the sprinter root """
+    if not os.path.isdir(root):
+        return []
+    return sorted(namespace for namespace in os.listdir(root)
+                  if namespace != ".global" and
+                  os.path.exists(os.path.join(root, namespace, "manifest.cfg")))
 
 
 def parse_domain(url):
@@ -23,10 +23,12 @@ BOOLEAN_DEFAULTS = {
     'yes_no': { True: ' (YES|no): ', False: ' (yes|NO): ' }
 }
 
-from .extract import extract_dmg, extract_targz, extract_zip, remove_path, ExtractException
-from .command import call, whitespace_smart_split, which, is_executable, CommandMissingException
+from .extract import detect_format, extract_archive, extract_dmg, extract_file, extract_tar, extract_targz, extract_zip, remove_path, ExtractException
+from .command import (call, whitespace_smart_split, which, is_executable, path_prepended,
+                      CommandMissingException)
 from .module import get_subclass_from_module
-from .request import CertificateException, BadCredentialsException, authenticated_get, cleaned_request
+from .request import (CertificateException, BadCredentialsException, ChecksumException, authenticated_get,
+                      cached_get, cleaned_request, download_to_bytesio, download_to_cache, file_checksum)
 
 
 def prompt(prompt_string, default=None, secret=False, boolean=False, bool_type=None):
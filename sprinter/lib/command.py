@@ -3,11 +3,18 @@ import os
 import logging
 import subprocess
 import sys
+import threading
+from contextlib import contextmanager
+
+from . import instrumentation
 
 COMMAND_WHITELIST = ["cd"]
 
 logger = logging.getLogger(__name__)
 
+# paths prepended to the PATH of commands called from each thread
+_local = threading.local()
+
 
 class CommandMissingException(Exception):
     """ Return if command doesn't exist """
@@ -28,15 +35,20 @@ def call(command, stdin=None, stdout=subprocess.PIPE, env=os.environ, cwd=None,
         logger.debug("calling command with sensitive information")
     try:
         args = command if shell else whitespace_smart_split(command)
+        if getattr(_local, 'paths', None):
+            env = dict(env or os.environ)
+            env['PATH'] = search_path(env.get('PATH', ''))
         kw = {}
         if not shell and not which(args[0], cwd=cwd):
             raise CommandMissingException(args[0])
         if shell:
             kw['shell'] = True
-        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=stdout,
-                                   stderr=subprocess.STDOUT, env=env, cwd=cwd,
-                                   **kw)
-        output = process.communicate(input=stdin)[0]
+        with instrumentation.timer('subprocess',
+                                   label="sensitive command" if sensitive_info else command_label(args)):
+            process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=stdout,
+                                       stderr=subprocess.STDOUT, env=env, cwd=cwd,
+                                       **kw)
+            output = process.communicate(input=stdin)[0]
         if output is not None:
             try:
                 logger.log(output_log_level, output.decode('utf-8'))
@@ -53,6 +65,38 @@ def call(command, stdin=None, stdout=subprocess.PIPE, env=os.environ, cwd=None,
         raise e
 
 
+def command_label(args):
+    """
+    return the name of the executable called, to label a command with
+    in reports and traces, as its arguments may hold credentials
+    """
+    if not isinstance(args, (list, tuple)):
+        # skip the variables a shell command may be prefixed with
+        args = [a for a in args.split() if '=' not in a][:1]
+    return os.path.basename(args[0]) if args else ''
+
+
+@contextmanager
+def path_prepended(path):
+    """
+    prepend path to the PATH of commands called from the current thread,
+    without changing the PATH of the process, which other threads share
+    """
+    previous = getattr(_local, 'paths', [])
+    _local.paths = [path] + previous
+    try:
+        yield
+    finally:
+        _local.paths = previous
+
+
+def search_path(path=None):
+    """ return the PATH commands are searched in from the current thread """
+    if path is None:
+        path = os.environ.get("PATH", "")
+    return os.pathsep.join(getattr(_local, 'paths', []) + [path])
+
+
 def whitespace_smart_split(command):
     """
     Split a command by whitespace, taking care to not split on
@@ -105,7 +149,7 @@ def which(program, cwd=None):
         if is_executable(os.path.join((cwd or os.path.curdir), program)):
             return program
     else:
-        for path in os.environ["PATH"].split(os.pathsep):
+        for path in search_path().split(os.pathsep):
             path = path.strip('"')
             exe_file = os.path.join(path, program)
             if is_executable(exe_file):
@@ -0,0 +1,176 @@
+"""
+debuglog.py keeps the debug log of a run, so a failure can be triaged
+without running it again.
+
+Records are kept as json lines, with the feature and phase running in
+the thread that logged them, in a ring buffer bounded in bytes. Records
+that no longer fit spill to a log file for the run, and the rest are
+flushed to it when the run fails. Only the logs of the last few runs
+are kept. A run's log is rotated to numbered files once it gets too
+large (.1 being the newest), and only the last few of those are kept.
+"""
+from __future__ import unicode_literals
+import io
+import json
+import logging
+import os
+import time
+import traceback
+from collections import deque
+
+from six import text_type
+
+from . import instrumentation
+
+# the most bytes of records kept in memory
+RING_BYTES = 1024 * 1024
+# the size at which the log of a run is rotated
+MAX_LOG_BYTES = 20 * 1024 * 1024
+# the number of rotated logs kept for a run
+KEEP_ROTATED = 5
+# the number of run logs kept
+KEEP_LOGS = 10
+LOG_EXTENSION = ".jsonl"
+
+
+class DebugLog(logging.Handler):
+
+    log_dir = None  # the directory run logs are written to, if any
+    path = None  # the log of this run, once records have spilled to it
+
+    def __init__(self, log_dir=None, ring_bytes=RING_BYTES, max_log_bytes=MAX_LOG_BYTES, keep_logs=KEEP_LOGS,
+                 keep_rotated=KEEP_ROTATED):
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.log_dir = log_dir
+        self.ring_bytes = ring_bytes
+        self.max_log_bytes = max_log_bytes
+        self.keep_logs = keep_logs
+        self.keep_rotated = keep_rotated
+        self._log = None  # the open log of the run
+        self._log_bytes = 0  # the bytes written to it
+        self._ring = deque()  # (sequence number, record, line)
+        self._ring_size = 0
+        self._sequence = 0
+        self._written = 0  # the sequence number of the last record written to the log
+        self.dropped = 0  # records that no longer fit, with nowhere to spill to
+
+    def emit(self, record):
+        try:
+            entry = self.to_dict(record)
+            line = json.dumps(entry)
+        except Exception:
+            self.handleError(record)
+            return
+        self._sequence += 1
+        self._ring.append((self._sequence, entry, line))
+        self._ring_size += len(line)
+        while self._ring_size > self.ring_bytes and len(self._ring) > 1:
+            sequence, _, line = self._ring.popleft()
+            self._ring_size -= len(line)
+            self._spill(sequence, line)
+
+    def to_dict(self, record):
+        """ return a log record as a dictionary, with the feature and phase it was logged in """
+        action = instrumentation.recorder.current_action() or {}
+        entry = {
+            'timestamp': record.created,
+            'time': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created)),
+            'level': record.levelname,
+            'logger': record.name,
+            'namespace': action.get('namespace'),
+            'feature': action.get('feature'),
+            'phase': action.get('phase'),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = "".join(traceback.format_exception(*record.exc_info))
+        return entry
+
+    def records(self):
+        """ return the records still held in memory, oldest first """
+        self.acquire()
+        try:
+            return [entry for _, entry, _ in self._ring]
+        finally:
+            self.release()
+
+    def flush(self):
+        """ write every record held in memory to the log of the run """
+        self.acquire()
+        try:
+            for sequence, _, line in self._ring:
+                self._spill(sequence, line)
+            if self._log is not None:
+                self._log.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        """ close the log of the run """
+        self.acquire()
+        try:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+    def format_records(self):
+        """ return the records held in memory, for people to read """
+        lines = []
+        for entry in self.records():
+            where = " [%s %s]" % (entry['feature'], entry['phase']) if entry['feature'] else ""
+            lines.append("%s%s %s" % (entry['time'], where, entry['message']))
+            if 'exception' in entry:
+                lines.append(entry['exception'].rstrip("\n"))
+        return "\n".join(lines)
+
+    def _spill(self, sequence, line):
+        if sequence <= self._written:
+            return
+        if not self.log_dir:
+            self.dropped += 1
+            return
+        if self._log is None:
+            if self.path is None:
+                self.path = self._start_log()
+            self._log = self._open_log()
+            self._log_bytes = self._log.tell()
+        elif self._log_bytes > self.max_log_bytes:
+            self._rotate()
+        self._log.write(text_type(line) + "\n")
+        # lines are json, which is ascii
+        self._log_bytes += len(line) + 1
+        self._written = sequence
+
+    def _rotate(self):
+        """ move the run log to .1, shifting older rotated logs up and removing the oldest """
+        self._log.close()
+        oldest = "%s.%d" % (self.path, self.keep_rotated)
+        if os.path.exists(oldest):
+            os.unlink(oldest)
+        for number in range(self.keep_rotated - 1, 0, -1):
+            rotated = "%s.%d" % (self.path, number)
+            if os.path.exists(rotated):
+                os.rename(rotated, "%s.%d" % (self.path, number + 1))
+        os.rename(self.path, self.path + ".1")
+        self._log = self._open_log()
+        self._log_bytes = 0
+
+    def _open_log(self):
+        # line buffered, so spilled records are on disk even if the run is killed
+        return io.open(self.path, 'a', buffering=1, encoding='utf-8')
+
+    def _start_log(self):
+        """ return the path of a new run log, removing the oldest logs beyond keep_logs """
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+        logs = sorted(f for f in os.listdir(self.log_dir) if LOG_EXTENSION in f)
+        runs = sorted(set(f.split(LOG_EXTENSION)[0] for f in logs))
+        for run in runs[:max(len(runs) - self.keep_logs + 1, 0)]:
+            for f in logs:
+                if f.split(LOG_EXTENSION)[0] == run:
+                    os.unlink(os.path.join(self.log_dir, f))
+        name = "sprinter-%s-%d%s" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(), LOG_EXTENSION)
+        return os.path.join(self.log_dir, name)
@@ -2,78 +2,564 @@
 Utilities that extract files from packages
 """
 from __future__ import unicode_literals
+import bz2
+import io
+import logging
+import multiprocessing
 import os
 import shutil
+import stat
+import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
+import time
 import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
 
-from .command import call
+from . import instrumentation
+from .command import call, which
 from .request import download_to_bytesio
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_WORKERS = max(2, min(8, multiprocessing.cpu_count()))
+
+# magic bytes at the start of compressed streams
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zst'),
+]
+
+# compressions tarfile can decompress as it reads a stream
+TAR_STREAM_COMPRESSIONS = set([None, 'gz', 'bz2'])
+if 'xz' in tarfile.TarFile.OPEN_METH:
+    TAR_STREAM_COMPRESSIONS.add('xz')
+
+# file suffixes for each compression, used to name single file downloads
+COMPRESSION_SUFFIXES = {
+    'gz': ['.gz', '.tgz'],
+    'bz2': ['.bz2', '.tbz2'],
+    'xz': ['.xz', '.txz'],
+    'zst': ['.zst', '.tzst'],
+}
+
 
 class ExtractException(Exception):
     """ Returned if there was an issue with extracting a package """
 
-def extract_targz(url, target_dir, remove_common_prefix=False, overwrite=False):
-    extract_tar(url, target_dir, additional_compression="gz",
-                remove_common_prefix=remove_common_prefix, overwrite=overwrite)
 
-def extract_tar(url, target_dir, additional_compression="", remove_common_prefix=False, overwrite=False):
-    """ extract a targz and install to the target directory """
+def open_archive(url):
+    """
+    return a file object for the archive. url can either be a url to
+    download, or an already opened file object.
+    """
+    if hasattr(url, 'read'):
+        url.seek(0)
+        return url
+    return download_to_bytesio(url)
+
+def detect_compression(data):
+    """ return the compression of the data, or None if it is not compressed """
+    for magic, compression in COMPRESSION_MAGIC:
+        if data.startswith(magic):
+            return compression
+    return None
+
+
+def detect_format(data, hint=""):
+    """
+    detect the format of an archive from its magic bytes, returning
+    a tuple of the compression (or None) and the container, one of
+    'tar', 'zip', 'dmg' or 'file'.
+
+    hint is the file name or type of the archive, and is only used
+    when the contents are inconclusive.
+    """
+    compression = detect_compression(data)
+    head = decompress(data, compression, head=True) if compression else data
+    if head.startswith(b'PK\x03\x04') or head.startswith(b'PK\x05\x06'):
+        return (compression, 'zip')
+    if head[257:262] == b'ustar':
+        return (compression, 'tar')
+    if compression is None and data[-512:-508] == b'koly':
+        return (None, 'dmg')
+    hint = hint.lower()
+    if hint.endswith('dmg'):
+        return (compression, 'dmg')
+    if hint.endswith('zip'):
+        return (compression, 'zip')
+    if '.tar' in hint or hint.startswith('tar') or hint.endswith('tgz'):
+        return (compression, 'tar')
+    return (compression, 'file')
+
+
+def decompress(data, compression, head=False):
+    """
+    decompress data with the fastest available decompressor: an in
+    process library if one is installed, otherwise the command line
+    tool. if head is true, only the first few kilobytes are returned.
+    """
+    if compression is None:
+        return data
+    if compression == 'gz':
+        return _gunzip(data, head=head)
+    if compression == 'bz2':
+        if head:
+            return _decompress_head(bz2.BZ2Decompressor(), data)
+        return bz2.decompress(data)
+    if compression == 'xz':
+        if lzma is not None:
+            if head:
+                return _decompress_head(lzma.LZMADecompressor(), data)
+            return lzma.decompress(data)
+        return _decompress_with_command(['xz', '-dc'], data, head=head)
+    if compression == 'zst':
+        if zstandard is not None:
+            reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+            return reader.read(HEAD_OUTPUT_SIZE) if head else reader.read()
+        return _decompress_with_command(['zstd', '-dc'], data, head=head)
+    raise ExtractException("Unsupported compression %s!" % compression)
+
+
+def extract_archive(url, target_dir, filename=None, hint="", remove_common_prefix=False,
+            overwrite=False):
+    """
+    extract an archive of any supported format into the target
+    directory. Single compressed or uncompressed files are written to
+    target_dir/filename, with the compression suffix removed.
+    """
+    fileobj = open_archive(url)
+    data = fileobj.read()
+    filename = filename or (os.path.basename(url.split('?')[0]) if not hasattr(url, 'read') else "")
+    compression, container = detect_format(data, hint=hint or filename)
+    logger.debug("Detected %s archive with compression %s" % (container, compression))
+    if container == 'tar':
+        return extract_tar(io.BytesIO(data), target_dir,
+                           remove_common_prefix=remove_common_prefix, overwrite=overwrite)
+    if container == 'zip':
+        return extract_zip(io.BytesIO(decompress(data, compression)), target_dir,
+                           remove_common_prefix=remove_common_prefix, overwrite=overwrite)
+    if container == 'dmg':
+        return extract_dmg(io.BytesIO(data), target_dir,
+                           remove_common_prefix=remove_common_prefix, overwrite=overwrite)
+    return extract_file(io.BytesIO(data), target_dir, filename, overwrite=overwrite)
+
+
+def extract_file(url, target_dir, filename, overwrite=False):
+    """ decompress a single file download into target_dir """
+    data = open_archive(url).read()
+    compression = detect_compression(data)
+    for suffix in COMPRESSION_SUFFIXES.get(compression, []):
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+            break
+    if not filename:
+        raise ExtractException("Unable to determine a file name to extract to!")
     try:
         if not os.path.exists(target_dir):
             os.makedirs(target_dir)
-        tf = tarfile.TarFile.open(fileobj=download_to_bytesio(url))
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-        common_prefix = os.path.commonprefix(tf.getnames())
-        if not common_prefix.endswith('/'):
-            common_prefix += "/"
-        for tfile in tf.getmembers():
-            if remove_common_prefix:
-                tfile.name = tfile.name.replace(common_prefix, "", 1)
-            if tfile.name != "":
-                target_path = os.path.join(target_dir, tfile.name)
-                if target_path != target_dir and os.path.exists(target_path):
-                    if overwrite:
-                        remove_path(target_path)
-                    else:
-                        continue
-                tf.extract(tfile, target_dir)
-    except OSError:
+        target_path = os.path.join(target_dir, filename)
+        if os.path.exists(target_path):
+            if not overwrite:
+                return {'files': 0, 'bytes': 0}
+            remove_path(target_path)
+        data = decompress(data, compression)
+        with open(target_path, 'wb') as fh:
+            fh.write(data)
+        instrumentation.count('files_written')
+        instrumentation.count('bytes_extracted', len(data))
+        return {'files': 1, 'bytes': len(data)}
+    except (OSError, IOError):
         e = sys.exc_info()[1]
         raise ExtractException(str(e))
-    except IOError:
+
+
+def extract_targz(url, target_dir, remove_common_prefix=False, overwrite=False):
+    return extract_tar(url, target_dir, additional_compression="gz",
+                       remove_common_prefix=remove_common_prefix, overwrite=overwrite)
+
+
+def extract_tar(url, target_dir, additional_compression="", remove_common_prefix=False,
+                overwrite=False, workers=None):
+    """
+    extract a tar and install to the target directory. The archive is
+    decompressed as it is read, and each member is handed to the pool
+    as soon as it has been read.
+    """
+    engine = None
+    try:
+        if not os.path.exists(target_dir):
+            os.makedirs(target_dir)
+        fileobj = open_archive(url)
+        common_prefix = ""
+        if remove_common_prefix:
+            # the names are only known once the whole stream has been read
+            common_prefix = _common_prefix(_open_tar_stream(fileobj).getnames())
+            fileobj.seek(0)
+        tf = _open_tar_stream(fileobj)
+        engine = ParallelExtractor(target_dir, overwrite=overwrite, workers=workers)
+        for tfile in tf:
+            name = _strip_prefix(tfile.name, common_prefix, remove_common_prefix)
+            if tfile.isdir():
+                engine.add_directory(name, tfile.mode)
+            elif tfile.issym():
+                engine.add_symlink(name, tfile.linkname)
+            elif tfile.islnk():
+                engine.add_hardlink(name, _strip_prefix(tfile.linkname, common_prefix,
+                                                        remove_common_prefix))
+            elif tfile.isfile() and engine.prepare_file(name):
+                engine.write_async(name, tf.extractfile(tfile).read(), tfile.mode, tfile.mtime)
+        return engine.finish()
+    except (OSError, IOError, tarfile.TarError):
         e = sys.exc_info()[1]
         raise ExtractException(str(e))
+    finally:
+        if engine is not None:
+            engine.close()
 
 
-def extract_zip(url, target_dir, remove_common_prefix=False, overwrite=False):
+def extract_zip(url, target_dir, remove_common_prefix=False, overwrite=False, workers=None):
+    engine = None
+    archive_path = None
+    handles = []
     try:
         if not os.path.exists(target_dir):
             os.makedirs(target_dir)
-        memory_file = download_to_bytesio(url)
+        memory_file = open_archive(url)
         zip_file = zipfile.ZipFile(memory_file)
-        common_prefix = os.path.commonprefix(zip_file.namelist())
+        common_prefix = _common_prefix(zip_file.namelist())
+        engine = ParallelExtractor(target_dir, overwrite=overwrite, workers=workers)
         for zip_file_info in zip_file.infolist():
-            target_path = zip_file_info.filename
-            if remove_common_prefix:
-                target_path = target_path.replace(common_prefix, "", 1)
-            if target_path != "":
-                target_full_path = os.path.join(target_dir, target_path)
-                if os.path.exists(target_full_path):
-                    if overwrite:
-                        remove_path(target_full_path)
-                    else:
-                        continue
-                zip_file_info.filename = target_path
-                zip_file.extract(zip_file_info, target_dir)
+            name = _strip_prefix(zip_file_info.filename, common_prefix, remove_common_prefix)
+            mode = zip_file_info.external_attr >> 16
+            if zip_file_info.filename.endswith('/'):
+                engine.add_directory(name, mode or None)
+            elif stat.S_ISLNK(mode):
+                engine.add_symlink(name, zip_file.read(zip_file_info).decode('utf-8'))
+            else:
+                engine.add_file(name, zip_file_info.filename, mode or None, None)
+        engine.create_skeleton()
+        # zip members are compressed independently, so each worker thread
+        # reads from its own handle on the archive, spooled to disk once.
+        archive_path = _spool_to_disk(memory_file)
+        local = threading.local()
+        handles_lock = threading.Lock()
+
+        def read_member(archive_name):
+            if not hasattr(local, 'zip_file'):
+                handle = open(archive_path, 'rb')
+                with handles_lock:
+                    handles.append(handle)
+                local.zip_file = zipfile.ZipFile(handle)
+            return local.zip_file.read(archive_name)
+
+        for name, archive_name, mode, mtime in engine.files:
+            engine.read_and_write_async(name, read_member, archive_name, mode, mtime)
+        return engine.finish()
     except OSError:
         raise ExtractException()
     except IOError:
         raise ExtractException()
+    finally:
+        if engine is not None:
+            engine.close()
+        for handle in handles:
+            handle.close()
+        if archive_path is not None:
+            os.unlink(archive_path)
+
+
+class ParallelExtractor(object):
+    """
+    Extracts archive members into a target directory with a pool of
+    worker threads.
+
+    Members are registered first, then the directory skeleton is
+    created once, file contents are written concurrently, and links
+    and directory modes are applied last, once their targets exist.
+    Archives read as a stream instead prepare each file as it is read.
+    """
+
+    def __init__(self, target_dir, overwrite=False, workers=None):
+        self.target_dir = os.path.abspath(target_dir)
+        self.overwrite = overwrite
+        self.workers = workers or EXTRACT_WORKERS
+        # existing paths are only checked for when extracting into a non-empty directory
+        self.check_existing = bool(os.listdir(self.target_dir))
+        self.directories = []
+        self.files = []
+        self.symlinks = []
+        self.hardlinks = []
+        self.stats = {'files': 0, 'bytes': 0, 'seconds': 0}
+        self._start = time.time()
+        self._pool = None
+        self._created = set()  # directories known to exist
+        self._results = []
+        self._pending = threading.BoundedSemaphore(self.workers * 4)
+        self._lock = threading.Lock()
+
+    def add_directory(self, name, mode):
+        if self._accept(name):
+            self.directories.append((name, mode))
+
+    def add_file(self, name, member, mode, mtime):
+        """ member is the archive's own handle to the file, passed back when writing """
+        if self._accept(name):
+            self.files.append((name, member, mode, mtime))
+
+    def add_symlink(self, name, link_target):
+        if self._accept(name):
+            self.symlinks.append((name, link_target))
+
+    def add_hardlink(self, name, link_target):
+        if self._accept(name):
+            self.hardlinks.append((name, link_target))
+
+    def prepare_file(self, name):
+        """
+        return true if a file read from a stream should be written,
+        creating its directory first
+        """
+        if not self._accept(name):
+            return False
+        self._make_directory(os.path.dirname(name))
+        return True
+
+    def create_skeleton(self):
+        """ create every directory needed by the archive, once """
+        needed = set(name for name, _ in self.directories)
+        for name, _, _, _ in self.files:
+            needed.add(os.path.dirname(name))
+        for name, _ in self.symlinks + self.hardlinks:
+            needed.add(os.path.dirname(name))
+        for name in sorted(needed):
+            self._make_directory(name)
+
+    def write_async(self, name, data, mode, mtime):
+        """ write already read member contents on a worker thread """
+        self._pending.acquire()
+        self._results.append(self._get_pool().apply_async(
+            self._run, (self._write, name, data, mode, mtime)))
+
+    def read_and_write_async(self, name, reader, archive_name, mode, mtime):
+        """ read and write member contents on a worker thread """
+        self._pending.acquire()
+
+        def read_and_write():
+            return self._write(name, reader(archive_name), mode, mtime)
+        self._results.append(self._get_pool().apply_async(self._run, (read_and_write,)))
+
+    def finish(self):
+        """ wait for all writes, create links, and return the extraction stats """
+        self.close()
+        for result in self._results:
+            # re-raises any exception from the worker
+            result.get()
+        self.create_skeleton()
+        for name, link_target in self.symlinks:
+            path = os.path.join(self.target_dir, name)
+            if os.path.lexists(path):
+                os.unlink(path)
+            os.symlink(link_target, path)
+        for name, link_target in self.hardlinks:
+            path = os.path.join(self.target_dir, name)
+            source = os.path.join(self.target_dir, link_target)
+            if not _is_within(source, self.target_dir):
+                logger.warn("Not linking %s to %s, which is outside of %s!" %
+                            (name, link_target, self.target_dir))
+                continue
+            if os.path.lexists(path):
+                os.unlink(path)
+            try:
+                os.link(source, path)
+            except OSError:
+                shutil.copy2(source, path)
+        # directory modes are applied last, in case they are not writable
+        for name, mode in reversed(self.directories):
+            if mode:
+                os.chmod(os.path.join(self.target_dir, name), stat.S_IMODE(mode))
+        self.stats['seconds'] = time.time() - self._start
+        instrumentation.count('extract_count')
+        instrumentation.count('extract_seconds', self.stats['seconds'])
+        instrumentation.count('files_written', self.stats['files'])
+        instrumentation.count('bytes_extracted', self.stats['bytes'])
+        logger.debug("Extracted %(files)d files (%(bytes)d bytes) in %(seconds).2fs" % self.stats +
+                     " (%.2f MB/s)" % (self.stats['bytes'] / 1048576.0 / max(self.stats['seconds'], 0.001)))
+        return self.stats
+
+    def close(self):
+        """ wait for the writes handed to the pool, and stop it """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+        return self._pool
+
+    def _make_directory(self, name):
+        if name and name not in self._created:
+            path = os.path.join(self.target_dir, name)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self._created.add(name)
+
+    def _accept(self, name):
+        """ return true if the member should be extracted """
+        if name == "" or name.startswith('/') or '..' in name.split('/'):
+            return False
+        if self.check_existing:
+            path = os.path.join(self.target_dir, name)
+            if os.path.lexists(path):
+                if not self.overwrite:
+                    return False
+                remove_path(path)
+        return True
+
+    def _write(self, name, data, mode, mtime):
+        path = os.path.join(self.target_dir, name)
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        if mode:
+            os.chmod(path, stat.S_IMODE(mode))
+        if mtime:
+            os.utime(path, (mtime, mtime))
+        with self._lock:
+            self.stats['files'] += 1
+            self.stats['bytes'] += len(data)
+
+    def _run(self, func, *args):
+        """ run a task on a worker thread, freeing its slot when done """
+        try:
+            return func(*args)
+        finally:
+            self._pending.release()
+
+
+HEAD_INPUT_SIZE = 64 * 1024
+HEAD_OUTPUT_SIZE = 4 * 1024
+
+
+def _gunzip(data, head=False):
+    """ decompress gzip data, including multi-member streams """
+    output = []
+    while data:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if head:
+            return _decompress_head(decompressor, data)
+        output.append(decompressor.decompress(data))
+        output.append(decompressor.flush())
+        data = decompressor.unused_data
+    return b''.join(output)
+
+
+def _decompress_head(decompressor, data):
+    """
+    decompress the first few kilobytes of data, feeding the decompressor
+    input until it has produced them. bzip2 only outputs anything once
+    it has read a whole block, which can be up to 900k.
+    """
+    output = []
+    size = 0
+    for offset in range(0, len(data), HEAD_INPUT_SIZE):
+        try:
+            chunk = decompressor.decompress(data[offset:offset + HEAD_INPUT_SIZE])
+        except EOFError:
+            break
+        output.append(chunk)
+        size += len(chunk)
+        if size >= HEAD_OUTPUT_SIZE:
+            break
+    return b''.join(output)
+
+
+def _decompress_with_command(command, data, head=False):
+    if not which(command[0]):
+        raise ExtractException("No decompressor for %s is available! Please install %s." %
+                               (command[0], command[0]))
+    if head:
+        data = data[:HEAD_INPUT_SIZE]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    output, error = process.communicate(data)
+    # a truncated head is expected to fail, whatever was decompressed is enough
+    if process.returncode != 0 and not head:
+        raise ExtractException("%s failed: %s" % (" ".join(command), error.decode('utf-8', 'replace')))
+    return output
+
+
+def _spool_to_disk(fileobj):
+    """ write a file object to a temporary file in chunks, returning its path """
+    fd, path = tempfile.mkstemp(prefix="sprinter-archive-")
+    fileobj.seek(0)
+    with os.fdopen(fd, 'wb') as fh:
+        shutil.copyfileobj(fileobj, fh)
+    return path
+
+
+def _open_tar_stream(fileobj):
+    """
+    open a tar to read its members in order, decompressing it as it is
+    read if tarfile supports the compression, or all at once otherwise
+    """
+    compression = detect_compression(fileobj.read(8))
+    fileobj.seek(0)
+    if compression in TAR_STREAM_COMPRESSIONS:
+        return tarfile.open(fileobj=fileobj, mode='r|*')
+    return tarfile.open(fileobj=io.BytesIO(decompress(fileobj.read(), compression)), mode='r|')
+
+
+def _is_within(path, directory):
+    """ return true if path resolves to a path inside directory """
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def _common_prefix(names):
+    """ return the directory path shared by all names, with a trailing slash """
+    common = None
+    for name in names:
+        parts = name.rstrip('/').split('/')
+        if common is None:
+            common = parts
+        else:
+            i = 0
+            while i < min(len(common), len(parts)) and common[i] == parts[i]:
+                i += 1
+            common = common[:i]
+    return "/".join(common or []) + "/"
+
+
+def _strip_prefix(name, common_prefix, remove_common_prefix):
+    """ return the member name relative to the extraction directory """
+    name = name.rstrip('/')
+    if remove_common_prefix:
+        if name + '/' == common_prefix:
+            return ""
+        if name.startswith(common_prefix):
+            name = name[len(common_prefix):]
+    return name
 
 
 def extract_dmg(url, target_dir, remove_common_prefix=False, overwrite=False):
@@ -85,7 +571,7 @@ def extract_dmg(url, target_dir, remove_common_prefix=False, overwrite=False):
             os.makedirs(target_dir)
         temp_file = os.path.join(tmpdir, "temp.dmg")
         with open(temp_file, 'wb+') as fh:
-            fh.write(download_to_bytesio(url).read())
+            fh.write(open_archive(url).read())
         call("hdiutil attach %s -mountpoint /Volumes/a/" % temp_file)
         for f in os.listdir("/Volumes/a/"):
             if not f.startswith(".") and f != ' ':
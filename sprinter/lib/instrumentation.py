@@ -0,0 +1,224 @@
+"""
+instrumentation.py keeps timers and counters over a sprinter run: the
+wall time of each feature action, and the subprocesses, requests,
+downloads, extractions and file writes done during them.
+
+Counters are recorded in the totals of the run, and against the
+action running in the current thread, so a report can show which
+features are slow and what they spend their time on. Work handed off
+to other threads only shows up in the totals.
+
+When tracing, every action, timer and span is also kept as an event
+in the Chrome Trace Event format (viewable in Perfetto or
+about:tracing), with the thread it ran on so parallel work is visible.
+"""
+from __future__ import unicode_literals
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# counters shown in the summary table, with how to format them
+SUMMARY_COLUMNS = [
+    ('subprocess_count', 'calls', '%d'),
+    ('subprocess_seconds', 'call time', '%.2fs'),
+    ('bytes_downloaded', 'downloaded', None),
+    ('bytes_extracted', 'extracted', None),
+    ('files_written', 'files', '%d'),
+]
+
+
+class Recorder(object):
+
+    started = None  # the time the recording started
+    totals = None  # counters over the whole run
+    actions = None  # each feature action, in the order they started
+    tracing = False  # if true, trace events are kept
+    events = None  # the trace events, when tracing
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # context manager factories entered around every action, with its entry
+        self.action_hooks = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.totals = {}
+            self.actions = []
+            self.tracing = False
+            self.events = []
+            self._thread_names = {}
+
+    def start_tracing(self):
+        """ keep trace events from now on """
+        self.tracing = True
+
+    @contextmanager
+    def action(self, namespace, feature, phase):
+        """ time a feature action, and record the counters of the current thread against it """
+        entry = {'namespace': namespace, 'feature': feature, 'phase': phase,
+                 'start': time.time(), 'wall_time': None, 'counters': {}}
+        with self._lock:
+            self.actions.append(entry)
+        previous = getattr(self._local, 'action', None)
+        self._local.action = entry
+        hooks = [hook(entry) for hook in list(self.action_hooks)]
+        for hook in hooks:
+            hook.__enter__()
+        try:
+            yield entry
+        finally:
+            for hook in reversed(hooks):
+                hook.__exit__(None, None, None)
+            end = time.time()
+            entry['wall_time'] = end - entry['start']
+            self._local.action = previous
+            self._trace("%s %s" % (feature, entry['phase']), 'feature', entry['start'], end,
+                        {'namespace': namespace})
+
+    def current_action(self):
+        """ return the entry of the action running in the current thread, or None """
+        return getattr(self._local, 'action', None)
+
+    def annotate(self, **values):
+        """ set values on the action running in the current thread, such as the phase of a sync """
+        action = getattr(self._local, 'action', None)
+        if action is not None:
+            action.update(values)
+
+    def count(self, name, amount=1):
+        """ add amount to a counter """
+        action = getattr(self._local, 'action', None)
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+            if action is not None:
+                action['counters'][name] = action['counters'].get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name, label=None, **args):
+        """
+        count the runs of a block and the time spent in it, as
+        <name>_count and <name>_seconds. When tracing, the block is
+        traced as label (or name), with args.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            self.count(name + '_count')
+            self.count(name + '_seconds', end - start)
+            self._trace(label or name, name, start, end, args)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """ trace a block, if tracing """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._trace(name, category, start, time.time(), args)
+
+    def trace(self):
+        """ return the trace events, with the names of their threads, in the Chrome Trace Event format """
+        with self._lock:
+            metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                        for (pid, tid), name in self._thread_names.items()]
+            return {'traceEvents': metadata + list(self.events), 'displayTimeUnit': 'ms'}
+
+    def report(self, **info):
+        """ return the report of the run as a dictionary, including any info passed """
+        with self._lock:
+            report = dict(info)
+            report['started'] = self.started
+            report['wall_time'] = time.time() - self.started
+            report['totals'] = dict(self.totals)
+            report['actions'] = [dict(entry,
+                                      start=entry['start'] - self.started,
+                                      counters=dict(entry['counters']))
+                                 for entry in self.actions]
+        return report
+
+    def _trace(self, name, category, start, end, args):
+        if not self.tracing:
+            return
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': int((start - self.started) * 1000000),
+                 'dur': int((end - start) * 1000000),
+                 'pid': os.getpid(), 'tid': thread.ident,
+                 'args': args}
+        with self._lock:
+            self.events.append(event)
+            self._thread_names[(event['pid'], event['tid'])] = thread.name
+
+    def summary(self):
+        """ return a table of the time and counters of each action, for people to read """
+        report = self.report()
+        rows = [["feature", "phase", "time"] + [title for _, title, _ in SUMMARY_COLUMNS]]
+        for entry in report['actions']:
+            if entry['wall_time'] is None or (entry['wall_time'] < 0.01 and not entry['counters']):
+                continue
+            rows.append([entry['feature'], entry['phase'], "%.2fs" % entry['wall_time']] +
+                        _summary_counters(entry['counters']))
+        rows.append(["total", "", "%.2fs" % report['wall_time']] + _summary_counters(report['totals']))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join("  ".join(value.ljust(width) if i < 2 else value.rjust(width)
+                                   for i, (value, width) in enumerate(zip(row, widths)))
+                         for row in rows)
+
+
+def _summary_counters(counters):
+    values = []
+    for name, _, value_format in SUMMARY_COLUMNS:
+        value = counters.get(name, 0)
+        values.append(_format_bytes(value) if value_format is None else value_format % value)
+    return values
+
+
+def _format_bytes(amount):
+    for unit in ('B', 'KB', 'MB'):
+        if amount < 1024:
+            return "%d%s" % (amount, unit) if unit == 'B' else "%.1f%s" % (amount, unit)
+        amount /= 1024.0
+    return "%.1fGB" % amount
+
+
+# the recorder of the run
+recorder = Recorder()
+action = recorder.action
+annotate = recorder.annotate
+count = recorder.count
+timer = recorder.timer
+span = recorder.span
+reset = recorder.reset
+start_tracing = recorder.start_tracing
+summary = recorder.summary
+
+
+def traced(category, name=None):
+    """ decorator to trace every call of a function as a span """
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            with recorder.span(name or f.__name__, category):
+                return f(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def write_report(path, **info):
+    """ write the report of the run to path as json """
+    with open(path, 'w+') as fh:
+        fh.write(json.dumps(recorder.report(**info), indent=2, sort_keys=True))
+
+
+def write_trace(path):
+    """ write the trace of the run to path as json """
+    with open(path, 'w+') as fh:
+        fh.write(json.dumps(recorder.trace()))
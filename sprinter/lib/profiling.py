@@ -0,0 +1,118 @@
+"""
+profiling.py profiles each feature action of a run, so formula authors
+can find the hot spots of their install and update code.
+
+Each action is profiled with cProfile, and optionally with tracemalloc
+snapshots taken before and after it (tracemalloc needs python 3.4 or
+later). Snapshots cover every thread, so when environments are updated
+in parallel the allocations of an action include those of the actions
+running alongside it.
+
+A dump is written per action to a directory: a .prof file that pstats
+and snakeviz can read, and a .memory.txt file with the lines that
+allocated the most. summary() returns the hot spots of the whole run.
+"""
+from __future__ import unicode_literals
+import cProfile
+import io
+import itertools
+import logging
+import os
+import pstats
+import re
+from contextlib import contextmanager
+
+from six import StringIO
+
+from . import instrumentation
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+logger = logging.getLogger(__name__)
+
+# the number of functions and lines shown in summaries
+TOP = 20
+
+
+class Profiler(object):
+
+    directory = None  # the directory dumps are written to
+    cpu = True  # profile with cProfile
+    memory = False  # compare tracemalloc snapshots
+    top = TOP
+
+    def __init__(self, directory, cpu=True, memory=False, top=TOP):
+        self.directory = directory
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+        if memory and tracemalloc is None:
+            logger.warn("Memory profiling requires tracemalloc (python 3.4 or later), skipping it...")
+            self.memory = False
+        self.dumps = []  # paths of the cProfile dumps
+        self.allocations = []  # (action, bytes allocated) of each action
+        self._numbers = itertools.count()
+
+    def start(self):
+        """ profile every feature action from now on """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if self.memory:
+            tracemalloc.start()
+        instrumentation.recorder.action_hooks.append(self.profile)
+
+    def stop(self):
+        instrumentation.recorder.action_hooks.remove(self.profile)
+        if self.memory:
+            tracemalloc.stop()
+
+    @contextmanager
+    def profile(self, entry):
+        """ profile an instrumentation action, writing its dumps when it's done """
+        profile = cProfile.Profile() if self.cpu else None
+        before = tracemalloc.take_snapshot() if self.memory else None
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            name = self._dump_name(entry)
+            if profile is not None:
+                path = os.path.join(self.directory, name + ".prof")
+                profile.dump_stats(path)
+                self.dumps.append(path)
+            if before is not None:
+                self._write_allocations(name, tracemalloc.take_snapshot().compare_to(before, 'lineno'))
+
+    def summary(self):
+        """ return the functions taking the most time, and the actions allocating the most memory """
+        sections = []
+        if self.dumps:
+            stream = StringIO()
+            stats = pstats.Stats(self.dumps[0], stream=stream)
+            for path in self.dumps[1:]:
+                stats.add(path)
+            stats.sort_stats('cumulative').print_stats(self.top)
+            sections.append("Top %s functions by cumulative time:\n%s" % (self.top, stream.getvalue().strip()))
+        if self.allocations:
+            lines = ["Memory allocated by each action:"]
+            for name, size in sorted(self.allocations, key=lambda a: -a[1])[:self.top]:
+                lines.append("  %10.1fKB  %s" % (size / 1024.0, name))
+            sections.append("\n".join(lines))
+        sections.append("Profiles were written to %s" % self.directory)
+        return "\n\n".join(sections)
+
+    def _write_allocations(self, name, differences):
+        self.allocations.append((name, sum(d.size_diff for d in differences)))
+        with io.open(os.path.join(self.directory, name + ".memory.txt"), 'w', encoding='utf-8') as fh:
+            for difference in differences[:self.top]:
+                fh.write("%s\n" % difference)
+
+    def _dump_name(self, entry):
+        name = "%03d-%s.%s.%s" % (next(self._numbers), entry['namespace'], entry['feature'], entry['phase'])
+        return re.sub("[^A-Za-z0-9_.-]", "_", name)
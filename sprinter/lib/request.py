@@ -1,12 +1,26 @@
 from __future__ import unicode_literals
 
+import hashlib
+import json
 import logging
+import os
 import requests
 import io
+import tempfile
+import threading
 from clint.textui import progress
+from six.moves.urllib.parse import urlsplit, urlunsplit
+
+from . import instrumentation
 
 logger = logging.getLogger()
 
+# connections kept open per host by the shared session
+POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+
 
 class BadCredentialsException(Exception):
     """ Returned if the credentials are incorrect """
@@ -16,12 +30,28 @@ class CertificateException(Exception):
     """ Returned if the certificates are incorrect """
 
 
+class ChecksumException(Exception):
+    """ Returned if a download does not match its expected checksum """
+
+
+def url_label(url):
+    """
+    return the url without its userinfo, query or fragment, to label a
+    request with in reports and traces, as those may hold credentials
+    """
+    parts = urlsplit(url or '')
+    netloc = parts.netloc.rpartition('@')[2]
+    return urlunsplit((parts.scheme, netloc, parts.path, '', ''))
+
+
 def authenticated_get(username, password, url, verify=True):
     """
     Perform an authorized query to the url, and return the result
     """
     try:
-        response = requests.get(url, auth=(username, password), verify=verify)
+        with instrumentation.timer('http_request', label="GET %s" % url_label(url)):
+            response = requests.get(url, auth=(username, password), verify=verify)
+        instrumentation.count('bytes_downloaded', len(response.content))
         if response.status_code == 401:
             raise BadCredentialsException(
                 "Unable to authenticate user %s to %s with password provided!"
@@ -31,22 +61,179 @@ def authenticated_get(username, password, url, verify=True):
     return response.content
 
 
+def cached_get(url, cache_dir, username=None, password=None, verify=True):
+    """
+    Return the content at the url, cached in cache_dir. A cached copy
+    is revalidated with its ETag or Last-Modified date, and only
+    downloaded again if it has changed. The cached copy is also used
+    if the url can not be reached. Content fetched with credentials is
+    only readable by the user.
+    """
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    content_path = os.path.join(cache_dir, name)
+    metadata_path = content_path + ".json"
+    metadata = {}
+    if os.path.exists(content_path) and os.path.exists(metadata_path):
+        metadata = _read_metadata(metadata_path)
+    auth = (username, password) if username is not None else None
+    try:
+        response = cleaned_request('get', url, auth=auth, headers=_validator_headers(metadata),
+                                   verify=verify)
+    except requests.exceptions.SSLError:
+        raise CertificateException("Unable to verify certificate at %s!" % url)
+    except requests.exceptions.RequestException:
+        if not metadata:
+            raise
+        logger.warn("Unable to reach %s, using the cached copy..." % url)
+        response = None
+    if response is not None and response.status_code == 401:
+        raise BadCredentialsException(
+            "Unable to authenticate user %s to %s with password provided!"
+            % (username, url))
+    if response is None or response.status_code == 304:
+        with open(content_path, 'rb') as fh:
+            return fh.read()
+    response.raise_for_status()
+    instrumentation.count('bytes_downloaded', len(response.content))
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    mode = 0o600 if auth else 0o666
+    _write_cache_file(content_path, response.content, mode)
+    _write_cache_file(metadata_path, _validators(response), mode)
+    return response.content
+
+
+def _read_metadata(metadata_path):
+    try:
+        with open(metadata_path) as fh:
+            return json.load(fh)
+    except ValueError:
+        return {}
+
+
+def _validator_headers(metadata):
+    """ return the headers revalidating a cached response with its metadata """
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    return headers
+
+
+def _validators(response):
+    """ return the metadata to revalidate a cached response with, as json """
+    return json.dumps({'etag': response.headers.get('etag'),
+                       'last_modified': response.headers.get('last-modified')}).encode('utf-8')
+
+
+def _write_cache_file(path, content, mode):
+    """ write content to path, creating it with mode (less the umask) """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    # the mode only applies to new files
+    if mode != 0o666:
+        os.fchmod(fd, mode)
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(content)
+
+
 def cleaned_request(request_type, *args, **kwargs):
     """ Perform a cleaned requests request """
-    s = requests.Session()
-    # this removes netrc checking
-    s.trust_env = False
-    return s.request(request_type, *args, **kwargs)
+    url = args[0] if args else kwargs.get('url')
+    with instrumentation.timer('http_request', label="%s %s" % (request_type.upper(), url_label(url))):
+        return session().request(request_type, *args, **kwargs)
+
+
+def session():
+    """
+    Return the session every cleaned request is made with, so
+    connections are reused across requests (and threads).
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            # this removes netrc checking
+            _session.trust_env = False
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
 
 
 def download_to_bytesio(url):
     """ Return a bytesio object with a download bar """
+    return _read_response(url, cleaned_request('get', url, stream=True))
+
+
+def _read_response(url, r):
+    """ read a streamed response into a bytesio object, with a download bar """
     logger.info("Downloading url: {0}".format(url))
-    r = cleaned_request('get', url, stream=True)
     stream = io.BytesIO()
     total_length = int(r.headers.get('content-length'))
-    for chunk in progress.bar(r.iter_content(chunk_size=1024), expected_size=(total_length/1024) + 1):
-        if chunk:
-            stream.write(chunk)
+    with instrumentation.timer('download', label=url_label(url)):
+        for chunk in progress.bar(r.iter_content(chunk_size=1024), expected_size=(total_length/1024) + 1):
+            if chunk:
+                stream.write(chunk)
+    instrumentation.count('bytes_downloaded', stream.tell())
     stream.seek(0)
     return stream
+
+
+def download_to_cache(url, cache_dir, checksum=None):
+    """
+    Return the path to a cached download of the url, downloading it
+    into cache_dir first if it is not there yet. If a checksum
+    (sha256:<hex>) is passed, the download is validated against it.
+    Otherwise, a cached download is revalidated with its ETag or
+    Last-Modified date like cached_get, and is also used if the url
+    can not be reached.
+    """
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + "-" + os.path.basename(url)
+    path = os.path.join(cache_dir, name)
+    metadata_path = path + ".json"
+    cached = os.path.exists(path)
+    if cached and checksum is not None:
+        if file_checksum(path) == checksum:
+            logger.debug("Using cached download of {0}".format(url))
+            return path
+        cached = False
+    metadata = {}
+    if cached and os.path.exists(metadata_path):
+        metadata = _read_metadata(metadata_path)
+    try:
+        response = cleaned_request('get', url, stream=True, headers=_validator_headers(metadata))
+    except requests.exceptions.RequestException:
+        if not cached:
+            raise
+        logger.warn("Unable to reach %s, using the cached download..." % url)
+        return path
+    if cached and response.status_code == 304:
+        logger.debug("Using cached download of {0}".format(url))
+        return path
+    response.raise_for_status()
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    fd, temp_path = tempfile.mkstemp(prefix="." + name, dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(_read_response(url, response).getvalue())
+        actual_checksum = file_checksum(temp_path)
+        if checksum is not None and actual_checksum != checksum:
+            raise ChecksumException("Checksum of {0} is {1}, expected {2}!".format(
+                url, actual_checksum, checksum))
+        os.rename(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    _write_cache_file(metadata_path, _validators(response), 0o666)
+    return path
+
+
+def file_checksum(path):
+    """ Return the sha256 checksum of a file, as sha256:<hex> """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return "sha256:" + sha.hexdigest()
@@ -0,0 +1,133 @@
+"""
+templating.py compiles template sources into literal and placeholder
+segments once, so rendering is a single join over the segments.
+
+Two placeholder syntaxes are supported:
+
+* braces: python's str.format syntax. {key} is replaced, {{ and }}
+  are literal braces. Unknown keys render as an empty string.
+* dollar: only ${key} is replaced, and $$ is a literal $. Every other
+  brace is left alone, so sources full of braces (json, xml, shell)
+  need no escaping.
+"""
+from __future__ import unicode_literals
+import hashlib
+import re
+import string
+
+SYNTAXES = ['braces', 'dollar']
+MAX_CACHED_TEMPLATES = 64
+
+DOLLAR_REGEX = re.compile(r"\$(?:(\$)|\{([A-Za-z_][A-Za-z0-9_]*)\})")
+
+_compiled = {}
+
+
+class TemplateException(Exception):
+    """ Raised when a template can not be compiled or rendered """
+
+
+class CompiledTemplate(object):
+
+    segments = None  # a list of literal strings and Placeholders
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    def render(self, replacements):
+        """ render the template, with the values of replacements for the placeholders """
+        return "".join([segment if not isinstance(segment, Placeholder)
+                        else segment.render(replacements)
+                        for segment in self.segments])
+
+
+class Placeholder(object):
+
+    def __init__(self, field_name, format_spec="", conversion=None):
+        self.field_name = field_name
+        self.format_spec = format_spec
+        self.conversion = conversion
+        self.simple = re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", field_name) is not None
+
+    def render(self, replacements):
+        if self.simple:
+            value = replacements.get(self.field_name, "")
+        else:
+            formatter = string.Formatter()
+            value = formatter.get_field(self.field_name, (), _Defaults(replacements))[0]
+        if self.conversion == 'r':
+            value = repr(value)
+        elif self.conversion == 's':
+            value = "%s" % value
+        if self.format_spec:
+            return format(value, self.format_spec)
+        return "%s" % value
+
+
+class _Defaults(dict):
+    """ replacements, rendering unknown keys as an empty string """
+
+    def __missing__(self, key):
+        return ""
+
+
+def compile_template(source, syntax='braces'):
+    """
+    return the compiled template for the source. Compiled templates are
+    cached by the hash of their source.
+    """
+    if syntax not in SYNTAXES:
+        raise TemplateException("Unknown template syntax %s! Valid syntaxes are %s" %
+                                (syntax, ", ".join(SYNTAXES)))
+    key = (syntax, hashlib.sha1(source.encode('utf-8')).hexdigest())
+    if key not in _compiled:
+        if len(_compiled) >= MAX_CACHED_TEMPLATES:
+            _compiled.clear()
+        segments = _parse_dollar(source) if syntax == 'dollar' else _parse_braces(source)
+        _compiled[key] = CompiledTemplate(_merge_literals(segments))
+    return _compiled[key]
+
+
+def _parse_braces(source):
+    segments = []
+    try:
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(source):
+            segments.append(literal)
+            if field_name is None:
+                continue
+            if field_name == "" or field_name[0].isdigit():
+                raise TemplateException("Positional placeholders are not supported!")
+            if "{" in (format_spec or ""):
+                raise TemplateException("Nested placeholders are not supported!")
+            segments.append(Placeholder(field_name, format_spec or "", conversion))
+    except ValueError as e:
+        raise TemplateException(str(e))
+    return segments
+
+
+def _parse_dollar(source):
+    segments = []
+    position = 0
+    for match in DOLLAR_REGEX.finditer(source):
+        segments.append(source[position:match.start()])
+        if match.group(1):
+            segments.append("$")
+        else:
+            segments.append(Placeholder(match.group(2)))
+        position = match.end()
+    segments.append(source[position:])
+    return segments
+
+
+def _merge_literals(segments):
+    """ join adjacent literals, and drop empty ones """
+    merged = []
+    for segment in segments:
+        if isinstance(segment, Placeholder):
+            merged.append(segment)
+        elif segment:
+            if merged and not isinstance(merged[-1], Placeholder):
+                merged[-1] += segment
+            else:
+                merged.append(segment)
+    return merged
@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from mock import patch
+from nose.tools import eq_, ok_
+from sprinter.lib import instrumentation
+from sprinter.lib.debuglog import DebugLog
+
+
+class TestDebugLog(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.temp_dir, "logs")
+        self.logger = logging.getLogger('sprinter.test_debuglog')
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+
+    def teardown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        shutil.rmtree(self.temp_dir)
+
+    def _debug_log(self, **kwargs):
+        debug_log = DebugLog(**kwargs)
+        self.logger.addHandler(debug_log)
+        return debug_log
+
+    def _logged(self, path):
+        with open(path) as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_records(self):
+        """ records should have the feature and phase they were logged in """
+        debug_log = self._debug_log(log_dir=self.log_dir)
+        self.logger.info("outside")
+        with instrumentation.action('namespace', 'feature', 'sync'):
+            instrumentation.annotate(phase='install')
+            self.logger.debug("inside %s", "an action")
+        records = debug_log.records()
+        eq_([r['message'] for r in records], ["outside", "inside an action"])
+        eq_(records[0]['feature'], None)
+        eq_((records[1]['feature'], records[1]['phase'], records[1]['level']),
+            ('feature', 'install', 'DEBUG'))
+        ok_(not os.path.exists(self.log_dir), "nothing should be written while the records fit")
+
+    def test_ring_spills(self):
+        """ records that don't fit should spill to the run log, and flush should write the rest """
+        debug_log = self._debug_log(log_dir=self.log_dir, ring_bytes=1000)
+        for i in range(20):
+            self.logger.info("line %s" % i)
+        ok_(len(debug_log.records()) < 20)
+        spilled = self._logged(debug_log.path)
+        eq_(spilled[0]['message'], "line 0")
+        debug_log.flush()
+        debug_log.flush()
+        eq_([r['message'] for r in self._logged(debug_log.path)], ["line %s" % i for i in range(20)])
+
+    def test_without_log_dir(self):
+        """ records that don't fit should be dropped, if there is no log directory """
+        debug_log = self._debug_log(ring_bytes=1000)
+        for i in range(20):
+            self.logger.info("line %s" % i)
+        debug_log.flush()
+        ok_(debug_log.dropped > 0)
+        eq_(debug_log.path, None)
+        eq_(debug_log.records()[-1]['message'], "line 19")
+
+    def test_exceptions(self):
+        """ exceptions should be logged with their traceback """
+        debug_log = self._debug_log()
+        try:
+            raise ValueError("oops")
+        except ValueError:
+            self.logger.debug("", exc_info=True)
+        ok_("ValueError: oops" in debug_log.records()[0]['exception'])
+        ok_("ValueError: oops" in debug_log.format_records())
+
+    def test_old_logs_are_removed(self):
+        """ only the newest run logs should be kept """
+        os.makedirs(self.log_dir)
+        for name in ["sprinter-20200101-000000-1.jsonl", "sprinter-20200102-000000-1.jsonl",
+                     "sprinter-20200102-000000-1.jsonl.1"]:
+            open(os.path.join(self.log_dir, name), 'w').close()
+        debug_log = self._debug_log(log_dir=self.log_dir, keep_logs=2)
+        self.logger.info("a line")
+        debug_log.flush()
+        eq_(sorted(os.listdir(self.log_dir)),
+            sorted(["sprinter-20200102-000000-1.jsonl", "sprinter-20200102-000000-1.jsonl.1",
+                    os.path.basename(debug_log.path)]))
+
+    def test_log_is_rotated(self):
+        """ the run log should be rotated to numbered logs once it gets too large """
+        debug_log = self._debug_log(log_dir=self.log_dir, ring_bytes=1, max_log_bytes=200, keep_rotated=3)
+        for i in range(100):
+            self.logger.info("line %s" % i)
+        debug_log.flush()
+        ok_(os.path.getsize(debug_log.path) < 400)
+        eq_(sorted(os.listdir(self.log_dir)),
+            [os.path.basename(debug_log.path) + suffix for suffix in ("", ".1", ".2", ".3")])
+        logged = (self._logged(debug_log.path + ".3") + self._logged(debug_log.path + ".2") +
+                  self._logged(debug_log.path + ".1") + self._logged(debug_log.path))
+        messages = [r['message'] for r in logged]
+        eq_(messages, ["line %s" % i for i in range(100 - len(messages), 100)])
+
+    def test_log_kept_open(self):
+        """ the run log should be opened once, and closed with the handler """
+        debug_log = self._debug_log(log_dir=self.log_dir, ring_bytes=1)
+        with patch('io.open', side_effect=io.open) as open_log:
+            for i in range(20):
+                self.logger.info("line %s" % i)
+        eq_(open_log.call_count, 1)
+        debug_log.close()
+        eq_(len(self._logged(debug_log.path)), 19)
@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+import json
+import os
+import shutil
+import tempfile
+import threading
+from nose.tools import eq_, ok_
+from sprinter import lib
+from sprinter.lib import instrumentation
+from sprinter.lib.instrumentation import Recorder
+
+
+class TestInstrumentation(object):
+
+    def setup(self):
+        self.recorder = Recorder()
+
+    def test_counters_are_recorded_against_the_action(self):
+        """ counters should count in the totals, and in the action of the current thread """
+        self.recorder.count('files_written')
+        with self.recorder.action('namespace', 'feature', 'sync'):
+            self.recorder.annotate(phase='install')
+            self.recorder.count('files_written', 2)
+            thread = threading.Thread(target=self.recorder.count, args=('files_written',))
+            thread.start()
+            thread.join()
+        report = self.recorder.report(command='install')
+        eq_(report['command'], 'install')
+        eq_(report['totals'], {'files_written': 4})
+        eq_(len(report['actions']), 1)
+        eq_(report['actions'][0]['phase'], 'install')
+        eq_(report['actions'][0]['counters'], {'files_written': 2})
+        ok_(report['actions'][0]['wall_time'] >= 0)
+
+    def test_summary(self):
+        """ the summary should have a row for each action that did work, and the totals """
+        with self.recorder.action('namespace', 'idle', 'validate'):
+            pass
+        with self.recorder.action('namespace', 'feature', 'install'):
+            self.recorder.count('bytes_downloaded', 2048)
+        lines = self.recorder.summary().splitlines()
+        eq_(len(lines), 3)
+        ok_(lines[1].startswith("feature  install"))
+        ok_("2.0KB" in lines[1])
+        ok_(lines[2].startswith("total"))
+
+    def test_call_is_instrumented(self):
+        """ lib.call should count subprocesses, and a report should be written as json """
+        instrumentation.reset()
+        lib.call("echo hello")
+        temp_dir = tempfile.mkdtemp()
+        try:
+            report_path = os.path.join(temp_dir, "report.json")
+            instrumentation.write_report(report_path, command='update')
+            with open(report_path) as fh:
+                report = json.load(fh)
+            eq_(report['totals']['subprocess_count'], 1)
+            eq_(report['command'], 'update')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_trace(self):
+        """ when tracing, actions, timers and spans should be kept as chrome trace events """
+        self.recorder.start_tracing()
+        with self.recorder.action('namespace', 'feature', 'install'):
+            with self.recorder.timer('subprocess', label='echo hello'):
+                pass
+        thread = threading.Thread(target=self._span, name="worker")
+        thread.start()
+        thread.join()
+        trace = self.recorder.trace()
+        events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        eq_([(e['cat'], e['name']) for e in events],
+            [('subprocess', 'echo hello'), ('feature', 'feature install'), ('download', 'url')])
+        ok_(events[0]['ts'] >= events[1]['ts'])
+        ok_(events[2]['tid'] != events[0]['tid'])
+        thread_names = [e['args']['name'] for e in trace['traceEvents'] if e['ph'] == 'M']
+        ok_("worker" in thread_names)
+
+    def test_no_trace_by_default(self):
+        """ trace events should only be kept when tracing """
+        with self.recorder.span('span', 'test'):
+            pass
+        eq_(self.recorder.trace()['traceEvents'], [])
+
+    def _span(self):
+        with self.recorder.span('url', 'download'):
+            pass
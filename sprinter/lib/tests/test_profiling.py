@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+from nose.tools import eq_, ok_
+from sprinter.lib import instrumentation, profiling
+from sprinter.lib.profiling import Profiler
+
+
+class TestProfiling(object):
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.profile_dir = os.path.join(self.temp_dir, "profile")
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_each_action_is_profiled(self):
+        """ each action should be dumped, and the summary should show the functions it ran """
+        profiler = Profiler(self.profile_dir)
+        profiler.start()
+        try:
+            with instrumentation.action('namespace', 'my/feature', 'sync'):
+                instrumentation.annotate(phase='install')
+                sorted(range(1000), key=lambda x: -x)
+        finally:
+            profiler.stop()
+        eq_(os.listdir(self.profile_dir), ["000-namespace.my_feature.install.prof"])
+        summary = profiler.summary()
+        ok_("cumulative" in summary)
+        ok_("sorted" in summary)
+        ok_(self.profile_dir in summary)
+
+    def test_stop_removes_the_hook(self):
+        """ actions after the profiler is stopped should not be profiled """
+        profiler = Profiler(self.profile_dir)
+        profiler.start()
+        profiler.stop()
+        with instrumentation.action('namespace', 'feature', 'sync'):
+            pass
+        eq_(os.listdir(self.profile_dir), [])
+
+    def test_memory(self):
+        """ with memory profiling, the allocations of each action should be dumped """
+        profiler = Profiler(self.profile_dir, cpu=False, memory=True)
+        profiler.start()
+        try:
+            with instrumentation.action('namespace', 'feature', 'install'):
+                data = [str(i) for i in range(1000)]
+        finally:
+            profiler.stop()
+        if profiling.tracemalloc is None:
+            ok_(not profiler.memory, "memory profiling should be skipped without tracemalloc")
+            eq_(os.listdir(self.profile_dir), [])
+        else:
+            eq_(os.listdir(self.profile_dir), ["000-namespace.feature.install.memory.txt"])
+            ok_("Memory allocated by each action" in profiler.summary())
+        ok_(data)
@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+from nose.tools import eq_, ok_, raises
+from sprinter.lib.templating import compile_template, TemplateException
+
+
+class TestTemplating(object):
+
+    def test_braces(self):
+        """ braces placeholders should be replaced, and escaped braces kept """
+        template = compile_template("{{a}} {a} {b:>3} {missing}!")
+        eq_(template.render({'a': 'x', 'b': 'y'}), "{a} x   y !")
+
+    def test_dollar(self):
+        """ dollar placeholders should leave other braces alone """
+        template = compile_template('{"a": "${a}", "cost": "$$5", "b": "{b}"}', syntax='dollar')
+        eq_(template.render({'a': 'x'}), '{"a": "x", "cost": "$5", "b": "{b}"}')
+
+    def test_compiled_once(self):
+        """ the same source should only be compiled once """
+        ok_(compile_template("{a}") is compile_template("{a}"))
+        ok_(compile_template("{a}") is not compile_template("{a}", syntax='dollar'))
+
+    def test_segments(self):
+        """ adjacent literals should be merged into one segment """
+        eq_(len(compile_template("a {{ b }} {c} d").segments), 3)
+
+    @raises(TemplateException)
+    def test_unbalanced_braces(self):
+        """ unbalanced braces should fail to compile """
+        compile_template("{a")
+
+    @raises(TemplateException)
+    def test_positional(self):
+        """ positional placeholders should fail to compile """
+        compile_template("{}")
@@ -12,8 +12,12 @@ import logging
 import os
 import re
 import shutil
+import threading
 from ..compat import _unicode
 
+# injections of several environments may be committed at once
+_commit_lock = threading.Lock()
+
 
 class Injections(object):
     """
@@ -38,6 +42,7 @@ class Injections(object):
         self.logger = logging.getLogger(logger)
         self.inject_dict = {}
         self.clear_set = set()
+        self._committed = {}  # filename: the content last written to it
 
     def inject(self, filename, content):
         """ add the injection content to the dictionary """
@@ -63,13 +68,29 @@ class Injections(object):
         self.logger.debug(self.inject_dict)
         self.logger.debug("Clear list is:")
         self.logger.debug(self.clear_set)
-        for filename, content in self.inject_dict.items():
-            content = _unicode(content)
-            self.logger.debug("Injecting values into %s..." % filename)
-            self.destructive_inject(filename, content)
-        for filename in self.clear_set:
-            self.logger.debug("Clearing injection from %s..." % filename)
-            self.destructive_clear(filename)
+        with _commit_lock:
+            for filename in list(self.inject_dict):
+                self._commit_file(filename)
+            for filename in self.clear_set:
+                self.logger.debug("Clearing injection from %s..." % filename)
+                self.destructive_clear(filename)
+                self._committed.pop(filename, None)
+
+    def commit_file(self, filename):
+        """
+        commit the injection of a single file now, leaving the rest for
+        commit. commit doesn't write the file again unless more is injected.
+        """
+        with _commit_lock:
+            self._commit_file(filename)
+
+    def _commit_file(self, filename):
+        content = _unicode(self.inject_dict.get(filename, ""))
+        if self._committed.get(filename) == content:
+            return
+        self.logger.debug("Injecting values into %s..." % filename)
+        self.destructive_inject(filename, content)
+        self._committed[filename] = content
 
     def injected(self, filename):
         """ Return true if the file has already been injected before. """
@@ -119,12 +140,14 @@ class Injections(object):
 
     def in_noninjected_file(self, file_path, content):
         """ Checks if a string exists in the file, sans the injected """
-        if os.path.exists(file_path):
-            file_content = codecs.open(file_path, encoding="utf-8").read()
-            file_content = self.wrapper_match.sub(u"", file_content)
-        else:
-            file_content = ""
-        return file_content.find(content) != -1
+        return self.noninjected_content(file_path).find(content) != -1
+
+    def noninjected_content(self, file_path):
+        """ Return the content of the file, sans the injected """
+        if not os.path.exists(file_path):
+            return ""
+        with codecs.open(file_path, encoding="utf-8") as fh:
+            return self.wrapper_match.sub(u"", fh.read())
 
     def inject_content(self, content, inject_string):
         """
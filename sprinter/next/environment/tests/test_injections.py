@@ -159,3 +159,21 @@ def test_clear_nonexistent_file(tmpdir):
     i.clear(new_file)
     i.commit()
     assert not os.path.exists(new_file)
+
+
+def test_commit_file(tmpdir, injections):
+    """ commit_file should only write its file, and commit should not write it again """
+    first = os.path.join(tmpdir.strpath, "first")
+    second = os.path.join(tmpdir.strpath, "second")
+    for path in (first, second):
+        with open(path, "w") as fh:
+            fh.write(PERMANENT_STRING)
+    injections.inject(first, TEST_INJECTION)
+    injections.inject(second, TEST_INJECTION)
+    injections.commit_file(first)
+    assert TEST_INJECTION in open(first).read()
+    assert TEST_INJECTION not in open(second).read()
+    os.unlink(first + ".sprinter.bak")
+    injections.commit()
+    assert TEST_INJECTION in open(second).read()
+    assert not os.path.exists(first + ".sprinter.bak"), "first should not have been written again"
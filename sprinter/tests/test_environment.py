@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 import os
 import shutil
+import threading
 import tempfile
 from mock import Mock, call, patch
 from nose import tools
@@ -8,9 +9,11 @@ from nose.tools import eq_, raises, ok_
 from sprinter.testtools import (MockEnvironment,
                                 create_mock_formulabase)
 from sprinter.exceptions import SprinterException, FormulaException
-from sprinter.environment import Environment
+from sprinter.environment import Environment, update_namespaces
 from sprinter.core.templates import source_template
 from sprinter.core.globals import create_default_config
+from sprinter.core.directory import Directory
+from sprinter.core.journal import Journal
 
 source_config = """
 [config]
@@ -165,6 +168,111 @@ class TestEnvironment(object):
                             environment.global_injections.inject_dict[full_profile_path])
             assert env_injected
 
+    def test_activation_bundle_injection(self):
+        """ If activation_bundle is set, shells should source the global bundle instead of the namespace """
+        global_config = create_default_config()
+        global_config.set('global', 'activation_bundle', 'true')
+        with MockEnvironment(test_source, test_target, global_config=global_config) as environment:
+            environment.install()
+            full_rc_path = os.path.expanduser(os.path.join("~", ".bashrc"))
+            ok_(full_rc_path not in environment.injections.inject_dict)
+            ok_(full_rc_path in environment.injections.clear_set)
+            ok_(os.path.join(environment.global_path, "activate_rc.sh") in
+                environment.global_injections.inject_dict[full_rc_path])
+            ok_(os.path.exists(os.path.join(environment.global_path, "activate_rc.sh")))
+
+    def test_failed_install_is_resumed(self):
+        """ A failed install should keep completed features, and resume from the failed one """
+        with patch('sprinter.formula.base.FormulaBase.install', autospec=True) as install:
+            install.side_effect = _install_failing_two
+            with MockEnvironment(target_config=test_journal_target) as environment:
+                try:
+                    environment.install()
+                except SprinterException:
+                    pass
+                ok_(os.path.exists(environment.directory.root_dir))
+                ok_(not os.path.exists(environment.directory.install_directory('two')))
+                journal = Journal(environment.directory.root_dir)
+                ok_(journal.is_complete('one'))
+                ok_(not journal.is_complete('two'))
+
+                install.side_effect = _install_env
+                environment.features = None
+                environment._error_dict.clear()
+                environment.error_occured = False
+                environment.directory = Directory(environment.directory.root_dir,
+                                                  shell_util_path=environment.shell_util_path)
+                environment.install()
+                eq_([c[0][0].feature_name for c in install.call_args_list], ['one', 'two', 'two'])
+                with open(os.path.join(environment.directory.root_dir, '.env')) as fh:
+                    env = fh.read()
+                ok_('export ONE=1' in env)
+                ok_('export TWO=2' in env)
+                ok_(not journal.exists())
+
+    def test_failed_install_clean(self):
+        """ With clean set, a failed install should be removed """
+        with patch('sprinter.formula.base.FormulaBase.install', autospec=True) as install:
+            install.side_effect = _install_failing_two
+            with MockEnvironment(target_config=test_journal_target) as environment:
+                environment.clean = True
+                try:
+                    environment.install()
+                except SprinterException:
+                    pass
+                ok_(not os.path.exists(environment.directory.root_dir))
+
+    def test_update_namespaces(self):
+        """ Several namespaces should update together, and report their errors """
+        root = tempfile.mkdtemp()
+        try:
+            target_path = os.path.join(root, "target.cfg")
+            with open(target_path, "w+") as fh:
+                fh.write(test_target)
+            for namespace, source in (("one", target_path), ("two", os.path.join(root, "missing.cfg"))):
+                os.makedirs(os.path.join(root, namespace))
+                with open(os.path.join(root, namespace, "manifest.cfg"), "w+") as fh:
+                    fh.write("[config]\nsource = %s\n" % source)
+            environment = Environment(root=root, global_config=create_default_config())
+            with patch('sprinter.environment.Pip'):
+                with patch('sprinter.next.environment.injections.Injections.commit'):
+                    results = update_namespaces(["one", "two"], environment, jobs=2)
+            eq_([namespace for namespace, error in results], ["one", "two"])
+            eq_(results[0][1], None)
+            ok_("missing.cfg" in results[1][1])
+            ok_(os.path.exists(os.path.join(root, "one", ".rc")))
+        finally:
+            shutil.rmtree(root)
+
+    def test_update_namespaces_prompts_one_at_a_time(self):
+        """ Namespaces that need inputs should be prompted for before they sync, on one thread """
+        root = tempfile.mkdtemp()
+        prompts = []
+        path = os.environ['PATH']
+
+        def prompt(prompt_string, *args, **kwargs):
+            prompts.append((prompt_string, threading.current_thread()))
+            return "value"
+        try:
+            for namespace in ("one", "two"):
+                target_path = os.path.join(root, "%s.cfg" % namespace)
+                with open(target_path, "w+") as fh:
+                    fh.write(test_input_needed_target.format(namespace))
+                os.makedirs(os.path.join(root, namespace))
+                with open(os.path.join(root, namespace, "manifest.cfg"), "w+") as fh:
+                    fh.write("[config]\nsource = %s\n" % target_path)
+            environment = Environment(root=root, global_config=create_default_config())
+            with patch('sprinter.environment.Pip'):
+                with patch('sprinter.next.environment.injections.Injections.commit'):
+                    with patch('sprinter.lib.prompt', side_effect=prompt):
+                        results = update_namespaces(["one", "two"], environment, jobs=2)
+            eq_(results, [("one", None), ("two", None)])
+            eq_([p for p, _ in prompts], ["please enter your one_input", "please enter your two_input"])
+            ok_(all(thread is threading.current_thread() for _, thread in prompts))
+            eq_(os.environ['PATH'], path)
+        finally:
+            shutil.rmtree(root)
+
     def test_global_shell_configuration_zshell(self):
         """ The global shell should dictate what files are injected (zsh, no bash, no gui)"""
         # test zshell, no bash, no gui
@@ -210,6 +318,21 @@ env_source_rc = False
             environment.install()
             assert os.path.exists(os.path.join(environment.global_path, 'utils.sh'))
 
+    def test_write_debug_log(self):
+        """ the debug log should have the recent records, and flush them all to the run log """
+        with MockEnvironment(target_config=test_target) as environment:
+            environment.logger.debug("a debug line")
+            debug_log_path = os.path.join(environment.root, "sprinter.log")
+            environment.log_error("an error")
+            environment.write_debug_log(debug_log_path)
+            with open(debug_log_path) as fh:
+                content = fh.read()
+            assert "a debug line" in content
+            assert "an error" in content
+            log_dir = os.path.join(environment.global_path, "logs")
+            assert "The full log of the run is at %s" % log_dir in content
+            assert len(os.listdir(log_dir)) == 1
+
     def test_message_failure_bad_manifest(self):
         "On an environment with a incorrectly formatted manifest, message_failure should return None"""
         with MockEnvironment(target_config=test_target) as environment:
@@ -264,6 +387,16 @@ env_source_rc = False
                 environment.remove()
 
 
+def _install_env(formula):
+    formula.directory.add_to_env(formula.target.get('env'))
+    os.makedirs(formula.directory.install_directory(formula.feature_name))
+
+
+def _install_failing_two(formula):
+    _install_env(formula)
+    if formula.feature_name == 'two':
+        raise Exception("two failed!")
+
 missing_formula_config = """
 [missingformula]
 
@@ -284,6 +417,15 @@ namespace = testsprinter
 formula = sprinter.formula.base
 """
 
+test_input_needed_target = """
+[config]
+namespace = {0}
+inputs = {0}_input
+
+[testfeature]
+formula = sprinter.formula.base
+"""
+
 test_input_source = """
 [config]
 namespace = testsprinter
@@ -296,3 +438,16 @@ namespace = testsprinter
 my_custom_value = bar
 non_custom_value = baz
 """
+
+test_journal_target = """
+[config]
+namespace = testsprinter
+
+[one]
+formula = sprinter.formula.base
+env = export ONE=1
+
+[two]
+formula = sprinter.formula.base
+env = export TWO=2
+"""
@@ -85,6 +85,31 @@ class TestInstall(unittest.TestCase):
         parse_args(args, Environment=environment)
         environment.assert_has_calls(calls)
 
+    @patch('sprinter.install.update_namespaces')
+    @patch('sprinter.environment.Environment')
+    def test_update_several_environments(self, environment, update_namespaces):
+        """ Updating several environments should update them together """
+        update_namespaces.return_value = [('one', None), ('two', None)]
+        parse_args(['update', 'one', 'two', '-j', '2'], Environment=environment)
+        update_namespaces.assert_called_with(
+            ['one', 'two'], environment(), jobs=2, reconfigure=False,
+            username=None, password=None, verify_certificate=True)
+
+    @patch('sprinter.environment.Environment')
+    def test_static_validate(self, environment):
+        """ validate --static should validate every manifest, and exit with 1 if any are invalid """
+        valid_path = os.path.join(self.temp_dir, "valid.cfg")
+        with open(valid_path, 'w+') as fh:
+            fh.write("[feature]\nformula = sprinter.formula.base\nrc = alias f=feature\n")
+        invalid_path = os.path.join(self.temp_dir, "invalid.cfg")
+        with open(invalid_path, 'w+') as fh:
+            fh.write("[feature]\nrc = no formula\n")
+        parse_args(['validate', '--static', valid_path], Environment=environment)
+        with self.assertRaises(SystemExit) as context:
+            parse_args(['validate', '--static', valid_path, invalid_path], Environment=environment)
+        self.assertEqual(context.exception.code, 1)
+        self.assertFalse(environment().validate.called)
+
     def test_parse_domain(self):
         """ Test if domains are properly parsed """
         match_tuples = [
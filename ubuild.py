@@ -16,3 +16,10 @@ def test(build):
     return build.executables.run(
         ["py.test", "sprinter"] + build.options.args
     )[0]
+
+
+def benchmark(build):
+    main(build)
+    return build.executables.run(
+        ["python", "scripts/benchmark_shell_startup.py"] + build.options.args
+    )[0]